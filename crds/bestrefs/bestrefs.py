@@ -7,14 +7,14 @@ For more details on the several modes of operations and command line parameters
 """
 import sys
 import os
-from collections import namedtuple, OrderedDict
+from collections import namedtuple, OrderedDict, Counter
 
 # ===================================================================
 
 import crds
 from crds.core import log, config, utils, timestamp, cmdline, heavy_client
 from crds import diff, matches
-from . import table_effects, headers
+from . import table_effects, headers, checkpoint, profiling
 from crds.client import api
 
 # ===================================================================
@@ -213,6 +213,40 @@ speaking only each individual line is .json,  but this localizes any errors.
 .json format is preferred over .pkl because it is more transparent and robust
 across different versions of Python.
 
+The .sqlite3 header archive format stores headers column-wise with shared
+keyword names and values.  Loading an archive with --only-ids or
+--datasets-since reads only the selected datasets.  .pkl remains the fastest
+format for loading a complete set of headers,  so archives are only worthwhile
+for selective loads;  unfiltered archive loads fall back to a pickled copy of
+all headers stored within the archive.  Existing .pkl and .json files can be
+converted using:  python -m crds.bestrefs.header_archive
+
+...........
+Checkpoints
+...........
+
+Long running crds.bestrefs campaigns (--instruments, --all-instruments,
+--diffs-only) record their progress in a checkpoint journal every
+--checkpoint-every datasets.  If the run is interrupted,  repeating the same
+command line with --resume skips the datasets already processed and restores
+their results.  The journal is kept in the bestrefs subdirectory of the CRDS
+cache config area,  CRDS_CFGPATH,  and is deleted when the run completes.
+--checkpoint names the journal explicitly and enables checkpointing for other
+modes,  --no-checkpoint turns it off.
+
+..............
+Stage Profiles
+..............
+
+--profile-report JSON_FILE times each stage of a run:  context setup,  header
+fetch,  header conditioning,  each instrument/filekind rmap lookup,  bestrefs
+comparison,  table effects (-z),  and post processing.  Call counts, wall
+time, and CPU time per stage are logged as a table sorted by wall time and
+written to JSON_FILE.  Stage times include nested stages,  e.g. lookups nest
+within "bestrefs new".  To time each lookup,  bestrefs computes each reference
+type separately and locally,  as crds.getrecommendations() does without
+--verbose.  Profiling overhead is small enough for production runs.
+
 .........
 Verbosity
 .........
@@ -307,12 +341,22 @@ than errors as the default.
         self.active_header = None   # new or old header last processed with bestrefs
         self.drop_ids = []
 
+        self.checkpoint = None      # CheckpointJournal or None,  see init_checkpoint()
+        self.checkpoint_done = set()    # dataset ids completed by a prior run with --resume
+        self.checkpoint_pending = []    # dataset ids processed since the last checkpoint
+        self.checkpoint_header_updates = OrderedDict()  # --update-pickle updates since last checkpoint
+        self.checkpoint_error_marks = self.error_tracking_marks()   # error tracking at the last checkpoint
+        self.resumed_header_updates = OrderedDict()     # --update-pickle updates from prior run
+
+        self.profiler = profiling.StageProfiler() if self.args.profile_report else profiling.NullStageProfiler()
+
     def complex_init(self):
         """Complex init tasks run inside any --pdb environment,  also unfortunately --profile."""
 
         assert not (self.args.sync_references and self.readonly_cache), "Readonly cache,  cannot fetch references."
 
-        self.new_context, self.old_context = self.setup_contexts()
+        with self.profiler.stage("context setup"):
+            self.new_context, self.old_context = self.setup_contexts()
 
         # Support 0 to 1 mutually exclusive source modes and/or any number of pickles
         exclusive_source_modes = [self.args.files, self.args.datasets, self.args.instruments,
@@ -357,9 +401,10 @@ than errors as the default.
             datasets_since = self.args.datasets_since
 
         # headers corresponding to the new context
-        self.new_headers = self.init_headers(self.new_context, datasets_since)
+        with self.profiler.stage("header init"):
+            self.new_headers = self.init_headers(self.new_context, datasets_since)
 
-        self.compare_prior, self.old_headers, self.old_bestrefs_name = self.init_comparison(datasets_since)
+            self.compare_prior, self.old_headers, self.old_bestrefs_name = self.init_comparison(datasets_since)
 
         if not self.compare_prior:
             log.info("No comparison context or source comparison requested.")
@@ -368,9 +413,146 @@ than errors as the default.
             log.info("No file header updates requested;  dry run.  Use --update-bestrefs to update FITS headers.")
 
         self.drop_ids = [self.normalize_id(dataset) for dataset in self.args.drop_ids]
+
+        self.checkpoint = self.init_checkpoint()
         
         return True
 
+    def init_checkpoint(self):
+        """Interpret the checkpoint command line parameters,  returning a CheckpointJournal or None.
+        When --resume is specified and a journal exists,  restore the state it records.
+
+        Checkpointing is on by default for server based campaigns,  --instruments, --all-instruments,
+        and --diffs-only,  and otherwise only when --checkpoint is given explicitly.
+        """
+        if self.args.no_checkpoint:
+            return None
+        path = self.args.checkpoint
+        if path is None and (self.instruments or self.args.resume):
+            path = os.path.join(config.get_crds_cfgpath(self.observatory), "bestrefs",
+                                "bestrefs_" + utils.str_checksum(self.checkpoint_signature)[:12] + ".checkpoint")
+            try:
+                utils.ensure_dir_exists(path)
+            except OSError as exc:
+                log.warning("Not checkpointing.  Failed creating checkpoint directory for", repr(path), ":", str(exc))
+                return None
+        if path is None:
+            return None
+        journal = checkpoint.CheckpointJournal(path)
+        if self.args.resume and journal.exists():
+            if not self.restore_checkpoint(journal):
+                return None
+        elif self.args.resume:
+            log.warning("No checkpoint found at", repr(path), "processing all datasets.")
+        elif journal.exists():
+            log.info("Discarding checkpoint", repr(path), "from prior run.  Use --resume to continue it instead.")
+            journal.remove()
+        log.verbose("Checkpointing every", self.args.checkpoint_every, "datasets to", repr(path))
+        return journal
+
+    @property
+    def checkpoint_signature(self):
+        """Return a string identifying the command line parameters which define the results of this
+        run,  omitting those which only control checkpointing,  and the new and old contexts they
+        resolve to,  since symbolic contexts like hst-operational can change between runs.
+        """
+        words, skip_next = [], False
+        for word in self._argv[1:]:
+            if skip_next:
+                skip_next = False
+            elif word in ["--resume", "--no-checkpoint"] or word.startswith(("--checkpoint=", "--checkpoint-every=")):
+                continue
+            elif word in ["--checkpoint", "--checkpoint-every"]:
+                skip_next = True
+            else:
+                words.append(word)
+        words += ["new_context=" + str(self.new_context), "old_context=" + str(self.old_context)]
+        return " ".join(words)
+
+    def restore_checkpoint(self, journal):
+        """Restore the updates, kill list, stats, and error tracking recorded by `journal` and arrange
+        to skip every dataset it records as already processed.   Return False without restoring
+        anything if `journal` was recorded for different parameters or contexts.
+        """
+        state = journal.load()
+        if state.get("signature", self.checkpoint_signature) != self.checkpoint_signature:
+            log.error("Not resuming or checkpointing.  Checkpoint", repr(journal.path),
+                      "was recorded for different parameters or contexts:", repr(state["signature"]),
+                      "not", repr(self.checkpoint_signature))
+            return False
+        self.checkpoint_done = set(state["processed"])
+        log.info("Resuming from checkpoint", repr(journal.path), "skipping",
+                 len(self.checkpoint_done), "processed datasets.")
+        self.updates.update(state["updates"])
+        self.kill_list.update(state["kill_list"])
+        self.resumed_header_updates = state["header_updates"]
+        for tracking in state["error_tracking"]:
+            self.merge_error_tracking(tracking)
+        self.checkpoint_error_marks = self.error_tracking_marks()
+        if "stats" in state:
+            self.stats.counts = Counter(state["stats"])
+            for args in state["warned_contexts"]:
+                BestrefsScript.warn_bad_context.seed(None, self, *args)
+            log.set_status(*state["log_status"])
+        if not self.args.save_pickle:   # --save-pickle needs every header,  keep iterating over them.
+            self.new_headers.sources = [
+                source for source in self.new_headers.sources if source not in self.checkpoint_done]
+        return True
+
+    def checkpoint_progress(self, dataset):
+        """Note that `dataset` has been processed,  writing a checkpoint every --checkpoint-every datasets."""
+        if self.checkpoint is not None:
+            self.checkpoint_pending.append(dataset)
+            if len(self.checkpoint_pending) >= self.args.checkpoint_every:
+                self.write_checkpoint()
+
+    def write_checkpoint(self):
+        """Append the datasets processed since the last checkpoint,  their results,  and a snapshot of
+        run-wide counters to the checkpoint journal.
+        """
+        pending = self.checkpoint_pending
+        record = dict(
+            signature=self.checkpoint_signature,
+            processed=pending,
+            updates=OrderedDict((dataset, self.updates[dataset]) for dataset in pending if dataset in self.updates),
+            kill_list=OrderedDict((dataset, self.kill_list[dataset]) for dataset in pending if dataset in self.kill_list),
+            header_updates=self.checkpoint_header_updates,
+            error_tracking=[self.error_tracking_since(self.checkpoint_error_marks)],
+            stats=dict(self.stats.counts),
+            warned_contexts=BestrefsScript.warn_bad_context.cached_keys(self),
+            log_status=log.status(),
+            )
+        with log.warn_on_exception("Failed writing checkpoint", repr(self.checkpoint.path)):
+            self.checkpoint.append(record)
+            log.verbose("Checkpointed", len(pending), "datasets to", repr(self.checkpoint.path), verbosity=20)
+        self.checkpoint_pending = []
+        self.checkpoint_header_updates = OrderedDict()
+        self.checkpoint_error_marks = self.error_tracking_marks()
+
+    def error_tracking_marks(self):
+        """Return marks of the current error tracking state for error_tracking_since()."""
+        mixin = self.ue_mixin
+        return dict(tracked_errors=mixin.tracked_errors, count=Counter(mixin.count),
+                    announce_suppressed=Counter(mixin.announce_suppressed),
+                    data_names=Counter({key: len(names) for (key, names) in mixin.data_names_by_key.items()}))
+
+    def error_tracking_since(self, marks):
+        """Return the errors tracked since error_tracking_marks() returned `marks` in the form of
+        get_error_tracking(),  so that checkpoints record only the errors of the datasets they add.
+        """
+        mixin = self.ue_mixin
+        data_names_by_key = {key: names[marks["data_names"][key]:] for (key, names) in mixin.data_names_by_key.items()
+                             if len(names) > marks["data_names"][key]}
+        return dict(
+            tracked_errors=mixin.tracked_errors - marks["tracked_errors"],
+            messages={key: mixin.messages[key] for key in data_names_by_key
+                      if key in mixin.messages and not marks["data_names"][key]},
+            count=Counter(mixin.count) - marks["count"],
+            all_data_names={name for names in data_names_by_key.values() for name in names},
+            data_names_by_key=data_names_by_key,
+            announce_suppressed=Counter(mixin.announce_suppressed) - marks["announce_suppressed"],
+            )
+
     def normalize_id(self, dataset):
         """Convert a given `dataset` ID to uppercase.  For the sake of simplicity convert
         simple IDs into unassociated exposure IDs in <exposure>:<exposure> form.  This is a
@@ -436,10 +618,10 @@ than errors as the default.
                           help="Instruments to compute best references for, all historical datasets in database.")
 
         self.add_argument("-p", "--load-pickles", nargs="*", default=None,
-                          help="Load dataset headers and prior bestrefs from pickle files,  in worst-to-best update order.  Can also load .json files.")
+                          help="Load dataset headers and prior bestrefs from pickle files,  in worst-to-best update order.  Can also load .json files or .sqlite3 header archives.")
 
         self.add_argument("-a", "--save-pickle", default=None,
-                          help="Write out the combined dataset headers to the specified pickle file.  Can also store .json file.")
+                          help="Write out the combined dataset headers to the specified pickle file.  Can also store .json file or .sqlite3 header archive.")
 
         self.add_argument("-t", "--types", nargs="+",  metavar="REFERENCE_TYPES",  default=(),
                           help="Explicitly define the list of reference types to process, --skip-types also still applies.")
@@ -527,6 +709,27 @@ than errors as the default.
         self.add_argument("--eliminate-duplicate-cases", action="store_true",
                           help="Categorize unique bestrefs results as errors to determine representative test cases...  Replaces normal error counts with coverage counts and ids.")
 
+        self.add_argument("--checkpoint", default=None, metavar="JOURNAL",
+                          help="Record progress in this checkpoint journal so an interrupted run can be resumed.  "
+                          "On by default for --instruments, --all-instruments, and --diffs-only,  "
+                          "journaling in the CRDS cache config area.")
+
+        self.add_argument("--checkpoint-every", type=int, default=1000, metavar="N",
+                          help="Write a checkpoint after every N datasets.  Defaults to 1000.")
+
+        self.add_argument("--no-checkpoint", action="store_true",
+                          help="Don't record a checkpoint journal.")
+
+        self.add_argument("--resume", action="store_true",
+                          help="Skip datasets completed by an interrupted run with the same parameters and restore its results.")
+
+        self.add_argument("-j", "--jobs", type=int, default=1, metavar="N",
+                          help="With --files,  read and update dataset file headers using N threads.  Defaults to 1.")
+
+        self.add_argument("--profile-report", default=None, metavar="JSON_FILE",
+                          help="Time each stage of bestrefs,  e.g. header fetch or each instrument/filekind lookup,  "
+                          "logging a table sorted by wall time and writing it to JSON_FILE.")
+
         cmdline.UniqueErrorsMixin.add_args(self)
 
     def setup_contexts(self):
@@ -599,7 +802,7 @@ than errors as the default.
     def init_headers(self, context, datasets_since):
         """Create header a header generator for `context`,  interpreting command line parameters."""
         if self.args.files:
-            the_headers = headers.FileHeaderGenerator(context, self.files, datasets_since)
+            the_headers = headers.FileHeaderGenerator(context, self.files, datasets_since, jobs=self.args.jobs)
             # log.info("Computing bestrefs for dataset files", self.args.files)
         elif self.args.datasets:
             self.require_server_connection()
@@ -658,12 +861,24 @@ than errors as the default.
         """Compute bestrefs for datasets."""
         # Finish __init__() inside --pdb
         if self.complex_init():
-            for i, dataset in enumerate(self.new_headers):
+            sources = self.profiler.timed_iter("header fetch", self.new_headers)
+            for i, dataset in enumerate(sources):
                 if i != 0 and i % 1000 == 0:
                     log.verbose(self.get_stat("datasets"), "sources processed", verbosity=5)
+                if dataset in self.checkpoint_done:
+                    continue
                 self.process(dataset)
-            self.post_processing()
+                self.checkpoint_progress(dataset)
+            if self.resumed_header_updates:
+                self.new_headers.update_headers(self.resumed_header_updates)
+            with self.profiler.stage("post processing"):
+                self.post_processing()
+            if self.checkpoint is not None:
+                self.checkpoint.remove()
         self.report_stats()
+        if self.args.profile_report:
+            self.profiler.report()
+            self.profiler.save(self.args.profile_report)
         if self.args.eliminate_duplicate_cases:
             log.warning("Running in --eliminate-duplicate-cases mode;  even successful bestrefs are categorized as errors for analysis.")
         log.verbose(self.get_stat("datasets"), "sources processed", verbosity=5)
@@ -690,24 +905,33 @@ than errors as the default.
 
     def _process(self, dataset):
         """Core best references,  add to update tuples."""
+        # new header fetch is timed while iterating self.new_headers in main()
         self.active_header = new_header = self.new_headers.get_lookup_parameters(dataset)
         instrument = utils.header_to_instrument(new_header)
         self.warn_bad_context("New-context", self.new_context, instrument)
-        new_bestrefs = self.get_bestrefs(instrument, dataset, self.new_context, new_header)
+        with self.profiler.stage("bestrefs new"):
+            new_bestrefs = self.get_bestrefs(instrument, dataset, self.new_context, new_header)
         if self.compare_prior:
             self.warn_bad_context("Old-context", self.old_context, instrument)
             if self.args.old_context:
-                self.active_header = old_header = self.old_headers.get_lookup_parameters(dataset)
-                old_bestrefs = self.get_bestrefs(instrument, dataset, self.old_context, old_header)
+                with self.profiler.stage("header fetch old"):
+                    self.active_header = old_header = self.old_headers.get_lookup_parameters(dataset)
+                with self.profiler.stage("bestrefs old"):
+                    old_bestrefs = self.get_bestrefs(instrument, dataset, self.old_context, old_header)
             else:
-                old_bestrefs = self.old_headers.get_old_bestrefs(dataset)
-            updates, kill_list = self._compare_bestrefs(instrument, dataset, old_bestrefs, new_bestrefs)
+                with self.profiler.stage("header fetch old"):
+                    old_bestrefs = self.old_headers.get_old_bestrefs(dataset)
+            with self.profiler.stage("comparison"):
+                updates, kill_list = self._compare_bestrefs(instrument, dataset, old_bestrefs, new_bestrefs)
             if self.args.optimize_tables:
                 updates = self.optimize_tables(dataset, updates)
         else:
-            updates, kill_list = self._screen_bestrefs(instrument, dataset, new_bestrefs)
+            with self.profiler.stage("comparison"):
+                updates, kill_list = self._screen_bestrefs(instrument, dataset, new_bestrefs)
         if self.args.update_pickle:  # XX  mutating input bestrefs to support updated pickles
             self.new_headers.update_headers({dataset: new_bestrefs})
+            if self.checkpoint is not None:
+                self.checkpoint_header_updates[dataset] = new_bestrefs
         if updates:
             self.updates[dataset] = updates
         if kill_list:
@@ -722,10 +946,27 @@ than errors as the default.
                 return {}
         with log.augment_exception("Failed computing bestrefs for data", repr(dataset), 
                                    "with respect to", repr(context)):
-            bestrefs = crds.getrecommendations(
-                header, reftypes=reftypes, context=context, observatory=self.observatory, fast=log.get_verbose() < 50)
+            fast = log.get_verbose() < 50
+            if self.args.profile_report and fast:
+                bestrefs = self.profiled_recommendations(instrument, context, header, reftypes)
+            else:
+                bestrefs = crds.getrecommendations(
+                    header, reftypes=reftypes, context=context, observatory=self.observatory, fast=fast)
         return {key.upper(): value for (key, value) in bestrefs.items()}
 
+    def profiled_recommendations(self, instrument, context, header, reftypes):
+        """For --profile-report,  compute the bestrefs of `reftypes` for `header` locally as
+        crds.getrecommendations(fast=True) does,  timing header conditioning and the lookup of
+        each instrument/filekind as separate stages.
+        """
+        with self.profiler.stage("conditioning"):
+            conditioned = utils.condition_header(header)
+        bestrefs = {}
+        for reftype in reftypes:
+            with self.profiler.stage("lookup " + instrument.lower() + " " + reftype.lower()):
+                bestrefs.update(heavy_client.hv_best_references(context, conditioned, [reftype], condition=False))
+        return bestrefs
+
     def determine_reftypes(self, instrument, dataset, context, header):
         """Based on instrument, context, header as well as command line parameters determine the list
         of reftypes that should be processed.
@@ -941,7 +1182,10 @@ than errors as the default.
         """
         for update in sorted(updates):
             new_header = self.new_headers.header(dataset)
-            if not table_effects.is_reprocessing_required(dataset, new_header, self.old_context, self.new_context, update):
+            with self.profiler.stage("table effects " + update.instrument + " " + update.filekind):
+                required = table_effects.is_reprocessing_required(
+                    dataset, new_header, self.old_context, self.new_context, update)
+            if not required:
                 updates.remove(update)  # reprocessing not required, ignore update.
                 log.verbose("Removing table update for", update.instrument, update.filekind, dataset,
                             "no effective change from reference", repr(update.old_reference),
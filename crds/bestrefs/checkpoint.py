@@ -0,0 +1,108 @@
+"""This module defines an append-only checkpoint journal used by crds.bestrefs to resume
+long running campaigns,  e.g. --all-instruments comparisons,  after a crash.
+
+Each checkpoint appends one record containing only the datasets processed since the
+prior checkpoint along with their updates,  kill list entries,  and tracked errors,  plus a
+snapshot of the small run-wide state:  stats counters and log message counts.  The cost
+of a checkpoint is therefore proportional to the work done since the last one rather than
+to the total work done so far.
+
+Records are framed with a length and sha1 digest so that a record torn by a crash
+mid-write is detected and discarded on load,  making each checkpoint atomic.
+
+>>> import tempfile, os
+>>> path = os.path.join(tempfile.mkdtemp(), "test.checkpoint")
+>>> journal = CheckpointJournal(path)
+>>> journal.append(dict(processed=["a", "b"], updates={"a": 1}, kill_list={}, snapshot=1))
+>>> journal.append(dict(processed=["c"], updates={"c": 3}, kill_list={"c": 4}, snapshot=2))
+>>> with open(path, "ab") as handle:
+...     _ = handle.write(b"torn partial record")
+>>> state = CheckpointJournal(path).load()
+>>> state["processed"], dict(state["updates"]), dict(state["kill_list"]), state["snapshot"]
+(['a', 'b', 'c'], {'a': 1, 'c': 3}, {'c': 4}, 2)
+>>> journal.remove()
+>>> os.path.exists(path)
+False
+"""
+import os
+import struct
+import pickle
+import hashlib
+from collections import OrderedDict
+
+# ===================================================================
+
+from crds.core import log
+
+# ===================================================================
+
+_HEADER = struct.Struct(">Q20s")   # payload length, sha1 digest of payload
+
+# Record keys accumulated across records,  all other keys are replaced by the latest record.
+_ACCUMULATED = ["processed", "error_tracking", "updates", "kill_list", "header_updates"]
+
+class CheckpointJournal:
+    """Append-only journal of bestrefs progress records stored at `path`."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        """Return True IFF a journal has been written at self.path."""
+        return os.path.exists(self.path)
+
+    def append(self, record):
+        """Durably append dict `record` to the journal."""
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(payload).digest()
+        with open(self.path, "ab") as handle:
+            handle.write(_HEADER.pack(len(payload), digest) + payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def records(self):
+        """Yield the intact records of the journal in order,  dropping any torn trailing record."""
+        with open(self.path, "rb") as handle:
+            while True:
+                header = handle.read(_HEADER.size)
+                if not header:
+                    break
+                if len(header) < _HEADER.size:
+                    log.warning("Ignoring incomplete trailing checkpoint in", repr(self.path))
+                    break
+                length, digest = _HEADER.unpack(header)
+                payload = handle.read(length)
+                if len(payload) < length or hashlib.sha1(payload).digest() != digest:
+                    log.warning("Ignoring incomplete trailing checkpoint in", repr(self.path))
+                    break
+                yield pickle.loads(payload)
+
+    def load(self):
+        """Combine all intact records into a single state dict.   Accumulated keys are merged
+        across records in order,  other keys take their most recent values.
+        """
+        state = dict(processed=[], error_tracking=[], updates=OrderedDict(), kill_list=OrderedDict(),
+                     header_updates=OrderedDict())
+        for record in self.records():
+            for key, value in record.items():
+                if key in ["processed", "error_tracking"]:
+                    state[key].extend(value)
+                elif key in _ACCUMULATED:
+                    state[key].update(value)
+                else:
+                    state[key] = value
+        return state
+
+    def remove(self):
+        """Delete the journal,  nominally after a run completes successfully."""
+        if self.exists():
+            os.remove(self.path)
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.bestrefs import checkpoint
+    return doctest.testmod(checkpoint)
+
+if __name__ == "__main__":
+    print(test())
@@ -0,0 +1,315 @@
+"""This module defines a columnar SQLite-backed store for bestrefs dataset headers,  an
+alternative to the .pkl and .json formats handled by --load-pickles and --save-pickle.
+
+Pickled and .json header dumps repeat every keyword name for every dataset and must be
+loaded in their entirety.   A header archive instead dictionary-encodes keyword names and
+keyword values into shared tables and records each header as a set of (dataset, keyword,
+value) integer triples.   Rows can be selected by dataset id or by --datasets-since date,
+and columns by keyword name,  so only the requested subset of headers is ever decoded.
+
+Decoding every cell of a large archive is much slower than unpickling the equivalent .pkl,
+so .pkl remains the format for whole-file loads.   Each archive also stores a pickled
+snapshot of all of its headers which is used whenever no rows or columns are selected;
+the columnar cells are only read for --only-ids,  --datasets-since,  or keyword subsets.
+
+Archives are identified by the .sqlite3 file extension:
+
+% crds bestrefs --load-pickles headers.json --save-pickle headers.sqlite3 ...
+
+Existing .pkl and .json dumps can be converted directly:
+
+% python -m crds.bestrefs.header_archive headers.pkl headers.sqlite3
+"""
+import os
+import json
+import pickle
+import sqlite3
+
+# ===================================================================
+
+from crds.core import log, cmdline, utils
+from crds import matches
+
+# ===================================================================
+
+ARCHIVE_EXTENSION = ".sqlite3"
+
+SCHEMA = """
+create table if not exists keywords (id integer primary key, name text unique not null);
+create table if not exists vals (id integer primary key, value text unique not null);
+create table if not exists datasets (id integer primary key, name text unique not null,
+                                     instrument text, exptime text);
+create table if not exists cells (dataset integer not null, keyword integer not null,
+                                  value integer not null, primary key (dataset, keyword)) without rowid;
+create index if not exists datasets_since on datasets (instrument, exptime);
+create table if not exists snapshot (id integer primary key, data blob not null);
+"""
+
+# Maximum number of SQL variables bound in a single IN (...) clause.
+_SQL_CHUNK = 500
+
+# ===================================================================
+
+def is_header_archive(path):
+    """Return True IFF `path` names a header archive rather than a .pkl or .json dump.
+
+    >>> is_header_archive("headers.sqlite3")
+    True
+    >>> is_header_archive("headers.json")
+    False
+    """
+    return path.endswith(ARCHIVE_EXTENSION)
+
+class HeaderArchive:
+    """Columnar store of {dataset_id : header, ...} backed by a SQLite3 database file.
+
+    Values are stored JSON encoded so that the types of pickled header values round trip.
+    """
+
+    def __init__(self, path, mode="r"):
+        assert mode in ["r", "w"], "Invalid header archive mode " + repr(mode)
+        self.path = path
+        self.mode = mode
+        if mode == "w":
+            if os.path.exists(path):
+                os.remove(path)
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(SCHEMA)
+        else:
+            if not os.path.exists(path):
+                raise IOError("Header archive " + repr(path) + " does not exist.")
+            self.connection = sqlite3.connect("file:" + path + "?mode=ro", uri=True)
+        self._keyword_ids = {}
+        self._value_ids = {}
+        self._decoded_values = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Commit any pending writes and close the underlying database."""
+        if self.connection is not None:
+            if self.mode == "w":
+                self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def __len__(self):
+        return self.connection.execute("select count(*) from datasets").fetchone()[0]
+
+    def __contains__(self, dataset_id):
+        return self.connection.execute(
+            "select 1 from datasets where name = ?", (dataset_id,)).fetchone() is not None
+
+    # ---------------------------------------------------------------
+
+    def _encode(self, table, column, ids, value):
+        """Return the integer id of `value` in dictionary `table`,  adding it as needed."""
+        try:
+            return ids[value]
+        except KeyError:
+            cursor = self.connection.execute(
+                "insert into {} ({}) values (?)".format(table, column), (value,))
+            ids[value] = cursor.lastrowid
+            return ids[value]
+
+    def write(self, headers):
+        """Add the {dataset_id : header, ...} mapping `headers` to the archive."""
+        assert self.mode == "w", "Header archive " + repr(self.path) + " is not writable."
+        for dataset_id, header in sorted(headers.items()):
+            with log.error_on_exception("Failed archiving header for", repr(dataset_id)):
+                if isinstance(header, str):
+                    log.warning("Skipping bad dataset", repr(dataset_id), ":", repr(header))
+                    continue
+                instrument = utils.header_to_instrument(header, default="unknown").lower()
+                exptime = matches.get_exptime(header)
+                cursor = self.connection.execute(
+                    "insert into datasets (name, instrument, exptime) values (?, ?, ?)",
+                    (dataset_id, instrument, exptime))
+                row_id = cursor.lastrowid
+                cells = [(row_id,
+                          self._encode("keywords", "name", self._keyword_ids, key),
+                          self._encode("vals", "value", self._value_ids, json.dumps(value)))
+                         for (key, value) in header.items()]
+                self.connection.executemany(
+                    "insert or replace into cells (dataset, keyword, value) values (?, ?, ?)", cells)
+
+    def write_snapshot(self, headers):
+        """Store { dataset_id : header, ... } `headers` as the pickled whole-archive snapshot."""
+        assert self.mode == "w", "Header archive " + repr(self.path) + " is not writable."
+        self.connection.execute("insert or replace into snapshot (id, data) values (0, ?)",
+                                (pickle.dumps(headers, pickle.HIGHEST_PROTOCOL),))
+
+    def read_snapshot(self):
+        """Return the unpickled { dataset_id : header, ... } snapshot of the whole archive,
+        or None if the archive has no snapshot.
+        """
+        try:
+            row = self.connection.execute("select data from snapshot where id = 0").fetchone()
+        except sqlite3.OperationalError:   # archive predates snapshots
+            return None
+        return pickle.loads(row[0]) if row is not None else None
+
+    # ---------------------------------------------------------------
+
+    def dataset_ids(self, datasets_since=None):
+        """Return the sorted dataset ids in the archive with EXPTIME on or after `datasets_since`.
+
+        `datasets_since` is None (all datasets),  a date string applying to every instrument,  or a
+        dict of { instrument : date_string } as computed by --datasets-since=auto.
+        """
+        if not datasets_since:
+            rows = self.connection.execute("select name from datasets")
+        elif isinstance(datasets_since, dict):
+            rows = []
+            for instrument, since in datasets_since.items():
+                rows.extend(self.connection.execute(
+                    "select name from datasets where instrument = ? and exptime >= ?",
+                    (instrument.lower(), since)))
+            placeholders = ",".join("?" * len(datasets_since))
+            rows.extend(self.connection.execute(
+                "select name from datasets where instrument not in ({})".format(placeholders),
+                [instrument.lower() for instrument in datasets_since]))
+        else:
+            rows = self.connection.execute(
+                "select name from datasets where exptime >= ?", (datasets_since,))
+        return sorted(row[0] for row in rows)
+
+    def keywords(self):
+        """Return the sorted list of all keyword names stored in the archive."""
+        return sorted(row[0] for row in self.connection.execute("select name from keywords"))
+
+    def read(self, only_ids=None, keywords=None):
+        """Return { dataset_id : header, ... } for `only_ids` or all datasets,  including only
+        the keyword names in `keywords` or all keywords.
+
+        Cells are fetched as integer codes and each distinct keyword name and value is decoded
+        only once,  no matter how many datasets share it.
+        """
+        names = dict(self.connection.execute("select id, name from keywords"))
+        key_clause, key_params = "", []
+        if keywords is not None:
+            wanted = set(keywords)
+            key_params = [key_id for (key_id, name) in names.items() if name in wanted]
+            key_clause = " and c.keyword in ({})".format(",".join("?" * len(key_params)))
+        query = "select d.name, c.keyword, c.value from cells c join datasets d on c.dataset = d.id"
+        if only_ids is None:
+            self._decode_values(None)
+            id_chunks = [None]
+        else:
+            only_ids = sorted(set(only_ids))
+            id_chunks = [only_ids[i:i+_SQL_CHUNK] for i in range(0, len(only_ids), _SQL_CHUNK)]
+        headers = {}
+        for chunk in id_chunks:
+            if chunk is None:
+                sql, params = query + " where 1" + key_clause, key_params
+            else:
+                sql = query + " where d.name in ({})".format(",".join("?" * len(chunk))) + key_clause
+                params = chunk + key_params
+            cells = self.connection.execute(sql, params)
+            if chunk is not None:
+                cells = cells.fetchall()
+                self._decode_values({cell[2] for cell in cells})
+            values = self._decoded_values
+            for dataset_id, key_id, value_id in cells:
+                headers.setdefault(dataset_id, {})[names[key_id]] = values[value_id]
+        return headers
+
+    def _decode_values(self, value_ids):
+        """Load and JSON decode the dictionary values for `value_ids`,  or all values for None."""
+        if value_ids is None:
+            rows = self.connection.execute("select id, value from vals")
+            self._decoded_values.update((value_id, json.loads(value)) for (value_id, value) in rows)
+            return
+        missing = sorted(set(value_ids) - set(self._decoded_values))
+        for i in range(0, len(missing), _SQL_CHUNK):
+            chunk = missing[i:i+_SQL_CHUNK]
+            rows = self.connection.execute(
+                "select id, value from vals where id in ({})".format(",".join("?" * len(chunk))), chunk)
+            self._decoded_values.update((value_id, json.loads(value)) for (value_id, value) in rows)
+
+    def header(self, dataset_id, keywords=None):
+        """Return the header for `dataset_id`,  optionally restricted to `keywords`."""
+        try:
+            return self.read(only_ids=[dataset_id], keywords=keywords)[dataset_id]
+        except KeyError as exc:
+            raise KeyError("Dataset " + repr(dataset_id) + " is not in header archive " +
+                           repr(self.path)) from exc
+
+# ===================================================================
+
+def load_header_archive(path, only_ids=None, datasets_since=None, keywords=None):
+    """Load { dataset_id : header, ... } from the header archive at `path`,  restricted to
+    dataset ids `only_ids`,  EXPTIME's since `datasets_since`,  and keyword names `keywords`.
+
+    Unfiltered loads return the archive's pickled snapshot rather than decoding every cell.
+    """
+    with HeaderArchive(path) as archive:
+        if only_ids is None and datasets_since is None and keywords is None:
+            headers = archive.read_snapshot()
+            if headers is not None:
+                return headers
+        if datasets_since is not None:
+            since_ids = archive.dataset_ids(datasets_since)
+            if only_ids is not None:
+                only_ids = set(since_ids) & set(only_ids)
+            else:
+                only_ids = since_ids
+        return archive.read(only_ids=only_ids, keywords=keywords)
+
+def save_header_archive(path, headers):
+    """Write { dataset_id : header, ... } `headers` to a new header archive at `path`."""
+    with HeaderArchive(path, "w") as archive:
+        archive.write(headers)
+        archive.write_snapshot({dataset_id: header for (dataset_id, header) in headers.items()
+                                if not isinstance(header, str)})
+
+def convert_headers(input_paths, output_path):
+    """Combine the .pkl, .json, or header archive files `input_paths` in order,  trailing files
+    overriding leading files id-by-id,  and write the result to `output_path` in the format
+    implied by its extension.
+    """
+    from . import headers
+    combined = {}
+    for path in input_paths:
+        log.info("Loading file", repr(path))
+        combined.update(headers.load_bestrefs_headers(path))
+    generator = headers.HeaderGenerator(None, None, None)
+    generator.headers = combined
+    generator.save_pickle(output_path)
+    return combined
+
+# ===================================================================
+
+class HeaderArchiveScript(cmdline.Script):
+    """Command line script for converting bestrefs header dumps between formats."""
+
+    description = """
+Converts bestrefs --save-pickle header dumps between the .pkl, .json, and columnar
+.sqlite3 header archive formats.   Multiple inputs are combined in command line order.
+"""
+
+    epilog = """
+% python -m crds.bestrefs.header_archive hst_cos.pkl hst_acs.json hst_all.sqlite3
+"""
+
+    def add_args(self):
+        self.add_argument("inputs", nargs="+", help=".pkl, .json, or .sqlite3 header files to convert.")
+        self.add_argument("output", help="Output header file, format determined by extension.")
+
+    def main(self):
+        convert_headers(self.args.inputs, self.args.output)
+        return log.errors()
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.bestrefs import header_archive
+    return doctest.testmod(header_archive)
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(HeaderArchiveScript()())
@@ -7,6 +7,8 @@ For more details on the several modes of operations and command line parameters
 """
 import json
 import gc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # ===================================================================
 
@@ -15,6 +17,7 @@ from crds.core import log, utils, heavy_client
 from crds.core.exceptions import CrdsError
 from crds import data_file, matches
 from crds.client import api
+from . import header_archive
 
 import pickle
 
@@ -108,7 +111,7 @@ class HeaderGenerator:
         return result
 
     def save_pickle(self, outpath, only_ids=None):
-        """Write out headers to `outpath` file which can be a Python pickle or .json"""
+        """Write out headers to `outpath` file which can be a Python pickle, .json, or .sqlite3 header archive."""
         if only_ids is None:
             only_hdrs = self.headers
         else:
@@ -121,6 +124,8 @@ class HeaderGenerator:
         elif outpath.endswith(".pkl"):
             with open(outpath, "wb+") as pick:
                 pickle.dump(only_hdrs, pick)
+        elif header_archive.is_header_archive(outpath):
+            header_archive.save_header_archive(outpath, only_hdrs)
         log.info("Done writing", repr(outpath))
 
     def update_headers(self, headers2, only_ids=None):
@@ -187,26 +192,100 @@ def bestrefs_condition(value):
 # from a file as processing is going on via header().   The "pickle correction" scheme works by
 # pre-loading the FileHeaderGenerator with pickled headers...  which prevents the file from ever being
 # accessed (except possibly to update the headers).
+#
+# With jobs > 1,  iterating a FileHeaderGenerator reads upcoming headers on a pool of threads,  keeping
+# at most PREFETCH_PER_JOB * jobs reads outstanding ahead of the processing loop,  which still consumes
+# headers in sorted source order.   Header updates are similarly written back by `jobs` threads,  so at
+# most `jobs` dataset files are open at once.   Threads only read and write files:  the cache of
+# data_file.get_free_header() is updated,  log messages are issued,  and failures are raised by the main
+# thread in source order,  as with jobs == 1.
 
+PREFETCH_PER_JOB = 4
 
 class FileHeaderGenerator(HeaderGenerator):
     """Generates lookup parameters and old bestrefs from dataset files."""
 
+    def __init__(self, context, sources, datasets_since, jobs=1):
+        super(FileHeaderGenerator, self).__init__(context, sources, datasets_since)
+        self.jobs = max(jobs, 1)
+        self._executor = None
+        self._upcoming = deque()    # sources not yet submitted for prefetch,  in processing order
+        self._pending = {}          # { source : Future for header,  ... }
+
+    def __iter__(self):
+        """Yield sources in sorted order as for HeaderGenerator,  prefetching headers if jobs > 1."""
+        if self.jobs == 1:
+            yield from super(FileHeaderGenerator, self).__iter__()
+            return
+        log.verbose("Prefetching dataset file headers using", self.jobs, "threads.")
+        with ThreadPoolExecutor(max_workers=self.jobs) as self._executor:
+            self._upcoming = deque(sorted(self.sources))
+            try:
+                self._fill_prefetch()
+                yield from super(FileHeaderGenerator, self).__iter__()
+            finally:
+                self._upcoming.clear()
+                for future in self._pending.values():
+                    future.cancel()
+                self._pending = {}
+        self._executor = None
+
+    def _fill_prefetch(self):
+        """Submit upcoming header reads until PREFETCH_PER_JOB * jobs are outstanding."""
+        while self._upcoming and len(self._pending) < PREFETCH_PER_JOB * self.jobs:
+            source = self._upcoming.popleft()
+            if source not in self.headers and source not in self._pending:
+                self._pending[source] = self._executor.submit(self._prefetch_header, source)
+
+    def _read_header(self, filename):
+        """Read the header of dataset file `filename`.
+
+        Every keyword is read since --save-pickle and --compare-source-bestrefs
+        need the whole header.  FITS headers are still read by scanning header
+        blocks,  see crds.io.fits.scan_raw_header().
+        """
+        return data_file.get_free_header(filename, (), None, self.observatory)
+
+    def _prefetch_header(self, filename):
+        """On a prefetch thread,  read the header of dataset file `filename` without logging or caching."""
+        return data_file.read_free_header(filename, (), None, self.observatory)
+
     def _header(self, filename):
         """Get the best references recommendations recorded in the header of file `dataset`."""
         gc.collect()
         if filename not in self.headers:
-            self.headers[filename] = data_file.get_free_header(filename, (), None, self.observatory)
+            future = self._pending.pop(filename, None)
+            if future is not None:
+                header = future.result()
+                data_file.get_free_header.seed(header, filename, (), None, self.observatory)
+                log.verbose("Header of", repr(filename), "=", log.PP(header), verbosity=90)
+            else:
+                header = self._read_header(filename)
+            self.headers[filename] = header
+            if self._executor is not None:
+                self._fill_prefetch()
         return self.headers[filename]
 
     def handle_updates(self, all_updates):
-        """Write best reference updates back to dataset file headers."""
+        """Write best reference updates back to dataset file headers,  using `jobs` threads."""
         super(FileHeaderGenerator, self).handle_updates(all_updates)
-        for source in sorted(all_updates):
-            updates = all_updates[source]
-            if updates:
+        sources = [source for source in sorted(all_updates) if all_updates[source]]
+        if self.jobs == 1 or len(sources) <= 1:
+            for source in sources:
                 log.verbose("-" * 120)
-                update_file_bestrefs(self.context, source, updates)
+                update_file_bestrefs(self.context, source, all_updates[source])
+            return
+        log.verbose("Updating", len(sources), "dataset file headers using", self.jobs, "threads.")
+        batch_size = PREFETCH_PER_JOB * self.jobs
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for i in range(0, len(sources), batch_size):
+                batch = sources[i:i+batch_size]
+                futures = [executor.submit(_deferred_update_file_bestrefs, self.context, source, all_updates[source])
+                           for source in batch]
+                for future in futures:   # log and re-raise the first failure in source order
+                    log.verbose("-" * 120)
+                    for args in future.result():
+                        log.verbose(*args)
 
 # ===================================================================
 
@@ -330,7 +409,10 @@ class PickleHeaderGenerator(HeaderGenerator):
         super(PickleHeaderGenerator, self).__init__(context, pickles, datasets_since)
         for pickle in pickles:
             log.info("Loading file", repr(pickle))
-            pick_headers = load_bestrefs_headers(pickle)
+            # Header archives can screen rows before loading.  Dropping EXPTIME's before
+            # --datasets-since is only safe when no later file can augment the headers.
+            since = datasets_since if len(pickles) == 1 else None
+            pick_headers = load_bestrefs_headers(pickle, only_ids=only_ids, datasets_since=since)
             if not self.headers:
                 log.info("Loaded", len(pick_headers), "datasets from file", repr(pickle),
                          "completely replacing existing headers.")
@@ -343,16 +425,23 @@ class PickleHeaderGenerator(HeaderGenerator):
 
 # ============================================================================
 
-def load_bestrefs_headers(path):
+def load_bestrefs_headers(path, only_ids=None, datasets_since=None):
     """Given `path` to a serialization file,  load  {dataset_id : header, ...}.  
-    Supports .pkl and .json.
+    Supports .pkl, .json, and .sqlite3 header archives.
 
     For easier editing and syntax error precision,  .json files are stored as
     one header per line.  
 
+    Header archives are columnar and load only the datasets in `only_ids` with
+    EXPTIME on or after `datasets_since`.  Other formats ignore these filters.
+    Unfiltered archive loads unpickle the archive's whole-file snapshot.
+
     Also used by server to load mock parameters.
     """
-    if path.endswith(".json"):
+    if header_archive.is_header_archive(path):
+        headers = header_archive.load_header_archive(
+            path, only_ids=only_ids, datasets_since=datasets_since)
+    elif path.endswith(".json"):
         headers = {}
         try:
             with open(path, "r") as pick:
@@ -366,7 +455,7 @@ def load_bestrefs_headers(path):
         with open(path, "rb") as pick:
             headers = pickle.load(pick)
     else:
-        raise ValueError("Valid serialization formats are .json and .pkl")
+        raise ValueError("Valid serialization formats are .json, .pkl, and .sqlite3")
     return headers
 
 def add_instrument(header):
@@ -376,9 +465,17 @@ def add_instrument(header):
     header["META.INSTRUMENT.NAME"] = instrument
     return header
 
-def update_file_bestrefs(context, dataset, updates):
+def _deferred_update_file_bestrefs(context, dataset, updates):
+    """Like update_file_bestrefs() but return its verbose messages as a list of argument
+    tuples rather than logging them,  for update threads.
+    """
+    messages = []
+    update_file_bestrefs(context, dataset, updates, verbose=lambda *args: messages.append(args))
+    return messages
+
+def update_file_bestrefs(context, dataset, updates, verbose=log.verbose):
     """Update the header of `dataset` with best reference recommendations
-    `bestrefs` determined by context named `pmap`.
+    `bestrefs` determined by context named `pmap`,  issuing messages with `verbose`.
     """
     if not updates:
         return
@@ -392,7 +489,7 @@ def update_file_bestrefs(context, dataset, updates):
 
         def set_key(keyword, value):
             """Set a single keyword value with logging,  bound to outer-scope hdulist."""
-            log.verbose("Setting", repr(dataset), keyword, "=", value)
+            verbose("Setting", repr(dataset), keyword, "=", value)
             hdulist[0].header[keyword] = value
 
         set_key("CRDS_CTX", context)
@@ -0,0 +1,133 @@
+"""This module defines a low overhead per-stage profiler used by crds.bestrefs --profile-report
+to attribute run time to the stages of a bestrefs run:  new and old header fetch,  header conditioning,
+each instrument/filekind rmap lookup,  bestrefs comparison,  and table effects.
+
+Each stage records its call count,  wall clock time,  and CPU time.   Stage times are
+inclusive,  so e.g. the lookup stages nest within the "bestrefs new" stage which computes them.
+Timing a stage costs two clock reads at entry and exit,  so profiling is cheap enough to
+leave on for production runs.   When profiling is off a NullStageProfiler does nothing.
+
+>>> profiler = StageProfiler()
+>>> for i in range(3):
+...     with profiler.stage("outer"):
+...         with profiler.stage("inner"):
+...             pass
+>>> sorted((row["stage"], row["calls"]) for row in profiler.rows())
+[('inner', 3), ('outer', 3)]
+
+>>> with NullStageProfiler().stage("anything"):
+...     pass
+"""
+import json
+import time
+import contextlib
+
+# ===================================================================
+
+from crds.core import log
+
+# ===================================================================
+
+class _StageTimer:
+    """Context manager which adds one timed call to the [calls, wall, cpu] list `stats`."""
+
+    __slots__ = ("stats", "wall", "cpu")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.wall = self.cpu = 0.0
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *args):
+        stats = self.stats
+        stats[0] += 1
+        stats[1] += time.perf_counter() - self.wall
+        stats[2] += time.process_time() - self.cpu
+        return False
+
+class StageProfiler:
+    """Accumulates { stage : [calls, wall seconds, cpu seconds] } for named stages."""
+
+    def __init__(self):
+        self.stats = {}
+        self.started_wall = time.perf_counter()
+        self.started_cpu = time.process_time()
+
+    def stage(self, name):
+        """Return a context manager which times one call of stage `name`."""
+        try:
+            stats = self.stats[name]
+        except KeyError:
+            stats = self.stats[name] = [0, 0.0, 0.0]
+        return _StageTimer(stats)
+
+    def timed_iter(self, name, iterable):
+        """Yield the items of `iterable` timing each step of the iteration as stage `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def get_stage(self, name):
+        """Return the report dict for stage `name`."""
+        calls, wall, cpu = self.stats[name]
+        return dict(stage=name, calls=calls, wall=wall, cpu=cpu,
+                    wall_per_call=wall/calls if calls else 0.0)
+
+    def rows(self):
+        """Return the report dicts of all stages sorted by descending wall time."""
+        return sorted((self.get_stage(name) for name in self.stats),
+                      key=lambda row: (-row["wall"], row["stage"]))
+
+    def to_dict(self):
+        """Return the JSON-able profile,  stages sorted by descending wall time."""
+        return dict(wall=time.perf_counter() - self.started_wall,
+                    cpu=time.process_time() - self.started_cpu,
+                    stages=self.rows())
+
+    def report(self):
+        """Output the profile as a table sorted by descending wall time."""
+        profile = self.to_dict()
+        width = max([len(row["stage"]) for row in profile["stages"]] + [len("stage")])
+        lines = ["{:<{}} {:>10} {:>12} {:>12} {:>14}".format(
+            "stage", width, "calls", "wall-sec", "cpu-sec", "wall-ms/call")]
+        for row in profile["stages"]:
+            lines.append("{:<{}} {:>10d} {:>12.3f} {:>12.3f} {:>14.3f}".format(
+                row["stage"], width, row["calls"], row["wall"], row["cpu"], row["wall_per_call"]*1000))
+        lines.append("{:<{}} {:>10} {:>12.3f} {:>12.3f}".format(
+            "total", width, "", profile["wall"], profile["cpu"]))
+        log.info("Bestrefs stage profile (stage times include nested stages):\n" + "\n".join(lines))
+
+    def save(self, path):
+        """Write the profile to `path` as JSON."""
+        log.verbose("Writing stage profile to", repr(path))
+        with open(path, "w+") as handle:
+            json.dump(self.to_dict(), handle, indent=4)
+
+class NullStageProfiler:
+    """Stand-in for StageProfiler when profiling is off,  adding no timing overhead."""
+
+    _null = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._null
+
+    def timed_iter(self, name, iterable):
+        return iterable
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.bestrefs import profiling
+    return doctest.testmod(profiling)
+
+if __name__ == "__main__":
+    print(test())
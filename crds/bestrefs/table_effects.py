@@ -9,7 +9,9 @@ a dataset to be processed.
 
 If the rows are different,  then the dataset should be reprocessed.  
 """
-from crds.core import rmap, log
+from collections import defaultdict
+
+from crds.core import rmap, log, utils
 from crds.io import tables
 from crds.client import api
 
@@ -165,6 +167,100 @@ def mode_select(table, constraints):
         if selected:
             yield row
 
+class TableModeIndex:
+    """Index the rows of the first table segment of a reference file by the distinct values of
+    each mode column so that mode selections test each distinct value once rather than each row.
+
+    Column postings are built lazily,  the first time a column is used as a mode field.
+    """
+    def __init__(self, filename):
+        self.table = tables.tables(filename)[0]   # XXXX currently limited to FITS extension 1
+        self.colnames = self.table.colnames
+        self._postings = {}
+        self._row_reprs = None
+
+    def postings(self, field):
+        """Return { str_to_number(value) : [row_index, ...], ...} for column `field`."""
+        if field not in self._postings:
+            postings = defaultdict(list)
+            for i, value in enumerate(self.table.column(field)):
+                postings[str_to_number(value)].append(i)
+            self._postings[field] = dict(postings)
+        return self._postings[field]
+
+    @property
+    def row_reprs(self):
+        """Return the repr() of every row,  computed once."""
+        if self._row_reprs is None:
+            self._row_reprs = [repr(row) for row in self.table.rows]
+        return self._row_reprs
+
+    def select(self, constraints):
+        """Return the sorted repr()'s of rows matching `constraints`,  equivalent to sorting
+        [repr(row) for row in mode_select(self.table, constraints)].
+        """
+        selected = None
+        for field in constraints:
+            (value, cmpfn, args) = constraints[field]
+            matches = set()
+            for table_value, rows in self.postings(field).items():
+                if cmpfn(table_value, value, args):
+                    matches.update(rows)
+            selected = matches if selected is None else (selected & matches)
+        if selected is None:
+            selected = range(len(self.row_reprs))
+        return sorted(self.row_reprs[i] for i in selected)
+
+@utils.cached
+def get_mode_index(filename):
+    """Return the cached TableModeIndex for reference table `filename`."""
+    return TableModeIndex(filename)
+
+def clear_cache():
+    """Clear the cached table indices and comparison results used by DeepLook."""
+    get_mode_index.cache.clear()
+    compare_mode_rows.cache.clear()
+
+@utils.xcached(omit_from_key=[0])
+def compare_mode_rows(deep_look, rule_name, old_reference, new_reference, constraint_items):
+    """Compare the rows selected from `old_reference` and `new_reference` by `deep_look` mode
+    constraint values `constraint_items`,  ((field, value), ...)
+
+    Memoized on (rule_name, old_reference, new_reference, constraint_items) so repeated datasets
+    with the same mode and table swap cost a dict lookup.
+
+    Returns (is_different, message)
+    """
+    index_old = get_mode_index(old_reference)
+    index_new = get_mode_index(new_reference)
+
+    # Columns must be the same between tables.
+    if sorted(index_old.colnames) != sorted(index_new.colnames):
+        return True, 'Columns are different between references.'
+
+    # Now that values are in hand, produce the full constraint
+    # dictionary
+    constraint_values = dict(constraint_items)
+    constraints = {}
+    for field in deep_look.mode_fields:
+        constraints[field] = (constraint_values[field],) + deep_look.mode_fields[field]
+
+    log.verbose(deep_look.preamble, 'Constraints are:\n', constraints, verbosity=75)
+
+    # Reduce the tables to just those rows that match the mode
+    # specifications,  sorted.
+    mode_rows_old = index_old.select(constraints)
+    mode_rows_new = index_new.select(constraints)
+
+    log.verbose(deep_look.preamble, 'Old reference matching rows:\n', mode_rows_old, verbosity=75)
+    log.verbose(deep_look.preamble, 'New reference matching rows:\n', mode_rows_new, verbosity=75)
+
+    # Check on equality.
+    if mode_equality(mode_rows_old, mode_rows_new):
+        return False, 'Selection rules have executed and the selected rows are the same.'
+    else:
+        return True, 'Selection rules have executed and the selected rows are different.'
+
 def mode_equality(modes_a, modes_b):
     """Check if the modes are equal"""
     
@@ -322,43 +418,10 @@ class DeepLook:
                 if constraint_values[key] in self.metavalues[key]:
                     constraint_values[key] = self.metavalues[key][constraint_values[key]]
 
-        # Read the references
-        data_old = tables.tables(old_reference)[0]   # XXXX currently limited to FITS extension 1
-        data_new = tables.tables(new_reference)[0]
-
-        # Columns must be the same between tables.
-        if sorted(data_old.colnames) != sorted(data_new.colnames):
-            self.message = 'Columns are different between references.'
-            return
-
-        # Now that values are in hand, produce the full constraint
-        # dictionary
-        constraints = {}
-        for field in self.mode_fields:
-            constraints[field] = (constraint_values[field],) + self.mode_fields[field]
-
-        log.verbose(self.preamble, 'Constraints are:\n', constraints, verbosity=75)
-
-        # Reduce the tables to just those rows that match the mode
-        # specifications.
-        mode_rows_old = [repr(row) for row in mode_select(data_old, constraints)]
-        mode_rows_new = [repr(row) for row in mode_select(data_new, constraints)]
-
-        # Sort the rows
-        mode_rows_old.sort()
-        mode_rows_new.sort()
-
-        log.verbose(self.preamble, 'Old reference matching rows:\n', mode_rows_old, verbosity=75)
-        log.verbose(self.preamble, 'New reference matching rows:\n', mode_rows_new, verbosity=75)
-
-        # Check on equality.
-        # That's all folks.
-        self.is_different = not mode_equality(mode_rows_old, mode_rows_new)
-
-        if self.is_different:
-            self.message = 'Selection rules have executed and the selected rows are different.'
-        else:
-            self.message = 'Selection rules have executed and the selected rows are the same.'
+        # Select and compare the mode rows,  memoized for each table swap and mode.
+        constraint_items = tuple(sorted(constraint_values.items()))
+        self.is_different, self.message = compare_mode_rows(
+            self, self.__class__.__name__, old_reference, new_reference, constraint_items)
 
 
 ################################
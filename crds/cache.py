@@ -0,0 +1,252 @@
+"""This module defines crds cache,  a command line tool for managing the size of a CRDS
+cache with the subcommands gc,  migrate-blobs,  and locks.
+
+crds cache gc evicts the least recently used references from the cache until the cached
+references fit within a byte quota,  never evicting the references of the specified or
+configured contexts.   In contrast,  crds sync --purge-references removes every reference
+not used by a set of contexts,  so caches which keep older references grow without bound.
+
+References are ordered by the later of their last use recorded by api.cache_references()
+in the cache access log and their file modification time,  nominally when they were
+downloaded.   Eviction is done while holding the CRDS cache lock from crds_cache_locking
+and the cache reader/writer lock exclusively,  so api.cache_references(),  which holds the
+reader/writer lock shared while locating files and logging their use,  never sees files
+removed from under it.   Every gc run which is not --dry-run compacts the access log.
+
+crds cache migrate-blobs stores each cached reference once by sha1sum in the blob store
+of crds.core.blob_store,  replacing the cached files with links,  and verifies that
+config.locate_file() still finds every reference at the same path with the same size.
+
+crds cache locks lists CRDS locks recorded as owned by processes on this host which have
+exited without releasing them.
+
+>>> files = {"a.fits" : (400, 10.0), "b.fits" : (300, 30.0), "c.fits" : (200, 20.0), "d.fits" : (100, 5.0)}
+>>> plan_eviction(files, 500, pinned={"d.fits"})
+(['a.fits', 'c.fits'], 400)
+>>> plan_eviction(files, 1000, pinned=set())
+([], 1000)
+>>> plan_eviction(files, 50, pinned={"d.fits"})
+(['a.fits', 'c.fits', 'b.fits'], 100)
+"""
+import os
+import time
+
+# ============================================================================
+
+from crds.core import log, config, utils, rmap, cmdline, crds_cache_locking, access_log
+from crds.core import blob_store, cache_manifest
+
+# Temporary files of cache writes older than this many seconds were left by crashed writers.
+_PARTIAL_WRITE_AGE = 86400
+
+# ============================================================================
+
+def plan_eviction(files, quota_bytes, pinned):
+    """Given `files` { basename : (size, last access time) },  return ([basenames to evict],
+    bytes remaining) for evicting the least recently used unpinned files until the
+    total size is at most `quota_bytes`.
+    """
+    remaining = sum(size for (size, _when) in files.values())
+    evict = []
+    candidates = sorted((when, name) for (name, (size, when)) in files.items() if name not in pinned)
+    for _when, name in candidates:
+        if remaining <= quota_bytes:
+            break
+        evict.append(name)
+        remaining -= files[name][0]
+    return evict, remaining
+
+# ============================================================================
+
+class CacheScript(cmdline.ContextsScript):
+    """Command line script for managing the size of the CRDS cache."""
+
+    description = """
+Manages the size of a CRDS cache.
+
+gc evicts the least recently used references until the cached references fit within
+--quota-mb or CRDS_CACHE_QUOTA_MB megabytes.  The references of the specified contexts,
+CRDS_CONTEXT or the operational context by default,  and of CRDS_CACHE_PINNED_CONTEXTS are
+never evicted.   Mappings are never evicted.   gc also removes the temporary files of cache
+writes interrupted more than a day ago.
+
+migrate-blobs stores cached references once by content under <CRDS_PATH>/blobs,  linking
+them from their usual cache paths,  and verifies the cache paths are unchanged.
+
+locks lists locks in CRDS_LOCK_PATH left by processes on this host which have exited.
+"""
+
+    epilog = """
+Evict references not used by the operational context down to a 500G quota:
+
+% crds cache gc --quota-mb 500000
+
+Show what would be evicted keeping the references of the last 5 contexts:
+
+% crds cache gc --quota-mb 500000 --last-n-contexts 5 --dry-run
+
+Store existing references as deduplicated blobs,  then keep doing so for downloads:
+
+% crds cache migrate-blobs
+% setenv CRDS_BLOB_STORE 1
+
+Recency is based on the references used by api.cache_references(),  logged under
+<CRDS_PATH>/access unless CRDS_CACHE_ACCESS_LOG=0,  and otherwise on file times.
+"""
+
+    def add_args(self):
+        super(CacheScript, self).add_args()
+        self.add_argument("command", choices=["gc", "migrate-blobs", "locks"], help="Cache operation to perform.")
+        self.add_argument("--quota-mb", type=int, default=None,
+                          help="Size limit of cached references in megabytes,  defaulting to CRDS_CACHE_QUOTA_MB.")
+        self.add_argument("--dry-run", action="store_true",
+                          help="Report the references which would be evicted without removing them.")
+
+    def main(self):
+        if self.args.command == "gc":
+            self.gc()
+        elif self.args.command == "migrate-blobs":
+            self.migrate_blobs()
+        elif self.args.command == "locks":
+            self.list_stale_locks()
+        return log.errors()
+
+    @property
+    def quota_bytes(self):
+        """Return the configured quota for cached references in bytes."""
+        quota_mb = self.args.quota_mb if self.args.quota_mb is not None else config.CACHE_QUOTA_MB.get()
+        return quota_mb * 2**20
+
+    def pinned_references(self):
+        """Return the set of references,  including GEIS data files,  used by the specified contexts
+        and CRDS_CACHE_PINNED_CONTEXTS.
+        """
+        configured = [self.resolve_context(context.strip())
+                      for context in str(config.CACHE_PINNED_CONTEXTS).split(",") if context.strip()]
+        self.contexts = sorted(set(self.contexts) | set(configured))
+        log.verbose("Pinning references of contexts", self.contexts)
+        pinned = self.get_context_references()
+        return set(pinned) | set(self.get_conjugates(pinned))
+
+    def cached_references(self, access):
+        """Return ({ basename : (size, last access time) },  { basename : path }) for every
+        cached reference,  based on `access` { basename : time } and file modification times.
+        """
+        files, paths = {}, {}
+        for path in rmap.list_references("*", self.observatory, full_path=True):
+            with log.verbose_warning_on_exception("Failed checking cached reference", repr(path)):
+                stat = os.stat(path)
+                name = os.path.basename(path)
+                files[name] = (stat.st_size, max(stat.st_mtime, access.get(name, 0.0)))
+                paths[name] = path
+        return files, paths
+
+    def gc(self):
+        """Evict least recently used references until the cache is within quota."""
+        quota = self.quota_bytes
+        if quota <= 0:
+            log.error("Define a cache quota with --quota-mb or CRDS_CACHE_QUOTA_MB.")
+            return
+        pinned = self.pinned_references()
+        self.remove_partial_writes()
+        accesses = access_log.get_access_log(self.observatory)
+        with crds_cache_locking.get_cache_lock(), crds_cache_locking.get_cache_rw_lock().exclusive():
+            files, paths = self.cached_references(accesses.last_accessed())
+            evict, remaining = plan_eviction(files, quota, pinned)
+            for name in evict:
+                if self.args.dry_run:
+                    log.info("Would evict", repr(name), "size", files[name][0])
+                else:
+                    log.verbose("Evicting", repr(name), "size", files[name][0])
+                    utils.remove(paths[name], observatory=self.observatory)
+            if not self.args.dry_run and config.writable_cache_or_verbose("Skipped compacting access log."):
+                evicted = set(evict)
+                accesses.compact({name: when for (name, (_size, when)) in files.items() if name not in evicted})
+                if evict and os.path.exists(config.get_crds_blobpath()):
+                    blob_store.remove_orphans()
+        evicted_bytes = sum(files[name][0] for name in evict)
+        log.info("Evicted" if not self.args.dry_run else "Would evict", len(evict), "references totalling",
+                 utils.human_format_number(evicted_bytes).strip(), "bytes,  leaving",
+                 utils.human_format_number(remaining).strip(), "bytes of quota",
+                 utils.human_format_number(quota).strip(), "bytes.")
+        if remaining > quota:
+            log.warning("References of pinned contexts", self.contexts, "exceed the cache quota.")
+
+    def remove_partial_writes(self):
+        """Remove the temporary files of cache writes interrupted by crashes more than
+        _PARTIAL_WRITE_AGE seconds ago.
+        """
+        cutoff = time.time() - _PARTIAL_WRITE_AGE
+        for dirpath, _dirs, filenames in os.walk(config.get_crds_path()):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if not utils.ATOMIC_TEMP_RE.match(name):
+                    continue
+                with log.verbose_warning_on_exception("Failed removing partial write", repr(path)):
+                    if os.stat(path).st_mtime < cutoff:
+                        if self.args.dry_run:
+                            log.info("Would remove partial write", repr(path))
+                        else:
+                            log.verbose("Removing partial write", repr(path))
+                            os.remove(path)
+
+    def migrate_blobs(self):
+        """Store every cached reference in the blob store,  linked from its cache path,  and
+        verify that config.locate_file() still locates each reference at its prior path.
+        """
+        if not config.writable_cache_or_verbose("Skipped migrating references to blob store."):
+            return
+        located = {}
+        for path in rmap.list_references("*", self.observatory, full_path=True):
+            name = os.path.basename(path)
+            with log.error_on_exception("Failed locating reference", repr(path)):
+                located[name] = (config.locate_file(name, self.observatory), path, os.stat(path).st_size)
+        manifest = cache_manifest.get_manifest(self.observatory)
+        blobs = {}
+        with crds_cache_locking.get_cache_lock():
+            for name, (_location, path, _size) in sorted(located.items()):
+                with log.error_on_exception("Failed storing", repr(path), "in blob store"):
+                    sha1sum = manifest.verified_sha1sum(path) if manifest is not None else None
+                    blobs[name] = blob_store.store(path, sha1sum)
+                    log.verbose("Stored", repr(path), "as", repr(blobs[name]), verbosity=60)
+        self.verify_blobs(located, blobs)
+        stored = {blob for blob in blobs.values() if blob is not None}
+        total = sum(size for (_location, _path, size) in located.values())
+        unique = sum(os.stat(blob).st_size for blob in stored)
+        log.info("Stored", len(located), "references as", len(stored), "blobs of",
+                 utils.human_format_number(total).strip(), "bytes,  deduplicated to",
+                 utils.human_format_number(unique).strip(), "bytes.")
+
+    def verify_blobs(self, located, blobs):
+        """Verify that each reference of `located` { basename : (prior locate_file() path,  listed
+        path,  size) } is still located at the same path with the same size,  and is linked to
+        its blob in `blobs` { basename : blob path or None }.
+        """
+        for name, (location, path, size) in sorted(located.items()):
+            with log.error_on_exception("Failed verifying", repr(name)):
+                new_location = config.locate_file(name, self.observatory)
+                if new_location != location:
+                    log.error("Location of", repr(name), "changed from", repr(location), "to", repr(new_location))
+                elif not os.path.exists(path) or os.stat(path).st_size != size:
+                    log.error("Reference", repr(path), "is missing or changed size after migration.")
+                elif blobs.get(name) is not None and not os.path.samefile(path, blobs[name]):
+                    log.error("Reference", repr(path), "is not linked to blob", repr(blobs[name]))
+
+    def list_stale_locks(self):
+        """Warn about each lock whose owner on this host has exited."""
+        stale = crds_cache_locking.find_stale_locks()
+        for path, owner in stale:
+            log.warning("Lock", repr(path), "is stale,  owned by exited", crds_cache_locking.format_owner(owner))
+        log.info("Found", len(stale), "stale locks in", repr(config.CACHE_LOCK_PATH.get()))
+
+# ============================================================================
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds import cache
+    return doctest.testmod(cache)
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(CacheScript()())
@@ -8,6 +8,7 @@ import os
 from collections import defaultdict
 import gc
 import uuid
+import multiprocessing
 
 import numpy as np
 
@@ -27,6 +28,7 @@ from crds.refactoring import refactor
 from . import mapping_parser
 from . import validators
 from . import reftypes
+from . import result_cache
 
 # ============================================================================
 
@@ -332,7 +334,7 @@ class ReferenceCertifier(Certifier):
             if old_reference is None or old_reference == self.basename:
                 # Load tables modes anyway,  looking for duplicate modes.
                 for tab in tables.tables(self.filename):
-                    table_mode_dictionary("new reference", tab, self.mode_columns)
+                    TableModes("new reference", tab, self.mode_columns)
                 log.warning("No comparison reference for", repr(self.basename), 
                             "in context", repr(self.context) + ". Skipping tables comparison.")
                 return
@@ -402,44 +404,55 @@ class ReferenceCertifier(Certifier):
         old_reference_ex = old_table.basename + "[" + str(old_table.segment) + "]"
         log.verbose("Checking tables modes of '{}' against comparison reference '{}'".format(
             new_reference_ex, old_reference_ex))
-        old_modes, old_all_cols = table_mode_dictionary("old reference", old_table, self.mode_columns)
+        old_index = TableModes("old reference", old_table, self.mode_columns)
+        old_modes = old_index.modes
         if not old_modes:
             log.info("No modes defined in comparison reference", repr(old_reference_ex), 
                      "for keys", repr(self.mode_columns))
             return
-        new_modes, new_all_cols = table_mode_dictionary("new reference", new_table, self.mode_columns)
+        new_index = TableModes("new reference", new_table, self.mode_columns)
+        new_modes = new_index.modes
         if not new_modes:
             log.info("No modes defined in new reference", repr(new_reference_ex), "for keys", 
                      repr(self.mode_columns))
             return
-        old_sample = list(old_modes.values())[0]
-        new_sample = list(new_modes.values())[0]
-        if len(old_sample) != len(new_sample) or old_all_cols != new_all_cols:
+        if old_index.all_cols != new_index.all_cols:
             log.warning("Change in row format betwween", repr(old_reference_ex), "and", repr(new_reference_ex))
-            log.verbose("Old sample:", repr(old_sample))
-            log.verbose("New sample:", repr(new_sample))
+            log.verbose("Old sample:", repr(old_index.row(list(old_modes.values())[0])))
+            log.verbose("New sample:", repr(new_index.row(list(new_modes.values())[0])))
             return
+        # Compare the rows of all common modes at once,  only changed modes are compared field by field.
+        common = [mode for mode in old_modes if mode in new_modes]
+        changed = changed_rows(old_table, [old_modes[mode] for mode in common],
+                               new_table, [new_modes[mode] for mode in common])
+        changed_modes = { mode for (mode, is_changed) in zip(common, changed) if is_changed }
         for mode in sorted(old_modes):
             if mode not in new_modes:
                 log.warning("Table mode", mode, "from old reference", repr(old_reference_ex),
                             "is NOT IN new reference", repr(new_reference_ex))
-                log.verbose("Old:", repr(old_modes[mode]), verbosity=60)
+                if log.should_output(verbosity=60):
+                    log.verbose("Old:", repr(old_index.row(old_modes[mode])), verbosity=60)
                 continue
-            # modes[mode][0] is row_no,  modes[mode][1] is row value
-            diffs = self.compare_row_values(mode, old_modes[mode][1], new_modes[mode][1])
+            if mode in changed_modes:
+                # row(mode)[0] is row_no,  row(mode)[1] is row value
+                diffs = self.compare_row_values(
+                    mode, old_index.row(old_modes[mode])[1], new_index.row(new_modes[mode])[1])
+            else:
+                diffs = 0
             if not diffs:
                 log.verbose("Mode", mode, "of", repr(new_reference_ex), 
                             "has same values as", repr(old_reference_ex),  verbosity=60)
             else:
                 log.verbose("Mode change", mode, "between", repr(old_reference_ex), "and", 
                             repr(new_reference_ex))
-                log.verbose("Old:", repr(old_modes[mode]), verbosity=60)
-                log.verbose("New:", repr(new_modes[mode]), verbosity=60)
+                log.verbose("Old:", repr(old_index.row(old_modes[mode])), verbosity=60)
+                log.verbose("New:", repr(new_index.row(new_modes[mode])), verbosity=60)
         for mode in sorted(new_modes):
             if mode not in old_modes:
                 log.info("Table mode", mode, "of new reference", repr(new_reference_ex),
                          "is NOT IN old reference", repr(old_table.basename))
-                log.verbose("New:", repr(new_modes[mode]), verbosity=60)
+                if log.should_output(verbosity=60):
+                    log.verbose("New:", repr(new_index.row(new_modes[mode])), verbosity=60)
                 
     def compare_row_values(self, mode, old_row, new_row):
         """Compare key value tuple list `old_row` to `new_row` for key value tuple list `mode`.
@@ -485,36 +498,154 @@ def find_governing_rmap(context, reference):
 
 # ============================================================================
 
+class TableModes:
+    """Index of the distinct modes of crds.tables `tab` where the columns named by `mode_keys`
+    define each row's mode.   Creating the index logs the mode columns and warns about duplicate modes.
+
+    self.modes is { ((mode_col, mode_val), ...) : row_no, ... } for the first row of each mode.
+
+    When the mode columns are simple 1-D arrays,  modes are keyed and duplicates found with numpy
+    sort/unique on integer codes of the column values rather than row by row in Python.
+    """
+    def __init__(self, generic_name, tab, mode_keys):
+        self.table = tab
+        self.all_cols = [name.upper() for name in tab.colnames]
+        self.modes = {}
+        basename = repr(os.path.basename(tab.filename) + "[{}]".format(tab.segment))
+        log.info("Mode columns defined by spec for", generic_name, basename, "are:", repr(mode_keys))
+        log.info("All column names for this table", generic_name, basename, "are:", repr(self.all_cols))
+        log.info("Checking for duplicate modes using intersection", sorted(list(set(mode_keys)&set(self.all_cols))))
+        # Table row keys can vary by extension.  Have CRDS support a simple model of using
+        # whichever mode_keys are present in a given table.
+        present_keys = [key for key in mode_keys if key in self.all_cols]
+        if len(tab.rows) and not present_keys:
+            log.info("Empty actual mode in", generic_name, basename, "with candidate mode columns", mode_keys)
+            self.all_cols = []
+            return
+        mode_columns = tab.load_columns(present_keys)
+        groups = _mode_groups(mode_columns)
+        if groups is None:
+            groups = _mode_groups_by_row(mode_columns)
+        first_rows = [rows[0] for rows in groups]
+        mode_values = [_row_values(column, first_rows) for column in mode_columns]
+        mode_rows = {}
+        for rows, values in zip(groups, zip(*mode_values)):
+            mode_rows[tuple(zip(present_keys, values))] = rows
+        for mode in sorted(mode_rows):
+            if len(mode_rows[mode]) > 1:
+                log.warning("Duplicate definitions in", generic_name, basename, "for mode:", mode, ":\n",
+                            "\n".join([repr(self.row(i)) for i in mode_rows[mode]]))
+        # mode_rows[mode][0] is first instance of multiply defined mode.
+        self.modes = { mode : rows[0] for mode, rows in mode_rows.items() }
+
+    def row(self, row_no):
+        """Return (row_no, ((col_name, value), ...)) for the entire row `row_no`."""
+        return (row_no, tuple(zip(self.all_cols, (handle_nan(v) for v in self.table.rows[row_no]))))
+
+    def to_dict(self):
+        """Return { mode : (row_no, ((col_name, value), ...)), ... } for the first row of each mode."""
+        return { mode : self.row(row_no) for mode, row_no in self.modes.items() }
+
 def table_mode_dictionary(generic_name, tab, mode_keys):
     """Returns ({ (mode_val,...) : (row_no, (entire_row_values, ...)) },  [col_name, ...] ) 
     for crds.tables `tab` where column names `mode_keys` define the  columns to select for mode values.
     """
-    all_cols = [name.upper() for name in tab.colnames]
-    basename = repr(os.path.basename(tab.filename) + "[{}]".format(tab.segment))
-    log.info("Mode columns defined by spec for", generic_name, basename, "are:", repr(mode_keys))
-    log.info("All column names for this table", generic_name, basename, "are:", repr(all_cols))
-    log.info("Checking for duplicate modes using intersection", sorted(list(set(mode_keys)&set(all_cols))))
+    modes = TableModes(generic_name, tab, mode_keys)
+    return modes.to_dict(), modes.all_cols
+
+def _mode_groups(columns):
+    """Group the rows of `columns` by their mode values using numpy sort/unique.
+
+    Returns [ [row_no, ...], ... ] with rows and groups in order of first appearance,  or None
+    if any column cannot be grouped this way.
+    """
+    codes = []
+    for column in columns:
+        values = _mode_values(column)
+        if values is None:
+            return None
+        codes.append(np.unique(values, return_inverse=True)[1].reshape(-1))
+    if not codes or not len(codes[0]):
+        return []
+    _unique, first_rows, inverse, counts = np.unique(
+        np.stack(codes, axis=1), axis=0, return_index=True, return_inverse=True, return_counts=True)
+    groups = [[row] for row in first_rows.tolist()]
+    if np.any(counts > 1):
+        by_mode = np.argsort(inverse.reshape(-1), kind="stable")
+        for mode_no, rows in enumerate(np.split(by_mode, np.cumsum(counts)[:-1])):
+            if len(rows) > 1:
+                groups[mode_no] = rows.tolist()
+    return sorted(groups)
+
+def _mode_groups_by_row(columns):
+    """Group the rows of `columns` by their mode values one row at a time."""
     modes = defaultdict(list)
-    for i, row in enumerate(tab.rows):
-        new_row = tuple(zip(all_cols, (handle_nan(v) for v in row)))
-        rowdict = dict(new_row)
-        # Table row keys can vary by extension.  Have CRDS support a simple model of using
-        # whichever mode_keys are present in a given row.
-        mode = tuple((key, rowdict[key]) for key in mode_keys if key in rowdict)
-        if not mode:
-            log.info("Empty actual mode in", generic_name, basename, "with candidate mode columns", mode_keys)
-            return {}, []
-        modes[mode].append((i, new_row))
-    for mode in sorted(modes.keys()):
-        if len(modes[mode]) > 1:
-            log.warning("Duplicate definitions in", generic_name, basename, "for mode:", mode, ":\n", 
-                        "\n".join([repr(row) for row in modes[mode]]))
-    # modes[mode][0] is first instance of multiply defined mode.
-    return { mode:modes[mode][0] for mode in modes }, all_cols
+    for i, values in enumerate(zip(*columns)):
+        modes[tuple(handle_nan(v) for v in values)].append(i)
+    return list(modes.values())
+
+# dtypes of values which handle_nan() maps to 'nan'
+_NAN_DTYPES = (np.dtype(np.float32), np.dtype(np.float64), np.dtype(np.longdouble))
+
+def _mode_values(column):
+    """Return table `column` as a plain 1-D array whose values are equal IFF the corresponding
+    handle_nan() row values are equal,  or None if there is no such array.
+    """
+    if isinstance(column, np.ma.MaskedArray) or column.ndim != 1:
+        return None
+    if column.dtype.kind in "SU":
+        # chararray elements are stripped of trailing whitespace when accessed as row values.
+        return np.char.rstrip(column) if isinstance(column, np.char.chararray) else np.asarray(column)
+    if column.dtype.kind in "biu" or column.dtype in _NAN_DTYPES:
+        return np.asarray(column)
+    return None
+
+def _row_values(column, rows):
+    """Return [handle_nan(column[i]) for i in rows] without indexing `column` row by row."""
+    if not len(rows):
+        return []
+    values = column[np.asarray(rows)]
+    if isinstance(values, np.char.chararray) and values.ndim == 1:
+        return np.char.rstrip(np.asarray(values)).tolist()   # like accessing each chararray element
+    if isinstance(values, np.ma.MaskedArray) or values.ndim != 1:
+        return [handle_nan(column[i]) for i in rows]
+    values = list(values)
+    if values and isinstance(values[0], (np.float32, np.float64, np.longdouble)):
+        values = [handle_nan(value) for value in values]
+    return values
+
+def changed_rows(old_table, old_rows, new_table, new_rows):
+    """Return a bool array which is True where row old_rows[i] of crds.tables `old_table` has different
+    values than row new_rows[i] of `new_table`,  comparing values like compare_row_values().
+    """
+    changed = np.zeros(len(old_rows), dtype=bool)
+    if not len(old_rows):
+        return changed
+    old_rows, new_rows = np.asarray(old_rows), np.asarray(new_rows)
+    for old_column, new_column in zip(old_table.load_columns(), new_table.load_columns()):
+        changed |= _changed_values(old_column[old_rows], new_column[new_rows])
+    return changed
+
+def _changed_values(old, new):
+    """Return a bool array which is True where np.any(handle_nan(old[i]) != handle_nan(new[i]))."""
+    vectorized = (not isinstance(old, np.ma.MaskedArray) and not isinstance(new, np.ma.MaskedArray) and
+                  old.shape[1:] == new.shape[1:] and
+                  isinstance(old, np.char.chararray) == isinstance(new, np.char.chararray) and
+                  (old.dtype.kind == new.dtype.kind and old.dtype.kind in "SU" or
+                   old.dtype.kind in "biuf" and new.dtype.kind in "biuf"))
+    if not vectorized:
+        return np.array([bool(np.any(handle_nan(old_value) != handle_nan(new_value)))
+                         for old_value, new_value in zip(old, new)], dtype=bool)
+    changed = np.asarray(old != new)
+    if changed.ndim > 1:
+        changed = changed.reshape(len(changed), -1).any(axis=1)
+    elif old.dtype in _NAN_DTYPES and new.dtype in _NAN_DTYPES:
+        changed &= ~(np.isnan(old) & np.isnan(new))
+    return changed
 
 def handle_nan(var):
     """Map nan values to 'nan' so that 'nan' == 'nan'."""
-    if isinstance(var, (np.float32, np.float64, np.float128)) and np.isnan(var):
+    if isinstance(var, (np.float32, np.float64, np.longdouble)) and np.isnan(var):
         return 'nan'
     elif isinstance(var, np.ndarray) and var.shape == () and np.any(np.isnan(var)):
         return 'nan'
@@ -750,7 +881,7 @@ def certify_file(filename, context=None, dump_provenance=False, check_references
                  compare_old_reference=False,
                  dont_parse=False, script=None, observatory=None,
                  comparison_reference=None, original_name=None, ith="",
-                 run_fitsverify=False):
+                 run_fitsverify=False, certify_cache=None):
     """Certify the list of `files` relative to .pmap `context`.   Files can be
     references or mappings.   This function primarily provides an interface for web code.
     
@@ -762,6 +893,7 @@ def certify_file(filename, context=None, dump_provenance=False, check_references
     dont_parse:             bool,  if True,  don't run parser to scan mappings for duplicate keys.
     script:                 command line Script instance
     original_name:          browser-side name of file if any, files 
+    certify_cache:          optional CertifyResultCache used to replay results for unchanged references.
     """    
     trap = log.error_on_exception if script is None else script.error_on_exception
         
@@ -790,8 +922,14 @@ def certify_file(filename, context=None, dump_provenance=False, check_references
                           original_name=original_name,
                           run_fitsverify=run_fitsverify)
 
-        with trap(filename, "Validation error"):
-            certifier.certify()
+        def certify():
+            with trap(filename, "Validation error"):
+                certifier.certify()
+
+        if certify_cache is not None and config.is_reference(filename):
+            certify_cache.certify(filename, original_name, certify)
+        else:
+            certify()
 
 def get_certifier_class(original_name, filepath):
     """Given a reference file name with a valid extension, return the filetype and 
@@ -814,7 +952,7 @@ def get_certifier_class(original_name, filepath):
 def certify_files(files, context=None, dump_provenance=False, check_references=False, 
                   compare_old_reference=False, dont_parse=False, skip_banner=False, 
                   script=None, observatory=None, comparison_reference=None, 
-                  run_fitsverify=False, check_rmap=True):
+                  run_fitsverify=False, check_rmap=True, jobs=1, certify_cache=False):
     """Check the specified list of reference or mapping `files` paths.
     
     files:                  full paths of references or mappings to check
@@ -828,19 +966,24 @@ def certify_files(files, context=None, dump_provenance=False, check_references=F
     observatory:            e.g. 'jwst' or 'hst'
     comparison_reference:   filepath to use for table comparison rather than finding in `context`.
     check_rmap:             run trial rmap update to check for overlapping reference cases. 
+    jobs:                   number of worker processes used to certify files in parallel.
+    certify_cache:          bool,  if True,  replay cached results for references certified before.
     """
     trap = log.error_on_exception if script is None else script.error_on_exception
-    for fnum, filename in enumerate(files):
-        
-        if not skip_banner:
-            banner()
-        
-        ith = ' (' + str(fnum+1) + '/' + str(len(files)) + ')'
-        
-        certify_file(
-            filename, context=context, dump_provenance=dump_provenance, check_references=check_references, 
-            compare_old_reference=compare_old_reference, dont_parse=dont_parse, script=script, observatory=observatory,
-            comparison_reference=comparison_reference, ith=ith, run_fitsverify=run_fitsverify)
+    certify_keys = dict(
+        context=context, dump_provenance=dump_provenance, check_references=check_references,
+        compare_old_reference=compare_old_reference, dont_parse=dont_parse, script=script, observatory=observatory,
+        comparison_reference=comparison_reference, run_fitsverify=run_fitsverify)
+    if certify_cache:
+        certify_keys["certify_cache"] = get_certify_cache(files, certify_keys)
+
+    if jobs > 1 and len(files) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        _certify_files_parallel(files, certify_keys, jobs, skip_banner)
+    else:
+        for fnum, filename in enumerate(files):
+            if not skip_banner:
+                banner()
+            certify_file(filename, ith=_ith(fnum, files), **certify_keys)
         
     if check_rmap: # Requires checking all files in parallel, hence not in certify_file()
         if not skip_banner:
@@ -851,6 +994,72 @@ def certify_files(files, context=None, dump_provenance=False, check_references=F
     if not skip_banner:
         banner()
 
+def get_certify_cache(files, certify_keys):
+    """Return the CertifyResultCache for certifying `files` with certify_file() parameters
+    `certify_keys`,  keyed on all parameters and settings which affect certify results.
+    """
+    observatory, script = certify_keys["observatory"], certify_keys["script"]
+    if observatory is None:
+        observatory = utils.file_to_observatory(files[0]) if files else "none"
+    options = { key : value for (key, value) in certify_keys.items() if key != "script" }
+    comparison_reference = certify_keys["comparison_reference"]
+    if comparison_reference:
+        options["comparison_reference_sha1"] = utils.checksum(comparison_reference)
+    for setting in [config.ALLOW_SCHEMA_VIOLATIONS, config.FITS_VERIFY_CHECKSUM,
+                    config.FITS_IGNORE_MISSING_END]:
+        options[setting.env_var] = setting.get()
+    if script is not None:
+        options["max_errors_per_class"] = script.args.max_errors_per_class
+        options["unique_delimiter"] = script.args.unique_delimiter
+    path = config.get_crds_certify_cachepath(observatory)
+    log.verbose("Using certify result cache at", repr(path))
+    return result_cache.CertifyResultCache(path, options, script=script)
+
+def _ith(fnum, files):
+    """Return the ' (i/N)' progress suffix for file number `fnum` of `files`."""
+    return ' (' + str(fnum+1) + '/' + str(len(files)) + ')'
+
+# Parallel certification forks worker processes which inherit the loaded context and
+# command line script from the parent.   Each worker certifies one file at a time with
+# its log output captured,  returning the captured messages and tracked errors to the
+# parent which replays them in input order.   Message counts and tracked errors are
+# merged into the parent as each file is replayed.
+
+_WORKER_CERTIFY_KEYS = None   # certify_file() keyword parameters inherited by forked workers
+
+def _certify_files_parallel(files, certify_keys, jobs, skip_banner):
+    """Certify `files` using `jobs` forked worker processes,  replaying their output in order."""
+    global _WORKER_CERTIFY_KEYS
+    context, script = certify_keys["context"], certify_keys["script"]
+    if context:
+        with log.verbose_warning_on_exception("Failed preloading context", repr(context)):
+            crds.get_cached_mapping(context)   # load once,  shared by forked workers
+    log.verbose("Certifying", len(files), "files using", jobs, "worker processes.")
+    _WORKER_CERTIFY_KEYS = certify_keys
+    try:
+        with multiprocessing.get_context("fork").Pool(min(jobs, len(files))) as pool:
+            jobs_in_order = [(fnum, filename, _ith(fnum, files)) for (fnum, filename) in enumerate(files)]
+            for captured, tracking in pool.imap(_certify_file_worker, jobs_in_order):
+                if not skip_banner:
+                    banner()
+                log.replay(captured)
+                if script is not None:
+                    script.merge_error_tracking(tracking)
+    finally:
+        _WORKER_CERTIFY_KEYS = None
+
+def _certify_file_worker(job):
+    """Certify one file in a worker process,  returning (CapturedMessages, tracked errors or None)."""
+    fnum, filename, ith = job
+    script = _WORKER_CERTIFY_KEYS["script"]
+    if script is not None:
+        script.clear_error_counts()
+    trap = log.error_on_exception if script is None else script.error_on_exception
+    with log.capture() as captured:
+        with trap(filename, "Failed certifying"):
+            certify_file(filename, ith=ith, **_WORKER_CERTIFY_KEYS)
+    return captured, (script.get_error_tracking() if script is not None else None)
+
 # ============================================================================
 
 @memory_cleanup
@@ -972,6 +1181,12 @@ For more information on the checks being performed,  use --verbose or --verbosit
                           help="Run fitsverify for additional external checks on FITS files. cfitsio library must be installed separately.")
         self.add_argument("-u", "--check-rmap-updates", action="store_true",
                           help="Do a dry-run of adding reference files to the appropriate rmaps to detect errors.")
+        self.add_argument("-j", "--jobs", type=int, default=1, metavar="N",
+                          help="Certify files in N parallel worker processes,  output is still reported in file order.")
+        self.add_argument("--certify-cache", action="store_true",
+                          help="Replay cached results for references already certified with the same contents,  context, and options.  Also enabled by CRDS_CERTIFY_CACHE=1.")
+        self.add_argument("--no-certify-cache", action="store_true",
+                          help="Fully certify every file,  ignoring --certify-cache and CRDS_CERTIFY_CACHE.")
 
         
         cmdline.UniqueErrorsMixin.add_args(self)
@@ -1020,7 +1235,9 @@ For more information on the checks being performed,  use --verbose or --verbosit
                       dont_parse=self.args.dont_parse,
                       script=self, observatory=self.observatory,
                       run_fitsverify=self.args.run_fitsverify,
-                      check_rmap=self.args.check_rmap_updates)
+                      check_rmap=self.args.check_rmap_updates,
+                      jobs=self.args.jobs,
+                      certify_cache=(self.args.certify_cache or config.CERTIFY_CACHE.get()) and not self.args.no_certify_cache)
     
         self.dump_unique_errors()
         return log.errors()
@@ -0,0 +1,126 @@
+"""This module defines an opt-in cache of crds.certify results for reference files so that
+re-certifying an unchanged file,  e.g. before submission,  at submission,  and after a context
+change,  replays the messages of the prior run instead of re-validating the file.
+
+Results are keyed by the sha1 of the reference file's contents,  its name,  the comparison
+context,  the CRDS version,  and the certify options which affect its output.   Each result
+records whether the file passed along with the log messages and tracked errors issued while
+validating it.   Results are stored one file per key so that parallel certify workers never
+write the same file,  and each is written to a temporary file and renamed into place.
+
+>>> import tempfile
+>>> from crds.core import log
+>>> log.set_test_mode()
+>>> cache = CertifyResultCache(tempfile.mkdtemp(), options=dict(context="hst.pmap"))
+>>> filename = os.path.join(tempfile.mkdtemp(), "some_reference.fits")
+>>> with open(filename, "w+") as handle:
+...     _ = handle.write("some contents")
+>>> def certify():
+...     log.warning("Something looks odd.")
+>>> cache.certify(filename, filename, certify)
+CRDS - WARNING -  Something looks odd.
+>>> cache.certify(filename, filename, lambda: None)
+CRDS - WARNING -  Something looks odd.
+>>> cache.get(cache.key(filename, filename))["passed"]
+True
+"""
+import os
+import pickle
+import tempfile
+
+# ===================================================================
+
+import crds
+from crds.core import log, utils, config
+
+# ===================================================================
+
+class CertifyResultCache:
+    """Stores certify results for reference files in directory `path`.
+
+    options:   dict of certify parameters and settings which affect certify results.
+    script:    optional UniqueErrorsMixin script whose tracked errors are cached and replayed.
+    """
+    def __init__(self, path, options, script=None):
+        self.path = path
+        self.script = script
+        self.options = repr(sorted(options.items())) + crds.__version__
+
+    def key(self, filename, original_name):
+        """Return the cache key of the result of certifying `filename` as `original_name`."""
+        return utils.str_checksum(repr((utils.checksum(filename), filename, original_name,
+                                        log.get_verbose(), self.options)))
+
+    def result_path(self, key):
+        """Return the path of the result file for `key`."""
+        return os.path.join(self.path, key[:2], key + ".pkl")
+
+    def get(self, key):
+        """Return the cached result dict for `key` or None."""
+        path = self.result_path(key)
+        if not os.path.exists(path):
+            return None
+        with log.verbose_warning_on_exception("Failed loading certify result", repr(path)):
+            with open(path, "rb") as handle:
+                return pickle.load(handle)
+        return None
+
+    def put(self, key, result):
+        """Save the result dict for `key`,  replacing any prior result."""
+        path = self.result_path(key)
+        if not config.writable_cache_or_verbose("Skipped saving certify result", repr(path)):
+            return
+        with log.verbose_warning_on_exception("Failed saving certify result", repr(path)):
+            utils.ensure_dir_exists(path)
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(handle, "wb") as temp:
+                    pickle.dump(result, temp, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, path)
+            except Exception:
+                os.remove(temp_path)
+                raise
+
+    def certify(self, filename, original_name, certify_func):
+        """Replay the cached result of certifying `filename` as `original_name`,  or call
+        `certify_func()` to certify it,  caching and then replaying its result.
+        """
+        key = None
+        with log.verbose_warning_on_exception("Failed computing certify result key for", repr(filename)):
+            key = self.key(filename, original_name)
+        if key is None:
+            return certify_func()
+        result = self.get(key)
+        if result is None:
+            result = self._certify(certify_func)
+            self.put(key, result)
+        else:
+            log.verbose("Replaying cached certify result for", repr(original_name))
+        log.replay(result["captured"])
+        if self.script is not None:
+            self.script.merge_error_tracking(result["tracking"])
+
+    def _certify(self, certify_func):
+        """Call `certify_func()` capturing its log messages and tracked errors.  Return result dict."""
+        script = self.script
+        if script is not None:
+            saved_tracking = script.get_error_tracking()
+            script.clear_error_counts()
+        try:
+            with log.capture() as captured:
+                certify_func()
+            tracking = script.get_error_tracking() if script is not None else None
+        finally:
+            if script is not None:
+                script.clear_error_counts()
+                script.merge_error_tracking(saved_tracking)
+        return dict(passed=captured.errors == 0, captured=captured, tracking=tracking)
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.certify import result_cache
+    return doctest.testmod(result_cache)
+
+if __name__ == "__main__":
+    print(test())
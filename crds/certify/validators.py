@@ -18,6 +18,7 @@ from crds.core.exceptions import MissingKeywordError, IllegalKeywordError
 from crds.core.exceptions import TpnDefinitionError, RequiredConditionError
 from crds.core.exceptions import BadKernelSumError, BadKernelCenterPixelTooSmall
 from crds.io import tables
+from crds.io.fits import hdu_shape_dtype
 from crds import data_file
 
 from . import generic_tpn, validator_helpers
@@ -50,10 +51,16 @@ class Validator:
     """Validator is an Abstract class that applies TpnInfo objects to reference files.  Each
     Validator handles a single constraint defined in a .tpn file.
     """
+
+    # True for Validators whose value checks depend only on each value,  so table columns
+    # can be checked once per distinct value rather than once per row.
+    vectorized_columns = False
+
     def __init__(self, info):
         self.info = info
         self.name = info.name
         self._presence_condition_code = None
+        self._required_copy = None
 
         if self.info.datatype not in generic_tpn.TpnInfo.datatypes:
             raise ValueError("Bad TPN datatype field " + repr(self.info.presence))
@@ -163,12 +170,53 @@ class Validator:
         for tab in tables.tables(filename):
             if self.name in tab.colnames:
                 column_seen = True
-                # new_values must not be None,  check all, waiting to fail later
-                for i, value in enumerate(tab.columns[self.name]): # compare to TPN values
-                    self.check_value(filename + "[" + str(i) +"]", value)
+                if self.vectorized_columns:
+                    self.check_column_values(filename, tab.column(self.name))
+                else:
+                    self.check_column_rows(filename, tab.column(self.name))
         if not column_seen:
             self.handle_missing(header)
         return True
+
+    def check_column_rows(self, filename, column):
+        """Check each value of `column` in row order,  raising on the first invalid value."""
+        # new_values must not be None,  check all, waiting to fail later
+        for i, value in enumerate(column): # compare to TPN values
+            self.check_value(filename + "[" + str(i) +"]", value)
+
+    def check_column_values(self, filename, column):
+        """Check `column` by conditioning and checking each distinct value once,  mapping failed
+        values back onto rows with numpy.   Raises the same exception as check_column_rows()
+        for the first failing row.   Columns which are not 1D scalars are checked row-by-row.
+        """
+        try:
+            array = np.asarray(column)
+        except (ValueError, TypeError):
+            array = None
+        if array is None or array.ndim != 1 or array.dtype.kind not in "biufUS":
+            return self.check_column_rows(filename, column)
+        uniques, inverse = np.unique(array, return_inverse=True)
+        failed = self.failed_values(filename, uniques)
+        bad_rows = np.flatnonzero(failed[inverse.ravel()])
+        if len(bad_rows):
+            log.verbose("Column", repr(self.name), "of", repr(os.path.basename(filename)),
+                        "has", len(bad_rows), "invalid rows:", list(bad_rows[:100]),
+                        "..." if len(bad_rows) > 100 else "")
+            first = int(bad_rows[0])
+            self.check_value(filename + "[" + str(first) + "]", column[first])  # raises
+        return True
+
+    def failed_values(self, filename, values):
+        """Return a boolean array which is True where the corresponding member of array
+        `values` fails check_value().
+        """
+        failed = np.zeros(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            try:
+                self.check_value(filename, value)
+            except Exception:
+                failed[i] = True
+        return failed
         
     def check_group(self, _filename, _header):
         """Probably related to pre-FITS HST GEIS files,  not implemented."""
@@ -272,12 +320,18 @@ class Validator:
             return True
 
     def get_required_copy(self):
-        """Return a copy of this validator with self.info.presence overridden to R/required."""
-        required = copy.deepcopy(self)
-        idict = required.info._asdict()  # returns OrderedDict,  method is public despite _
-        idict["presence"] = "R"
-        required.info = TpnInfo(*idict.values())
-        return required
+        """Return a copy of this validator with self.info.presence overridden to R/required.
+
+        Since validators are readonly once constructed,  the copy shares the conditioned
+        values and compiled expressions of this validator and is itself cached.
+        """
+        if self._required_copy is None:
+            required = copy.copy(self)
+            idict = required.info._asdict()  # returns OrderedDict,  method is public despite _
+            idict["presence"] = "R"
+            required.info = TpnInfo(*idict.values())
+            self._required_copy = required
+        return self._required_copy
     
 # ----------------------------------------------------------------------------
 
@@ -307,6 +361,9 @@ class KeywordValidator(Validator):
 
 class CharacterValidator(KeywordValidator):
     """Validates values of type Character."""
+
+    vectorized_columns = True
+
     def condition(self, value):
         """Condition a header values by stripping, converting to all uppercase, and replacing
         space with underscore.
@@ -331,11 +388,18 @@ class LogicalValidator(KeywordValidator):
 
     _values = ["T","F"]
 
+    vectorized_columns = True
+
 # ----------------------------------------------------------------------------
 
 class NumericalValidator(KeywordValidator):
     """Check the value of a numerical keyword,  supporting range checking."""
 
+    vectorized_columns = True
+
+    # numpy dtype kinds for which range checks can be applied to raw column values
+    range_kinds = "iuf"
+
     def __init__(self, info, *args, **keys):
         self.is_range = (len(info.values) == 1) and (":" in info.values[0])
         if self.is_range:
@@ -354,6 +418,16 @@ class NumericalValidator(KeywordValidator):
             values = KeywordValidator.condition_values(self, values)
         return values
 
+    def failed_values(self, filename, values):
+        """Range check all `values` at once with numpy,  otherwise check each value."""
+        if not self.is_range or values.dtype.kind not in self.range_kinds:
+            return super(NumericalValidator, self).failed_values(filename, values)
+        conditioned = values.astype(type(self.min))
+        failed = (conditioned < self.min) | (conditioned > self.max)
+        if log.get_verbose():
+            self.verbose(filename, "*", len(values) - failed.sum(), "distinct values are in range", self.info.values[0])
+        return failed
+
     def _check_value(self, filename, value):
         if self.is_range:
             if value < self.min or value > self.max:
@@ -371,6 +445,8 @@ class IntValidator(NumericalValidator):
     """Validates integer values."""
     condition = int
 
+    range_kinds = "iu"   # int() of float columns truncates or fails,  check those value-by-value
+
 # ----------------------------------------------------------------------------
 
 class FloatValidator(NumericalValidator):
@@ -585,6 +661,7 @@ class ExpressionValidator(Validator):
         super(ExpressionValidator, self).__init__(info, *args, **keys)
         self._expr = info.values[0]
         self._expr_code = compile(self._expr, repr(self.info), "eval")
+        self._expr_identifiers = expr_identifiers(self._expr)
 
     def _check_value(self, *args, **keys):   
         return True
@@ -598,7 +675,7 @@ class ExpressionValidator(Validator):
         """
         log.verbose("File=" + repr(os.path.basename(filename)), "Checking",
                     repr(self.name), "condition", str(self._expr))
-        for keyword in expr_identifiers(self._expr):
+        for keyword in self._expr_identifiers:
             if header.get(keyword, "UNDEFINED") == "UNDEFINED":
                 log.verbose_warning("Keyword or Array", repr(keyword), 
                                     "is 'UNDEFINED'. Skipping ", repr(self._expr))
@@ -646,36 +723,89 @@ def expr_identifiers(expr):
 # ---------------------------------------------------------------------------
 
 class KernelunityValidator(Validator):
-    """Ensure that every image in the specified array as a sum() near 1.0"""    
+    """Ensure that every image in the specified array as a sum() near 1.0"""
+
+    # Upper bound on the bytes of array data copied at once while summing kernels.
+    chunk_bytes = 2**24
+
     def _check_value(self, *args, **keys):  
         return True
 
     def check_header(self, filename, header):
         """Evalutate the header expression associated with this validator (as its sole value)
         with respect to the given `header`.  Read `header` from `filename` if `header` is None.
+
+        Kernels are indexed as in the transposed array,  i.e. the first two numpy axes
+        of the array define each kernel,  and are summed vectorized over chunks of the
+        (nominally memory mapped) array so memory use scales with `chunk_bytes`,  not the array.
         """
         # super(KernelunityValidator, self).check_header(filename, header)
         array_name = self.complex_name
-        all_data = header[array_name].DATA.transpose()
-        images = int(np.product(all_data.shape[:-2]))
-        images_shape = (images,) + all_data.shape[-2:]
-        images_data = np.reshape(all_data, images_shape)
+        all_data = header[array_name].DATA
+        kernel_shape, kernels_shape = all_data.shape[:2], all_data.shape[2:]
+        images = int(np.prod(kernels_shape))
         log.verbose("File=" + repr(os.path.basename(filename)),
-                   "Checking", len(images_data), repr(array_name), "kernel(s) of size", 
-                    images_data[0].shape, "for individual sums of 1+-1e-6.   Center pixels >= 1.")
-
-        center_0 = images_data.shape[-2]//2
-        center_1 = images_data.shape[-1]//2
-        center_pixels = images_data[..., center_0, center_1]
-        if not np.all(center_pixels >= 1.0):
+                   "Checking", images, repr(array_name), "kernel(s) of size", 
+                    kernel_shape[::-1], "for individual sums of 1+-1e-6.   Center pixels >= 1.")
+
+        kernels = all_data.reshape(kernel_shape + (images,))
+        per_chunk = max(1, self.chunk_bytes // max(1, kernel_shape[0] * kernel_shape[1] * kernels.itemsize))
+        center_ok, first_bad = True, None
+        for start in range(0, images, per_chunk):
+            chunk = kernels[..., start:start+per_chunk]
+            center_ok = center_ok and bool(np.all(chunk[kernel_shape[0]//2, kernel_shape[1]//2] >= 1.0))
+            images_data = np.ascontiguousarray(chunk.transpose()).reshape(chunk.shape[-1], -1)
+            for i, image_sum in self._bad_kernel_sums(all_data, images_data, start):
+                if first_bad is None or i < first_bad[0]:
+                    first_bad = (i, image_sum)
+                break
+        if not center_ok:
             log.warning("Possible bad IPC Kernel:  One or more kernel center pixel value(s) too small, should be >= 1.0")
             # raise BadKernelCenterPixelTooSmall(
             #    "One or more kernel center pixel value(s) too small,  should be >= 1.0")
-                                 
-        for (i, image) in enumerate(images_data):
-            if abs(image.sum()-1.0) > 1.0e-6:
-                raise BadKernelSumError("Kernel sum", image.sum(),
-                    "is not 1+-1e-6 for kernel #" + str(i), ":", repr(image))    
+        if first_bad is not None:
+            i, image_sum = first_bad
+            image = self._kernel_image(all_data, i)
+            raise BadKernelSumError("Kernel sum", image_sum,
+                "is not 1+-1e-6 for kernel #" + str(i), ":", repr(image))    
+
+    def _bad_kernel_sums(self, all_data, images_data, start):
+        """Generate (kernel #, sum) for each row of `images_data` whose sum is not 1+-1e-6,
+        in transposed `all_data` order,  where row 0 is kernel `start` in C order.
+
+        Sums are screened in float64 with a margin for rounding,  then kernels near or
+        outside the limit are summed individually exactly as images were originally.
+        """
+        sums = images_data.sum(axis=1, dtype=np.float64)
+        if images_data.dtype.kind == "f":
+            rounding = images_data.shape[1] * np.finfo(images_data.dtype).eps / 2   # summation error bound
+            margin = rounding * np.abs(images_data).sum(axis=1, dtype=np.float64)
+        else:
+            margin = 0.0
+        candidates = start + np.flatnonzero(np.abs(sums - 1.0) > 1.0e-6 - margin)
+        kernels_shape = all_data.shape[2:]
+        if len(kernels_shape) > 1:
+            numbers = np.ravel_multi_index(
+                np.unravel_index(candidates, kernels_shape), kernels_shape, order="F")
+        else:
+            numbers = candidates
+        for i in np.sort(numbers):
+            image_sum = self._kernel_image(all_data, i).sum()
+            if abs(image_sum - 1.0) > 1.0e-6:
+                yield int(i), image_sum
+
+    def _kernel_image(self, all_data, i):
+        """Return image `i` of the transposed `all_data` as a view,  or for arrays with more than
+        three dimensions,  a contiguous copy,  as the original reshape of the entire array did.
+        """
+        kernels_shape = all_data.shape[2:]
+        if len(kernels_shape) > 1:
+            index = np.unravel_index(i, kernels_shape, order="F")
+            return np.ascontiguousarray(all_data[(Ellipsis,) + tuple(index)].transpose())
+        elif kernels_shape:
+            return all_data[..., i].transpose()
+        else:
+            return all_data.transpose()
 
 # ----------------------------------------------------------------------------
 
@@ -695,25 +825,26 @@ class IsomorphicfitsverValidator(Validator):
         """
         array_name = self.complex_name
         max_ver = 0
-        with data_file.fits_open(filename) as hdus:
+        with data_file.fits_open(filename, checksum=False) as hdus:
             first = dict()
             for hdu in hdus:
                 if hdu.name != self.name:
                     continue
+                shape, dtype = hdu_shape_dtype(hdu)   # from header,  data is not read
                 self.verbose(filename, "ver=" + str(hdu.ver),
-                             "Array has shape=" + str(hdu.data.shape),
-                             "and dtype=" + repr(str(hdu.data.dtype)) + ".")
+                             "Array has shape=" + str(shape),
+                             "and dtype=" + repr(str(dtype)) + ".")
                 if hdu.name not in first:
-                    first[hdu.name] = (hdu.data.shape, hdu.data.dtype)
+                    first[hdu.name] = (shape, dtype)
                 else:
                     expected = first[hdu.name][0]
-                    got = hdu.data.shape
+                    got = shape
                     assert expected == got, \
                         "Shape mismtatch for " + repr((hdu.name, hdu.ver)) + \
                         "relative to" + repr((self.name,1)) + ". Expected " + \
                         str(expected) + " but got " + str(got) + "."
                     expected = first[hdu.name][1]
-                    got = hdu.data.dtype
+                    got = dtype
                     assert expected == got, \
                         "Data type mismtatch for " + \
                         repr((hdu.name,hdu.ver)) + \
@@ -794,12 +925,34 @@ def get_validators(observatory, refpath):
     """Given `observatory` and a path to a reference file `refpath`,  load the
     corresponding validators that define individual constraints that reference
     should satisfy.
+
+    Validators are shared by all references of the same instrument and filekind
+    which have the same extra TpnInfo's,  so they are treated as readonly.
     """
-    tpns = get_reffile_tpninfos(observatory, refpath)
-    checkers = [validator(x) for x in tpns]
+    locator = utils.get_locator_module(observatory)
+    instrument, filekind = locator.get_file_properties(refpath)
+    extra_tpninfos = tuple(locator.get_extra_tpninfos(refpath))
+    checkers = list(get_type_validators(observatory, instrument, filekind, extra_tpninfos))
     log.verbose("Validators for", repr(refpath), "("+str(len(checkers))+"):\n", log.PP(checkers), verbosity=65)
     return checkers
 
+@utils.cached
+def get_type_validators(observatory, instrument, filekind, extra_tpninfos=()):
+    """Return the tuple of Validators for `observatory`,  `instrument`, and `filekind` plus
+    the Validators for tuple `extra_tpninfos`.   Construction compiles each Validator's
+    expressions so caching avoids recompiling them for each reference file certified.
+
+    This function is self-cached.    Clear the cache using clear_cache().
+    """
+    locator = utils.get_locator_module(observatory)
+    tpns = list(locator.get_all_tpninfos(instrument, filekind, "tpn"))
+    tpns.extend(extra_tpninfos)
+    return tuple(validator(x) for x in tpns)
+
+def clear_cache():
+    """Clear the cached Validators."""
+    get_type_validators.cache.clear()
+
 def get_reffile_tpninfos(observatory, refpath):
     """Load just the TpnInfo objects for `observatory` and the given `refpath`.
     This entails both "class" TpnInfo's from CDBS as well as TpnInfo objects
@@ -15,7 +15,7 @@ from urllib import request
 # heavy versions of core CRDS modules defined in one place, client minimally
 # dependent on core for configuration, logging, and  file path management.
 # import crds
-from crds.core import utils, log, config
+from crds.core import utils, log, config, cache_manifest, access_log, blob_store, crds_cache_locking
 from crds.core.log import srepr
 
 from crds.core.exceptions import ServiceError, CrdsLookupError
@@ -199,9 +199,7 @@ def get_sqlite_db(observatory):
     encoded_compressed_data = S.get_sqlite_db(observatory)
     data = zlib.decompress(base64.b64decode(encoded_compressed_data))
     path = config.get_sqlite3_db_path(observatory)
-    utils.ensure_dir_exists(path)
-    with open(path, "wb+") as db_out:
-        db_out.write(data)
+    utils.atomic_write(path, data)
     return path
 
 @utils.cached
@@ -540,8 +538,8 @@ class FileCacher:
         return observatory
 
     def locate(self, name):
-        """Return the standard CRDS cache location for file `name`."""
-        return config.locate_file(name, observatory=self.observatory)
+        """Return the standard local CRDS cache location for file `name`."""
+        return config.relocate_file(name, observatory=self.observatory)
 
     def catalog_file_size(self, name):
         """Return the size of file `name` based on the server catalog."""
@@ -560,8 +558,12 @@ class FileCacher:
                     if "NOT FOUND" in self.info_map[name]:
                         raise CrdsDownloadError("file is not known to CRDS server.")
                     bytes, path = self.catalog_file_size(name), localpaths[name]
-                    log.info(file_progress("Fetching", name, path, bytes, bytes_so_far, total_bytes, nth_file, total_files))
-                    self.download(name, path)
+                    with crds_cache_locking.get_file_lock(name):
+                        if os.path.exists(path) and not self.ignore_cache:
+                            log.verbose("Skipping download of", repr(name), "cached by another process.")
+                        else:
+                            log.info(file_progress("Fetching", name, path, bytes, bytes_so_far, total_bytes, nth_file, total_files))
+                            self.download(name, path)
                     bytes_so_far += os.stat(path).st_size
                 except Exception as exc:
                     if self.raise_exceptions:
@@ -573,24 +575,20 @@ class FileCacher:
     
     def download(self, name, localpath):
         """Download a single file."""
-        # This code is complicated by the desire to blow away failed downloads.  For the specific
-        # case of KeyboardInterrupt,  the file needs to be blown away,  but the interrupt should not
-        # be re-characterized so it is still un-trapped elsewhere under normal idioms which try *not*
-        # to trap KeyboardInterrupt.
+        # Failed downloads,  including KeyboardInterrupt,  are blown away by download_core(),
+        # which only renames complete,  verified downloads to `localpath`.  KeyboardInterrupt
+        # is not re-characterized so it is still un-trapped elsewhere under normal idioms which
+        # try *not* to trap KeyboardInterrupt.
         assert not config.get_cache_readonly(), "Readonly cache,  cannot download files " + repr(name)
         try:
             utils.ensure_dir_exists(localpath)
             return proxy.apply_with_retries(self.download_core, name, localpath)
         except Exception as exc:
-            self.remove_file(localpath)
             raise CrdsDownloadError(
                 "Error fetching data for", srepr(name),
                 "at CRDS server", srepr(get_crds_server()),
                 "with mode", srepr(config.get_download_mode()),
                 ":", str(exc)) from exc
-        except:  #  mainly for control-c,  catch it and throw it.
-            self.remove_file(localpath)
-            raise
         
     def remove_file(self, localpath):
         """Removes file at `localpath`."""
@@ -601,13 +599,26 @@ class FileCacher:
             log.verbose("Exception during file removal of", repr(localpath))
 
     def download_core(self, name, localpath):
-        """Download and verify file `name` under context `pipeline_context` to `localpath`."""
-        if config.get_download_plugin():
-            self.plugin_download(name, localpath)
-        else:
-            generator = self.get_data_http(name)
-            self.generator_download(generator, localpath)
-        self.verify_file(name, localpath)
+        """Download and verify file `name` under context `pipeline_context` to `localpath`.
+
+        The file is written to a hidden temporary file which is renamed to `localpath` only
+        after it is complete,  flushed to disk,  and verified,  so concurrent readers and
+        processes which crash or are killed mid-download never leave a partial file at
+        `localpath`.   Renaming also replaces rather than writes through blob store links.
+        """
+        temp_path = utils.atomic_temp_path(localpath)
+        try:
+            if config.get_download_plugin():
+                self.plugin_download(name, temp_path)
+            else:
+                generator = self.get_data_http(name)
+                self.generator_download(generator, temp_path)
+            self.verify_file(name, temp_path)
+            utils.atomic_rename(temp_path, localpath)
+        finally:
+            if os.path.exists(temp_path):
+                self.remove_file(temp_path)
+        self.store_blob(name, localpath)
         
     def generator_download(self, generator, localpath):
         """Read all bytes from `generator` until file is downloaded to `localpath.`"""
@@ -673,15 +684,34 @@ class FileCacher:
             log.verbose("Skipping sha1sum with CRDS_DOWNLOAD_CHECKSUMS=False")
         elif remote_info["sha1sum"] not in ["", "none"]:
             original_sha1sum = remote_info["sha1sum"]
+            signature = cache_manifest.signature(localpath)
             local_sha1sum = utils.checksum(localpath)
             if original_sha1sum != local_sha1sum:
                 raise CrdsDownloadError(
                     "downloaded file", srepr(filename),
                     "sha1sum", srepr(local_sha1sum),
                     "does not match server sha1sum", srepr(original_sha1sum))
+            self.record_verified(filename, local_sha1sum, signature)
         else:
             log.verbose("Skipping sha1sum check since server doesn't know it.")
 
+    def store_blob(self, name, localpath):
+        """Replace downloaded reference `localpath` with a link to its blob when CRDS_BLOB_STORE is set."""
+        if not config.BLOB_STORE.get() or config.is_mapping(name):
+            return
+        sha1sum = self.info_map[name]["sha1sum"] if config.get_checksum_flag() else None
+        with log.verbose_warning_on_exception("Failed storing", repr(name), "in blob store"):
+            blob_store.store(localpath, sha1sum if sha1sum not in ["", "none"] else None)
+
+    def record_verified(self, name, sha1sum, signature):
+        """Record the verified `sha1sum` of cached file `name` in the cache manifest so
+        crds.sync --check-sha1sum need not re-hash it while unchanged.
+        """
+        manifest = cache_manifest.get_manifest(self.observatory)
+        if manifest is not None:
+            manifest.record(name, sha1sum, signature)
+            manifest.flush()
+
 # ==============================================================================
 
 def dump_mappings3(pipeline_context, ignore_cache=False, mappings=None, raise_exceptions=True):
@@ -775,12 +805,31 @@ def cache_references(pipeline_context, bestrefs, ignore_cache=False):
     """
     wanted = _get_cache_filelist_and_report_errors(bestrefs)
     
-    localrefs = FileCacher(pipeline_context, ignore_cache, raise_exceptions=False).get_local_files(wanted)[0]
+    cacher = FileCacher(pipeline_context, ignore_cache, raise_exceptions=False)
+    shared = {} if ignore_cache else _locate_shared_tier_files(cacher, wanted)
+    with crds_cache_locking.get_cache_rw_lock().shared():   # exclude crds cache gc
+        localrefs = cacher.get_local_files([name for name in wanted if name not in shared])[0]
+        access_log.record_access(cacher.observatory, localrefs)
+    localrefs.update(shared)
 
     refs = _squash_unicode_in_bestrefs(bestrefs, localrefs)
 
     return refs
     
+def _locate_shared_tier_files(cacher, names):
+    """Return { name : path } for the files of `names` which are missing from the local
+    cache but can be read from a shared tier of CRDS_PATH,  rather than downloaded.
+    GEIS headers are only read from a shared tier along with their data files.
+    """
+    shared = {}
+    for name in names:
+        conjugates = [name, name[:-1] + "d"] if re.match(r"\w+\.r[0-9]h$", name) else [name]
+        paths = [config.locate_file(conjugate, cacher.observatory) for conjugate in conjugates]
+        if all(path != cacher.locate(conjugate) and os.path.exists(path)
+               for (conjugate, path) in zip(conjugates, paths)):
+            shared[name] = paths[0]
+    return shared
+
 def _get_cache_filelist_and_report_errors(bestrefs):
     """Compute the list of files to download based on the `bestrefs` dictionary,
     skimming off and reporting errors, and raising an exception on the last error seen.
@@ -0,0 +1,139 @@
+"""This module defines the CRDS cache access log,  a lightweight record of when cached
+references were last used by api.cache_references() which crds cache gc uses to evict the
+least recently used references first.
+
+The log is an append-only text file under the CRDS cache,  <CRDS_PATH>/access/<observatory>
+by default,  with one "<time> <basename>" line per access.   Each process appends all of its
+accesses in a single write and logs a file at most once per _ACCESS_RESOLUTION seconds.
+Each run of crds cache gc compacts the log to the latest access of each remaining file while
+holding the CRDS cache lock and the cache reader/writer lock which api.cache_references() holds
+shared while logging.   Compaction also re-reads any lines appended since the log was read
+before atomically renaming the compacted log into place,  so accesses logged by processes
+which are not locking are not lost either.   Lines torn by concurrent writers on filesystems
+without atomic appends are ignored,  so at worst an access is missed and the reference is
+ordered by its file time.
+
+>>> import tempfile
+>>> access = AccessLog(os.path.join(tempfile.mkdtemp(), "access.log"))
+>>> access.record(["s7g1700gl_dead.fits", "s7g1700ql_dead.fits"], now=1000.0)
+>>> access.record(["s7g1700gl_dead.fits"], now=1030.0)
+>>> access.record(["s7g1700gl_dead.fits"], now=2000.0)
+>>> sorted(access.last_accessed().items())
+[('s7g1700gl_dead.fits', 2000.0), ('s7g1700ql_dead.fits', 1000.0)]
+
+>>> AccessLog(access.path).record(["o1a0000al_dead.fits"], now=3000.0)   # after last_accessed()
+>>> access.compact({"s7g1700ql_dead.fits" : 1000.0})
+>>> sorted(access.last_accessed().items())
+[('o1a0000al_dead.fits', 3000.0), ('s7g1700ql_dead.fits', 1000.0)]
+"""
+import os
+import time
+
+# ===================================================================
+
+from . import log, utils, config
+
+# ===================================================================
+
+ACCESS_LOG_NAME = "access.log"
+
+# Each file is logged at most once per this many seconds by a process.
+_ACCESS_RESOLUTION = 60.0
+
+# ===================================================================
+
+class AccessLog:
+    """Append-only log of the times cached files were used,  at text file `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._recorded = {}   # { basename : time last logged by this process }
+        self._read_offset = None   # end of the log read by last_accessed(),  see compact()
+
+    def record(self, names, now=None):
+        """Log that the files with basenames `names` were used at time `now`."""
+        now = time.time() if now is None else now
+        fresh = [name for name in names if self._recorded.get(name, 0.0) < now - _ACCESS_RESOLUTION]
+        if not fresh:
+            return
+        lines = "".join("{:.0f} {}\n".format(now, name) for name in fresh)
+        utils.ensure_dir_exists(self.path)
+        handle = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(handle, lines.encode("utf-8"))
+        finally:
+            os.close(handle)
+        for name in fresh:
+            self._recorded[name] = now
+
+    def last_accessed(self):
+        """Return { basename : time of latest logged access }."""
+        times = {}
+        self._read_offset = self._read_since(0, times)
+        return times
+
+    def _read_since(self, offset, times):
+        """Update `times` { basename : time } with the complete lines logged from byte `offset` on,
+        returning the offset following the last complete line.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as handle:
+            handle.seek(offset)
+            for line in handle:
+                if not line.endswith(b"\n"):   # being appended now,  read it next time
+                    break
+                offset += len(line)
+                words = line.decode("utf-8", errors="replace").split()
+                if len(words) != 2:
+                    continue
+                try:
+                    when = float(words[0])
+                except ValueError:
+                    continue
+                if when > times.get(words[1], 0.0):
+                    times[words[1]] = when
+        return offset
+
+    def compact(self, times):
+        """Replace the log with the single access time of each file in `times`,
+        { basename : time },  nominally the result of last_accessed() less evicted files,
+        and of each file logged since last_accessed() read the log.   Callers should hold
+        the CRDS cache lock.
+        """
+        times = dict(times)
+        if self._read_offset is not None:
+            self._read_since(self._read_offset, times)
+        with utils.atomic_open(self.path, "w", encoding="utf-8") as handle:
+            for name, when in sorted(times.items()):
+                handle.write("{:.0f} {}\n".format(when, name))
+        self._read_offset = None
+
+# ===================================================================
+
+def get_access_log(observatory):
+    """Return the AccessLog for the cached references of `observatory`."""
+    return _get_access_log(os.path.join(config.get_crds_access_path(observatory), ACCESS_LOG_NAME))
+
+@utils.cached
+def _get_access_log(path):
+    """Return the AccessLog at `path`,  shared within the process."""
+    return AccessLog(path)
+
+def record_access(observatory, names):
+    """Log the use of cached `observatory` files `names` unless disabled by
+    CRDS_CACHE_ACCESS_LOG or the cache is readonly.
+    """
+    if not config.CACHE_ACCESS_LOG.get() or config.get_cache_readonly():
+        return
+    with log.verbose_warning_on_exception("Failed logging cache access for", repr(observatory)):
+        get_access_log(observatory).record([os.path.basename(name) for name in names])
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.core import access_log
+    return doctest.testmod(access_log)
+
+if __name__ == "__main__":
+    print(test())
@@ -0,0 +1,167 @@
+"""This module defines the CRDS blob store,  a content addressed layer beneath cached
+references.   Each distinct reference file is stored once by sha1sum at
+<CRDS_PATH>/blobs/<sha1sum[:2]>/<sha1sum> and the usual cache paths for each reference
+subdirectory mode (flat, instrument),  --output-dir syncs,  and the caches of other
+observatories on the same host are hard links,  or with CRDS_BLOB_LINK_MODE=symlink
+symbolic links,  to the blob.   Identical bytes are then stored once and reorganizing a
+cache only manipulates links.
+
+config.locate_file() is unchanged:  it still returns the mode specific cache path,  which is
+now a link.   Only references are stored as blobs since mappings may be rewritten in place.
+
+Blobs are used for new downloads when CRDS_BLOB_STORE=1,  and existing caches are migrated
+and verified with:
+
+% crds cache migrate-blobs
+
+>>> import tempfile
+>>> old_path = os.environ.get("CRDS_BLOBPATH_SINGLE")
+>>> os.environ["CRDS_BLOBPATH_SINGLE"] = tempfile.mkdtemp()
+>>> cache = tempfile.mkdtemp()
+>>> first, second = os.path.join(cache, "first.fits"), os.path.join(cache, "second.fits")
+>>> for path in [first, second]:
+...     with open(path, "w+") as handle:
+...         _ = handle.write("some contents")
+
+>>> blob = store(first)
+>>> blob == blob_location("53059abba1a72c7aff34a3eaf7fef10ed65541ce")
+True
+>>> store(second) == blob
+True
+>>> linked_blob(first) == linked_blob(second) == blob
+True
+>>> os.stat(blob).st_nlink
+3
+
+>>> third = os.path.join(cache, "instrument", "first.fits")
+>>> relink(first, third)
+>>> os.path.exists(first),  linked_blob(third) == blob
+(False, True)
+
+>>> os.remove(second);  os.remove(third)
+>>> remove_orphans()
+1
+>>> if old_path is None:
+...     del os.environ["CRDS_BLOBPATH_SINGLE"]
+... else:
+...     os.environ["CRDS_BLOBPATH_SINGLE"] = old_path
+"""
+import os
+import glob
+import errno
+import shutil
+
+# ===================================================================
+
+from . import log, utils, config
+
+# ===================================================================
+
+def blob_location(sha1sum):
+    """Return the path of the blob with contents `sha1sum`."""
+    return os.path.join(config.get_crds_blobpath(), sha1sum[:2], sha1sum)
+
+def linked_blob(path):
+    """Return the blob which file `path` links to,  or None if it is not linked to a blob."""
+    blobpath = config.get_crds_blobpath()
+    if os.path.islink(path):
+        target = os.path.realpath(path)
+        return target if target.startswith(blobpath + os.sep) else None
+    stat = os.stat(path)
+    if stat.st_nlink < 2:
+        return None
+    blob = blob_location(utils.checksum(path))
+    if os.path.exists(blob) and os.path.samefile(blob, path):
+        return blob
+    return None
+
+def is_linked(path):
+    """Return True IFF file `path` is a symbolic link or shares its contents with other hard links,
+    so it must be removed rather than written in place.
+    """
+    return os.path.islink(path) or (os.path.exists(path) and os.stat(path).st_nlink > 1)
+
+def store(path, sha1sum=None):
+    """Store the contents of file `path` as a blob,  unless an identical blob already exists,
+    and replace `path` with a link to the blob.   Return the blob path,  or None if `path`
+    cannot be hard linked to the blob store.   `sha1sum` is the known checksum of `path`,
+    computed if None.
+    """
+    if os.path.islink(path):
+        return linked_blob(path)
+    if sha1sum is None:
+        sha1sum = utils.checksum(path)
+    blob = blob_location(sha1sum)
+    symlinks = config.BLOB_LINK_MODE.get() == "symlink"
+    try:
+        if os.path.exists(blob):
+            if symlinks or not os.path.samefile(blob, path):
+                assert os.stat(blob).st_size == os.stat(path).st_size, \
+                    "Blob " + repr(blob) + " size differs from " + repr(path)
+                link(blob, path)
+        else:
+            utils.ensure_dir_exists(blob)
+            if symlinks:
+                with utils.atomic_open(blob, "wb") as output, open(path, "rb") as source:
+                    shutil.copyfileobj(source, output)
+                link(blob, path)
+            else:
+                os.link(path, blob)
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        log.verbose("Cannot hard link", repr(path), "to blob store,  not stored:", str(exc))
+        return None
+    os.chmod(blob, 0o444)
+    return blob
+
+def link(blob, path):
+    """Atomically replace `path` with a link to `blob` of the kind set by CRDS_BLOB_LINK_MODE."""
+    utils.ensure_dir_exists(path)
+    temp = utils.atomic_temp_path(path)
+    if config.BLOB_LINK_MODE.get() == "symlink":
+        os.symlink(blob, temp)
+    else:
+        os.link(blob, temp)
+    os.replace(temp, path)
+
+def relink(old_path, new_path):
+    """Move cached file `old_path` to `new_path` by linking rather than copying data."""
+    utils.ensure_dir_exists(new_path)
+    if os.path.islink(old_path):
+        os.symlink(os.readlink(old_path), new_path)
+    else:
+        try:
+            os.link(old_path, new_path)
+        except OSError as exc:
+            if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.move(old_path, new_path)
+            return
+    os.remove(old_path)
+
+def remove_orphans():
+    """Remove hard linked blobs which are no longer linked from any cache,  returning the
+    number removed.  Blobs of symbolic links are kept since their links cannot be counted.
+    """
+    if config.BLOB_LINK_MODE.get() == "symlink" or not config.writable_cache_or_verbose("Skipped removing orphan blobs."):
+        return 0
+    removed = 0
+    for blob in glob.glob(os.path.join(config.get_crds_blobpath(), "??", "*")):
+        if len(os.path.basename(blob)) != 40:   # skip blobs being stored
+            continue
+        with log.verbose_warning_on_exception("Failed removing orphan blob", repr(blob)):
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+                removed += 1
+    log.verbose("Removed", removed, "orphan blobs.")
+    return removed
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.core import blob_store
+    return doctest.testmod(blob_store)
+
+if __name__ == "__main__":
+    print(test())
@@ -0,0 +1,144 @@
+"""This module defines the CRDS cache integrity manifest,  a record of the sha1sums verified
+for cached files along with the stat signature,  (size, mtime_ns, inode),  of each file when
+it was hashed.   crds.sync --check-sha1sum and downloads record verified sha1sums here so
+that later checks only re-hash files which changed since they were last verified,  or which
+were verified longer ago than an optional age limit.
+
+The manifest is a SQLite database under the CRDS cache,  <CRDS_PATH>/manifest/<observatory>
+by default.   Each batch of updates is a single transaction and SQLite's file locking lets
+concurrent syncs share it;  the default rollback journal is kept for caches on NFS.   Any
+manifest failure simply results in files being hashed again.
+
+>>> import tempfile
+>>> manifest = CacheManifest(os.path.join(tempfile.mkdtemp(), "manifest.sqlite3"))
+>>> filename = os.path.join(tempfile.mkdtemp(), "hst_cos_deadtab_0001.rmap")
+>>> with open(filename, "w+") as handle:
+...     _ = handle.write("some contents")
+
+>>> manifest.verified_sha1sum(filename) is None
+True
+>>> manifest.record(filename, utils.checksum(filename), signature(filename))
+>>> manifest.flush()
+>>> manifest.verified_sha1sum(filename)
+'53059abba1a72c7aff34a3eaf7fef10ed65541ce'
+>>> manifest.verified_sha1sum(filename, max_age=-1) is None
+True
+
+>>> with open(filename, "a") as handle:
+...     _ = handle.write(" and more contents")
+>>> manifest.verified_sha1sum(filename) is None
+True
+"""
+import os
+import time
+import sqlite3
+import threading
+
+# ===================================================================
+
+from . import log, utils, config
+
+# ===================================================================
+
+MANIFEST_NAME = "manifest.sqlite3"
+
+SCHEMA = """
+create table if not exists files (name text primary key, size integer not null, mtime_ns integer not null,
+                                  inode integer not null, sha1sum text not null, verified real not null) without rowid;
+"""
+
+# Seconds to wait for other processes to release the database.
+_TIMEOUT = 60.0
+
+# Verified files are recorded in transactions of this many files.
+_BATCH_SIZE = 1000
+
+# ===================================================================
+
+def signature(path):
+    """Return the stat signature (size, mtime_ns, inode) of the file at `path`."""
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+class CacheManifest:
+    """Record of the verified sha1sums of the cached files at SQLite database file `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._pending = []
+
+    @property
+    def connection(self):
+        """Return this thread's connection to the manifest database,  reconnecting after fork()."""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            if config.get_cache_readonly():
+                local.connection = sqlite3.connect("file:" + self.path + "?mode=ro", uri=True, timeout=_TIMEOUT)
+            else:
+                utils.ensure_dir_exists(self.path)
+                local.connection = sqlite3.connect(self.path, timeout=_TIMEOUT)
+                local.connection.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.connection
+
+    def verified_sha1sum(self, path, max_age=None):
+        """Return the sha1sum verified for the file at `path` if its stat signature is unchanged
+        since then and it was verified no more than `max_age` seconds ago,  otherwise None.
+        """
+        if not os.path.exists(path):
+            return None
+        with log.verbose_warning_on_exception("Failed reading cache manifest", repr(self.path)):
+            row = self.connection.execute(
+                "select size, mtime_ns, inode, sha1sum, verified from files where name = ?",
+                (os.path.basename(path),)).fetchone()
+            if row is None or tuple(row[:3]) != signature(path):
+                return None
+            if max_age is not None and row[4] < time.time() - max_age:
+                return None
+            return row[3]
+        return None
+
+    def record(self, path, sha1sum, sig):
+        """Note that the file at `path` with stat signature `sig`,  taken before it was
+        hashed,  had verified `sha1sum`.   Records are saved in batches by flush().
+        """
+        self._pending.append((os.path.basename(path),) + tuple(sig) + (sha1sum, time.time()))
+        if len(self._pending) >= _BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Save pending records in a single transaction."""
+        pending, self._pending = self._pending, []
+        if not pending or not config.writable_cache_or_verbose("Skipped updating cache manifest."):
+            return
+        with log.verbose_warning_on_exception("Failed updating cache manifest", repr(self.path)):
+            with self.connection as connection:
+                connection.executemany(
+                    "insert or replace into files (name, size, mtime_ns, inode, sha1sum, verified) "
+                    "values (?, ?, ?, ?, ?, ?)", pending)
+            log.verbose("Recorded", len(pending), "verified files in cache manifest", repr(self.path), verbosity=60)
+
+# ===================================================================
+
+def get_manifest(observatory):
+    """Return the CacheManifest for the cached files of `observatory`,  or None if disabled by
+    CRDS_VERIFY_MANIFEST.
+    """
+    if not config.VERIFY_MANIFEST.get():
+        return None
+    return _get_manifest(os.path.join(config.get_crds_manifest_path(observatory), MANIFEST_NAME))
+
+@utils.cached
+def _get_manifest(path):
+    """Return the CacheManifest at `path`,  shared within the process."""
+    return CacheManifest(path)
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.core import cache_manifest
+    return doctest.testmod(cache_manifest)
+
+if __name__ == "__main__":
+    print(test())
@@ -0,0 +1,244 @@
+"""This module implements tiered,  read-through CRDS caches,  where CRDS_PATH lists a
+local cache,  e.g. on a node's SSD,  followed by one or more shared caches,  e.g. the
+central read-only CRDS cache mounted over NFS:
+
+% setenv CRDS_PATH  /ssd/crds:/grp/crds/cache
+
+The local cache is the CRDS cache proper where downloads,  configuration,  and pickles are
+written.   When a mapping or reference is missing from the local cache, config.locate_file(),
+locate_mapping(),  and locate_reference() return its path in the first shared tier which has
+it,  so the file is used where it is while a background thread copies it to the local cache
+for subsequent uses.   These read-through lookups are only for reading files;  code which
+downloads,  writes,  or removes cache files uses config.relocate_file(),  relocate_mapping(),
+and relocate_reference(),  which always return local cache paths.   Copies are made to temporary files and renamed into place by
+utils.atomic_open() so concurrent processes never see partial files.
+
+Because copied files can always be re-copied from their shared tier,  the local copies are
+limited to CRDS_CACHE_TIER_MB megabytes by evicting the least recently used copies,  ordered
+by file access or modification time,  whichever is later.   Copies are listed in a ledger in
+the local cache at <CRDS_PATH>/tiers/copies.log,  and ledger updates and evictions are done
+while holding the CRDS cache lock.   Files downloaded into the local cache are never evicted
+here,  see crds cache gc.
+
+>>> import tempfile
+>>> local, shared = tempfile.mkdtemp(), tempfile.mkdtemp()
+>>> os.makedirs(os.path.join(shared, "mappings", "hst"))
+>>> with open(os.path.join(shared, "mappings", "hst", "hst_cos.imap"), "w+") as handle:
+...     _ = handle.write("some contents")
+>>> old_path = os.environ.get("CRDS_PATH")
+>>> os.environ["CRDS_PATH"] = local + os.pathsep + shared
+
+>>> config.locate_mapping("hst_cos.imap") == os.path.join(shared, "mappings", "hst", "hst_cos.imap")
+True
+>>> wait_for_copies()
+>>> config.locate_mapping("hst_cos.imap") == os.path.join(local, "mappings", "hst", "hst_cos.imap")
+True
+>>> list(get_ledger().copies()) == [os.path.join(local, "mappings", "hst", "hst_cos.imap")]
+True
+>>> config.locate_mapping("hst_acs.imap") == os.path.join(local, "mappings", "hst", "hst_acs.imap")
+True
+
+>>> get_ledger().evict(0)
+1
+>>> os.path.exists(os.path.join(local, "mappings", "hst", "hst_cos.imap"))
+False
+
+>>> if old_path is None:
+...     del os.environ["CRDS_PATH"]
+... else:
+...     os.environ["CRDS_PATH"] = old_path
+"""
+import os
+import queue
+import shutil
+import threading
+
+# ===================================================================
+
+from . import log, utils, config, crds_cache_locking
+
+# ===================================================================
+
+LEDGER_NAME = os.path.join("tiers", "copies.log")
+
+# ===================================================================
+
+def read_through(path):
+    """Return local cache `path` if it exists or no shared tier has it,  otherwise return the
+    path of the file in the first shared tier which has it and schedule copying it to `path`.
+    """
+    if os.path.exists(path):
+        return path
+    tiers = config.get_crds_path_tiers()
+    local = tiers[0]
+    if not path.startswith(local + os.sep):
+        return path
+    for shared in tiers[1:]:
+        shared_path = shared + path[len(local):]
+        if os.path.exists(shared_path):
+            log.verbose("Using", repr(shared_path), "from shared cache tier.", verbosity=60)
+            schedule_copy(shared_path, path)
+            return shared_path
+    return path
+
+# ===================================================================
+
+class _Copier:
+    """Copies files from shared tiers to the local cache on a daemon thread,  each file at
+    most once per process.   Copies still pending when the interpreter exits are abandoned
+    rather than holding up exit;  they are redone the next time the file is located.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._scheduled = set()
+
+    def schedule(self, shared_path, local_path):
+        """Start copying `shared_path` to `local_path` unless already scheduled."""
+        with self._lock:
+            if self._pid != os.getpid():   # threads do not survive fork()
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._scheduled = set()
+                threading.Thread(target=self._copy_files, args=(self._queue,),
+                                 name="crds-cache-tier-copier", daemon=True).start()
+            if local_path in self._scheduled:
+                return
+            self._scheduled.add(local_path)
+            self._queue.put((shared_path, local_path))
+
+    @staticmethod
+    def _copy_files(copies):
+        """Copier thread:  copy each (shared_path, local_path) from queue `copies`."""
+        while True:
+            shared_path, local_path = copies.get()
+            try:
+                copy_to_tier(shared_path, local_path)
+            finally:
+                copies.task_done()
+
+    def wait(self):
+        """Wait for all scheduled copies to complete."""
+        with self._lock:
+            copies = self._queue if self._pid == os.getpid() else None
+        if copies is not None:
+            copies.join()
+
+_COPIER = _Copier()
+
+def schedule_copy(shared_path, local_path):
+    """Copy `shared_path` to `local_path` in the background if enabled by CRDS_CACHE_TIER_COPY
+    and the cache is writable.
+    """
+    if config.CACHE_TIER_COPY.get() and not config.get_cache_readonly():
+        _COPIER.schedule(shared_path, local_path)
+
+def wait_for_copies():
+    """Wait for copies scheduled by this process to complete."""
+    _COPIER.wait()
+
+def copy_to_tier(shared_path, local_path):
+    """Copy `shared_path` to `local_path` via a temporary file,  record the copy in the
+    ledger,  and evict old copies if they exceed CRDS_CACHE_TIER_MB.
+    """
+    with log.verbose_warning_on_exception("Failed copying", repr(shared_path), "to local cache tier"):
+        if os.path.exists(local_path):
+            return
+        with utils.atomic_open(local_path, "wb") as output, open(shared_path, "rb") as source:
+            shutil.copyfileobj(source, output)
+        log.verbose("Copied", repr(shared_path), "to local cache tier", repr(local_path), verbosity=60)
+        ledger = get_ledger()
+        ledger.record(local_path, os.stat(local_path).st_size)
+        quota = config.CACHE_TIER_MB.get() * 2**20
+        if quota > 0 and ledger.total_bytes() > quota:
+            ledger.evict(quota)
+
+# ===================================================================
+
+class TierLedger:
+    """Append-only list of the files copied from shared tiers to the local cache,  at text
+    file `path`,  one "<size> <path>" line per copy.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._copies = None   # { local path : size },  loaded on demand
+
+    def copies(self):
+        """Return { local path : size } for the copies listed in the ledger."""
+        if self._copies is None:
+            self._copies = self._load()
+        return self._copies
+
+    def _load(self):
+        """Read the ledger file into { local path : size }."""
+        copies = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8", errors="replace") as handle:
+                for line in handle:
+                    words = line.rstrip("\n").split(" ", 1)
+                    if len(words) == 2 and words[0].isdigit():
+                        copies[words[1]] = int(words[0])
+        return copies
+
+    def record(self, path, size):
+        """Add local copy `path` of `size` bytes to the ledger."""
+        with crds_cache_locking.get_cache_lock():
+            utils.ensure_dir_exists(self.path)
+            handle = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+            try:
+                os.write(handle, "{} {}\n".format(size, path).encode("utf-8"))
+            finally:
+                os.close(handle)
+        self.copies()[path] = size
+
+    def total_bytes(self):
+        """Return the total size of the copies in the ledger."""
+        return sum(self.copies().values())
+
+    def evict(self, quota_bytes):
+        """Remove the least recently used copies until they total at most `quota_bytes`,
+        returning the number of copies evicted.
+        """
+        evicted = 0
+        with crds_cache_locking.get_cache_lock():
+            copies = self._copies = self._load()
+            recency = []
+            for path in list(copies):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    del copies[path]
+                    continue
+                recency.append((max(stat.st_atime, stat.st_mtime), path))
+            remaining = sum(copies.values())
+            for _when, path in sorted(recency):
+                if remaining <= quota_bytes:
+                    break
+                with log.verbose_warning_on_exception("Failed evicting local copy", repr(path)):
+                    os.remove(path)
+                    remaining -= copies.pop(path)
+                    evicted += 1
+            with utils.atomic_open(self.path, "w", encoding="utf-8") as handle:
+                for path, size in sorted(copies.items()):
+                    handle.write("{} {}\n".format(size, path))
+        log.verbose("Evicted", evicted, "local copies from shared cache tiers.")
+        return evicted
+
+def get_ledger():
+    """Return the TierLedger of the local cache."""
+    return _get_ledger(os.path.join(config.get_crds_path(), LEDGER_NAME))
+
+@utils.cached
+def _get_ledger(path):
+    """Return the TierLedger at `path`,  shared within the process."""
+    return TierLedger(path)
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.core import cache_tiers
+    return doctest.testmod(cache_tiers)
+
+if __name__ == "__main__":
+    print(test())
@@ -19,7 +19,7 @@ from argparse import RawTextHelpFormatter
 # -----------------------------------------------------------------------------
 
 from . import log, heavy_client, constants
-from . import config, utils, exceptions, rmap
+from . import config, utils, exceptions, rmap, crds_cache_locking
 from crds.client import api
 
 # from crds import data_file  :   deferred,  see below
@@ -438,6 +438,7 @@ class Script:
         """Print out collected statistics."""
         if self.args.stats and not self._already_reported_stats:
             self.stats.report()
+            crds_cache_locking.log_lock_stats(self.stats.msg)
             self._already_reported_stats = True
     
     def increment_stat(self, name, amount=1):
@@ -572,6 +573,26 @@ class UniqueErrorsMixin:
     def clear_error_counts(self):
         """Clear the error tracking status by re-initializing/zeroing mixin data structures."""
         self.ue_mixin = self.get_empty_mixin()
+
+    def get_error_tracking(self):
+        """Return the error tracking state as a picklable dict,  e.g. to return it from a worker process."""
+        return dict(vars(self.ue_mixin))
+
+    def merge_error_tracking(self, tracking):
+        """Add the error tracking state `tracking` from get_error_tracking(),  nominally from a worker
+        process,  to this script's tracking state as if the errors had been tracked here in order.
+        """
+        mixin = self.ue_mixin
+        mixin.tracked_errors += tracking["tracked_errors"]
+        for key, msg in tracking["messages"].items():
+            if key not in mixin.messages:
+                mixin.messages[key] = msg
+                mixin.unique_data_names.add(tracking["data_names_by_key"][key][0])
+        mixin.count.update(tracking["count"])
+        mixin.all_data_names |= tracking["all_data_names"]
+        for key, data_names in tracking["data_names_by_key"].items():
+            mixin.data_names_by_key[key].extend(data_names)
+        mixin.announce_suppressed.update(tracking["announce_suppressed"])
         
     def add_args(self):
         """Add command line parameters to Script arg parser."""
@@ -743,6 +764,12 @@ class ContextsScript(Script):
         self.increment_stat("total-files", downloads)
         self.increment_stat("total-bytes", nbytes)
 
+    @property
+    @utils.cached
+    def mapping_closure(self):
+        """Return the MappingClosure which loads each mapping of the specified contexts once."""
+        return rmap.MappingClosure()
+
     def get_context_mappings(self):
         """Return the set of mappings which are pointed to by the mappings
         in `self.contexts`.
@@ -761,14 +788,14 @@ class ContextsScript(Script):
                     self.dump_files(pmaps[-1], files)
             for context in self.contexts:
                 with log.warn_on_exception("Failed loading context", repr(context)):
-                    pmap = rmap.get_cached_mapping(context)
+                    self.mapping_closure.node(context)
                     useable_contexts.append(context)
         else:
+            visited = set()
             for context in self.contexts:
                 with log.warn_on_exception("Failed listing mappings for", repr(context)):
                     try:
-                        pmap = rmap.get_cached_mapping(context)
-                        files |= set(pmap.mapping_names())
+                        files |= self.mapping_closure.closure(context, visited)[0]
                     except Exception:
                         files |= set(api.get_mapping_names(context))
                     useable_contexts.append(context)
@@ -787,10 +814,10 @@ class ContextsScript(Script):
         in `contexts`.
         """
         files = set()
+        visited = set()
         for context in self.contexts:
             try:
-                pmap = rmap.get_cached_mapping(context)
-                files |= set(pmap.reference_names())
+                files |= self.mapping_closure.closure(context, visited)[1]
                 log.verbose("Determined references from cached mapping", repr(context))
             except Exception:  # only ask the server if loading context fails
                 files |= set(api.get_reference_names(context))
@@ -332,6 +332,12 @@ FITS_IGNORE_MISSING_END = BooleanConfigItem("CRDS_FITS_IGNORE_MISSING_END", Fals
 FITS_VERIFY_CHECKSUM = BooleanConfigItem("CRDS_FITS_VERIFY_CHECKSUM", True,
     "When True, verify that FITS header CHECKSUM and DATASUM values are correct.  Otherwise fail.")
 
+FITS_SCAN_HEADERS = BooleanConfigItem("CRDS_FITS_SCAN_HEADERS", True,
+    "When True, read FITS headers by scanning header blocks directly,  falling back to astropy for unusual files.")
+
+ASDF_LAZY_HEADERS = BooleanConfigItem("CRDS_ASDF_LAZY_HEADERS", True,
+    "When True, read selected ASDF header keywords from the unconverted tree,  without loading blocks or converting unrelated nodes.")
+
 ADD_LOG_MSG_COUNTER = BooleanConfigItem(
     "CRDS_ADD_LOG_MSG_COUNTER", False, "When True, add a running counter.")
 log.set_add_log_msg_count(ADD_LOG_MSG_COUNTER)
@@ -408,7 +414,7 @@ def _std_cache_path(observatory, root_env, subdir):
     elif "CRDS_PATH_SINGLE" in os.environ:
         path = os.path.join(os.environ["CRDS_PATH_SINGLE"], subdir)
     elif "CRDS_PATH" in os.environ:
-        path = os.path.join(os.environ["CRDS_PATH"], subdir, observatory)
+        path = os.path.join(get_crds_path_tiers()[0], subdir, observatory)
     else:
         path = os.path.join(CRDS_DEFAULT_CACHE, subdir, observatory)
     return _clean_path(path)
@@ -435,6 +441,34 @@ def get_crds_path():
     """
     return _std_cache_path("", "*not-in-crds-environment*", "")
 
+def get_crds_path_tiers():
+    """Return the list of cache roots defined by CRDS_PATH,  nominally one.  CRDS_PATH may
+    instead be a list of roots separated by os.pathsep,  e.g. a local SSD cache followed by a
+    shared read-only cache.   The first root is the cache proper,  where all files are
+    written,  and the remaining roots are shared tiers searched for files it lacks.
+    
+    >>> temp = dict(os.environ)
+    >>> os.environ = {}
+    >>> os.environ["CRDS_PATH"] = "/ssd/crds/:/grp/crds/cache"
+    >>> get_crds_path_tiers()
+    ['/ssd/crds', '/grp/crds/cache']
+    >>> get_crds_path()
+    '/ssd/crds'
+    >>> get_crds_mappath('jwst')
+    '/ssd/crds/mappings/jwst'
+    >>> os.environ = temp
+    """
+    return [_clean_path(path) for path in os.environ.get("CRDS_PATH", "").split(os.pathsep)]
+
+def _read_through(path):
+    """Return `path` in the local cache,  or the equivalent path in a shared tier of CRDS_PATH
+    if only the shared tier has the file,  scheduling a copy to the local cache.
+    """
+    if os.pathsep not in os.environ.get("CRDS_PATH", "") or path == "N/A":
+        return path
+    from crds.core import cache_tiers
+    return cache_tiers.read_through(path)
+
 def get_crds_mappath(observatory):
     """get_crds_mappath() returns the base path of the CRDS mapping directory 
     tree where CRDS rules files (mappings) are stored.   This is extended by
@@ -547,6 +581,65 @@ def locate_pickle(mapping, observatory=None):
         observatory = mapping_to_observatory(mapping)
     return os.path.join(get_crds_picklepath(observatory), mapping + ".pkl")
 
+def get_crds_certify_cachepath(observatory):
+    """Return the directory name where CRDS stores cached certify results for `observatory`."""
+    return _std_cache_path(observatory, "CRDS_CERTIFY_CACHEPATH", "certify")
+
+def get_crds_header_cachepath():
+    """Return the directory name where CRDS stores its persistent cache of file headers."""
+    return _std_cache_path("", "CRDS_HEADER_CACHEPATH", "headers")
+
+def get_crds_manifest_path(observatory):
+    """Return the directory name where CRDS stores its manifest of verified cached files for `observatory`."""
+    return _std_cache_path(observatory, "CRDS_MANIFEST_PATH", "manifest")
+
+VERIFY_MANIFEST = BooleanConfigItem("CRDS_VERIFY_MANIFEST", True,
+    "When True, record the sha1sums of verified cached files and skip re-hashing files unchanged since.")
+
+def get_crds_access_path(observatory):
+    """Return the directory name where CRDS logs accesses of cached references for `observatory`."""
+    return _std_cache_path(observatory, "CRDS_ACCESS_PATH", "access")
+
+CACHE_ACCESS_LOG = BooleanConfigItem("CRDS_CACHE_ACCESS_LOG", True,
+    "When True, references used by api.cache_references() are logged to order eviction by crds cache gc.")
+
+CACHE_QUOTA_MB = IntConfigItem("CRDS_CACHE_QUOTA_MB", 0,
+    "Size limit of cached references in megabytes enforced by crds cache gc,  0 for no limit.")
+
+CACHE_TIER_COPY = BooleanConfigItem("CRDS_CACHE_TIER_COPY", True,
+    "When True and CRDS_PATH lists shared cache tiers,  copy files used from shared tiers to the local cache in the background.")
+
+CACHE_TIER_MB = IntConfigItem("CRDS_CACHE_TIER_MB", 0,
+    "Size limit in megabytes of files copied from shared CRDS_PATH tiers to the local cache,  0 for no limit.")
+
+SYNC_WATCH_INTERVAL = IntConfigItem("CRDS_SYNC_WATCH_INTERVAL", 300,
+    "Seconds between polls of the CRDS server for new contexts by crds sync --watch.")
+
+FSYNC_DIRS = BooleanConfigItem("CRDS_FSYNC_DIRS", False,
+    "When True,  also flush directories to disk after renaming files written to the CRDS cache,  so new files survive host crashes.")
+
+def get_crds_blobpath():
+    """Return the directory name where CRDS stores content addressed reference files shared by links."""
+    return _std_cache_path("", "CRDS_BLOBPATH", "blobs")
+
+BLOB_STORE = BooleanConfigItem("CRDS_BLOB_STORE", False,
+    "When True, downloaded references are stored once by sha1sum under <CRDS_PATH>/blobs and linked into the cache.")
+
+BLOB_LINK_MODE = StrConfigItem("CRDS_BLOB_LINK_MODE", "hardlink",
+    "Form of link from cache reference paths to blobs.", valid_values=["hardlink", "symlink"], lower=True)
+
+CACHE_PINNED_CONTEXTS = StrConfigItem("CRDS_CACHE_PINNED_CONTEXTS", "",
+    "Comma separated contexts whose references crds cache gc never evicts,  in addition to those specified.")
+
+HEADER_CACHE = BooleanConfigItem("CRDS_HEADER_CACHE", False,
+    "When True, file headers read by CRDS are kept in a persistent cache shared by processes.")
+
+HEADER_CACHE_MAX_MB = IntConfigItem("CRDS_HEADER_CACHE_MAX_MB", 256,
+    "Size limit of the persistent header cache in megabytes,  least recently used headers are evicted.")
+
+CERTIFY_CACHE = BooleanConfigItem("CRDS_CERTIFY_CACHE", False,
+    "When True, crds certify replays cached results for reference files it has already certified.")
+
 USE_PICKLED_CONTEXTS = BooleanConfigItem("CRDS_USE_PICKLED_CONTEXTS", False,
     "When True,  CRDS contexts should be loaded from a pickled version if possible.")
 
@@ -912,10 +1005,13 @@ def locate_file(filepath, observatory):
    Used to determine cache locations for directory-less `filepaths` from CRDS rules.
 
    Returns complex filepaths as-is for supporting operations on external files.
+
+   With a tiered CRDS_PATH this may return a path in a shared tier,  so it is only
+   for reading.  Use relocate_file() for paths which are downloaded,  written,  or removed.
     """
     if os.path.dirname(filepath):
         return filepath
-    return relocate_file(filepath, observatory)
+    return _read_through(relocate_file(filepath, observatory))
 
 def pop_crds_uri(filepath):
     """Pop off crds:// from a filepath,  yielding an pathless filename."""
@@ -944,11 +1040,11 @@ def relocate_file(filepath, observatory):
 
 def locate_reference(ref, observatory):
     """Returns CRDS cache path for `ref` if it specifies no directory, otherwise
-    `ref` as-is.
+    `ref` as-is.   May return a shared tier path,  see locate_file().
     """
     if os.path.dirname(ref):
         return ref
-    return relocate_reference(ref, observatory)
+    return _read_through(relocate_reference(ref, observatory))
 
 def relocate_reference(ref, observatory):
     """Returns CRDS cache location where `ref` would be copied if it
@@ -985,6 +1081,9 @@ LOCKING_MODE = StrConfigItem("CRDS_LOCKING_MODE",  "multiprocessing",
     valid_values=["lockfile", "filelock", "multiprocessing"],
     lower=True)
 
+LOCK_WAIT_WARNING = IntConfigItem("CRDS_LOCK_WAIT_WARNING", 30,
+    "Seconds to wait for a CRDS reader/writer lock before warning about its owner,  0 to never warn.")
+
 def get_crds_lockpath(lock_filename):
     """Return the full path of `lock_filename` filename based on CRDS lock path configuration."""
     return os.path.join(CACHE_LOCK_PATH.get(), lock_filename)
@@ -1269,11 +1368,11 @@ def is_date_based_mapping_spec(mapping):
 
 def locate_mapping(mappath, observatory=None):
     """Return the CRDS cache path for mapping `mappath` if it has no directory,
-    otherwise returns mappath as-is.
+    otherwise returns mappath as-is.   May return a shared tier path,  see locate_file().
     """
     if os.path.dirname(mappath):
         return mappath
-    return relocate_mapping(mappath, observatory)
+    return _read_through(relocate_mapping(mappath, observatory))
 
 def relocate_mapping(mappath, observatory=None):
     """Return the CRDS cache path where CRDS mapping `mappath` should be
@@ -10,14 +10,47 @@ second instance.
 
 A number of configuration env var settings control locking behavior, see
 crds.core.config for more info.
+
+In addition to the coarse named locks above,  CRDS defines reader/writer locks based on
+fcntl.flock() of files in CRDS_LOCK_PATH which any number of readers can hold shared or
+one writer can hold exclusively.   These are used per resource,  so processes reading the
+cache proceed in parallel and writers only exclude each other for the same resource.   Files
+and pickles are hashed onto LOCK_BUCKETS locks each,  so writers of different files rarely
+wait on each other and the number of lock files stays fixed.   Since two files may share a
+bucket,  file and pickle locks must not be nested:
+
+get_file_lock(filename)        held exclusively while downloading `filename`
+get_config_lock(observatory)   held exclusively while writing the cache config
+get_pickle_lock(mapping)       held shared to load and exclusively to save a context pickle
+get_cache_rw_lock()            held shared by api.cache_references() and exclusively by
+                               crds cache gc,  suitable for integrators which would
+                               otherwise serialize whole getreferences() calls on
+                               get_cache_lock():
+
+    with crds_cache_locking.get_cache_rw_lock().shared():
+        ...
+
+Where fcntl is not available the reader/writer locks fall back to the coarse cache lock.
+
+The time spent waiting for each lock is accumulated per process and reported by
+lock_stats() and by command line scripts run with --stats.   File based locks held
+exclusively record the pid,  host,  and time of their owner in <lockpath>.owner.   A
+writer which waits more than CRDS_LOCK_WAIT_WARNING seconds warns with that owner,
+and find_stale_locks() lists locks whose owners on this host are no longer running.
 """
 import os
+import glob
+import time
+import zlib
+import socket
+import threading
 import multiprocessing
 
 # =========================================================================
 
 # import lockfile,  deferred
 # import filelock,  deferred
+# import fcntl,  deferred
 
 # =========================================================================
 
@@ -38,6 +71,8 @@ class CrdsAbstractLock:
     
     _lock = None  # Overridden in most cases
     log = log.verbose
+    instrumented = True  # accumulate wait times in LOCK_STATS
+    owner_path = None    # file recording the owner of file based locks
     
     def __init__(self, lockname):
         """Abstract lock initialization."""
@@ -49,17 +84,33 @@ class CrdsAbstractLock:
         return self.__class__.__name__ + "('" + self.lockname + "')"
 
     def acquire(self, *args, **keys):
-        """Acquire delegate lock,  adding CRDS verbose logging."""
+        """Acquire delegate lock,  adding CRDS verbose logging and wait time instrumentation."""
         self.log("Acquiring lock", repr(self))
+        start = time.time()
         self._acquire(*args, **keys)
-        self.log("Lock acquired", repr(self))
+        waited = time.time() - start
+        if self.instrumented:
+            _record_wait(self.lockname, waited)
+        self._claim()
+        self.log("Lock acquired", repr(self), "after waiting", "{:.3f}".format(waited), "seconds")
     
     def release(self, *args, **keys):
         """Release delegate lock,  adding CRDS verbose logging."""
         self.log("Releasing lock", repr(self))
+        self._disclaim()
         self._release(*args, **keys)
         self.log("Lock released", repr(self))
 
+    def shared(self):
+        """Return a context manager holding this lock for reading.   Locks without
+        reader/writer semantics are simply held exclusively.
+        """
+        return self
+
+    def exclusive(self):
+        """Return a context manager holding this lock for writing."""
+        return self
+
     def break_lock(self):
         """Break delegate lock,  adding CRDS verbose logging."""
         self.log("Breaking lock", repr(self))
@@ -90,12 +141,25 @@ class CrdsAbstractLock:
         """Noop,  override as needed."""
         pass
 
+    def _claim(self):
+        """Record this process as the owner of a newly acquired file based lock."""
+        if self.owner_path is not None:
+            with log.verbose_warning_on_exception("Failed recording owner of lock", repr(self)):
+                write_owner(self.owner_path)
+
+    def _disclaim(self):
+        """Remove the owner record of a file based lock before releasing it."""
+        if self.owner_path is not None:
+            _remove_quietly(self.owner_path)
+
 # =========================================================================
 
 # Always defined as fall back
 
 class CrdsFakeLock(CrdsAbstractLock):
     """Placeholder dummy lock to do nothing,  silently since normal for pipeline."""
+
+    instrumented = False
     
     def log(self, *args, **keys):
         """Fake locks are silent."""
@@ -140,13 +204,12 @@ class CrdsFileLock(CrdsAbstractLock):
     def __init__(self, lockname):
         super(CrdsFileLock, self).__init__(config.get_crds_lockpath(lockname))
         self._lock = filelock.FileLock(self.lockname)
+        self.owner_path = self.lockname + ".owner"
 
     def _break_lock(self, *args, **keys):
         """Destroy lock regardless of who owns it."""
-        try:
-            os.remove(self.lockname)
-        except Exception:
-            pass
+        _remove_quietly(self.owner_path)
+        _remove_quietly(self.lockname)
 
 # =========================================================================
 
@@ -160,6 +223,17 @@ class CrdsLockFile(CrdsAbstractLock):
     def __init__(self, lockname):
         super(CrdsLockFile, self).__init__(config.get_crds_lockpath(lockname))
         self._lock = lockfile.LockFile(self.lockname)
+        self.owner_path = self.lockname + ".owner"
+
+    def _acquire(self, *args, **keys):
+        """Break the lock if its owner died holding it,  since lockfile locks outlive
+        their processes,  then acquire it.
+        """
+        owner = read_owner(self.owner_path)
+        if owner is not None and owner_is_stale(owner):
+            log.warning("Breaking stale lock", repr(self), "owned by", format_owner(owner))
+            self._break_lock()
+        super(CrdsLockFile, self)._acquire(*args, **keys)
     
     def _break_lock(self,  *args, **keys):
         """Destroy lock regardless of who owns it."""
@@ -167,24 +241,225 @@ class CrdsLockFile(CrdsAbstractLock):
             self._lock.break_lock(*args, **keys)
         except Exception:
             pass
-        try:
-            os.remove(self.lockname)
-        except Exception:
-            pass
+        _remove_quietly(self.owner_path)
+        _remove_quietly(self.lockname)
     
 # =========================================================================
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = failed_module_proxy("fcntl")  # instantiating lock intentionally fails
+
+class CrdsReadWriteLock(CrdsAbstractLock):
+    """Reader/writer lock based on fcntl.flock() of a file,  held shared by any number of
+    readers or exclusively by one writer.   Each acquisition opens its own file descriptor
+    so threads exclude each other like processes.   Acquisitions nest per thread and are
+    released in reverse order.   self.lockname is path.
+    """
+    def __init__(self, lockname):
+        super(CrdsReadWriteLock, self).__init__(config.get_crds_lockpath(lockname))
+        self.owner_path = self.lockname + ".owner"
+        self._local = threading.local()
+        utils.ensure_dir_exists(self.lockname)
+        os.close(self._open())   # fail here, not when acquired,  if the lock file is unusable
+
+    def shared(self):
+        """Return a context manager holding this lock for reading."""
+        return _LockHolder(self, shared=True)
+
+    def exclusive(self):
+        """Return a context manager holding this lock for writing."""
+        return _LockHolder(self, shared=False)
+
+    def _open(self):
+        """Open the lock file,  read-only so locks created by other users can be shared."""
+        return os.open(self.lockname, os.O_RDONLY | os.O_CREAT, 0o666)
+
+    def _holdings(self):
+        """Return this thread's stack of [(file descriptor, shared), ...] for this lock."""
+        if not hasattr(self._local, "holdings"):
+            self._local.holdings = []
+        return self._local.holdings
+
+    def _acquire(self, shared=False):
+        """Acquire the lock shared for reading or exclusively for writing."""
+        handle = self._open()
+        try:
+            self._wait(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        except BaseException:
+            os.close(handle)
+            raise
+        self._holdings().append((handle, shared))
+
+    def _wait(self, handle, operation):
+        """Poll for flock `operation` on `handle`,  warning once about the owner of the lock
+        after CRDS_LOCK_WAIT_WARNING seconds.
+        """
+        start = time.time()
+        warn_after = config.LOCK_WAIT_WARNING.get()
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(handle, operation | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                pass
+            waited = time.time() - start
+            if warn_after and waited > warn_after:
+                owner = read_owner(self.owner_path)
+                log.warning("Waited", int(waited), "seconds for lock", repr(self),
+                            "held by", format_owner(owner) if owner else "readers",
+                            "(stale)" if owner and owner_is_stale(owner) else "")
+                warn_after = 0
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def _release(self):
+        """Release this thread's most recent acquisition of the lock."""
+        handle, _shared = self._holdings().pop()
+        try:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        finally:
+            os.close(handle)
+
+    def _claim(self):
+        """Record the owner of exclusive acquisitions only."""
+        if not self._holdings()[-1][1]:
+            super(CrdsReadWriteLock, self)._claim()
+
+    def _disclaim(self):
+        """Remove the owner record of exclusive acquisitions only."""
+        if self._holdings() and not self._holdings()[-1][1]:
+            super(CrdsReadWriteLock, self)._disclaim()
+
+    def _break_lock(self, *args, **keys):
+        """Remove the lock file and owner record.   flock() locks are released by the
+        kernel when their holders exit so this only cleans up the lock directory.
+        """
+        _remove_quietly(self.owner_path)
+        _remove_quietly(self.lockname)
+
+class _LockHolder:
+    """Context manager holding `lock` shared or exclusively."""
+    def __init__(self, lock, shared):
+        self.lock = lock
+        self.shared = shared
+
+    def __enter__(self):
+        self.lock.acquire(shared=self.shared)
+        return self.lock
+
+    def __exit__(self, *args, **keys):
+        self.lock.release()
+
+# =========================================================================
+
+def write_owner(owner_path):
+    """Record this process as the owner of a lock in `owner_path` as "<pid> <host> <time>"."""
+    temp = owner_path + ".tmp." + str(os.getpid())
+    with open(temp, "w+") as handle:
+        handle.write("{} {} {:.0f}\n".format(os.getpid(), socket.gethostname(), time.time()))
+    os.replace(temp, owner_path)
+
+def read_owner(owner_path):
+    """Return (pid, host, time acquired) of the lock owner recorded in `owner_path`,
+    or None if there is no valid record.
+    """
+    try:
+        with open(owner_path) as handle:
+            pid, host, when = handle.read().split()
+        return int(pid), host, float(when)
+    except (OSError, ValueError):
+        return None
+
+def format_owner(owner):
+    """Return a readable description of lock `owner` (pid, host, time acquired)."""
+    pid, host, when = owner
+    return "pid {} on {} since {}".format(pid, host, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when)))
+
+def owner_is_stale(owner):
+    """Return True IFF lock `owner` (pid, host, time) ran on this host and has exited.
+    The liveness of owners on other hosts cannot be determined.
+    """
+    pid, host, _when = owner
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:   # running as another user
+        return False
+    return False
+
+def find_stale_locks():
+    """Return [(lock path, owner), ...] for the locks in CRDS_LOCK_PATH recorded as held by
+    processes on this host which are no longer running.
+    """
+    stale = []
+    for owner_path in sorted(glob.glob(config.get_crds_lockpath("crds.*.owner"))):
+        owner = read_owner(owner_path)
+        if owner is not None and owner_is_stale(owner):
+            stale.append((owner_path[:-len(".owner")], owner))
+    return stale
+
+def _remove_quietly(path):
+    """Remove `path` if it exists,  ignoring failures."""
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+
+# =========================================================================
+
+LOCK_STATS = {}   # { lockname : [acquisitions, seconds waiting, longest wait], ... }
+
+_STATS_LOCK = threading.Lock()
+
+def _record_wait(lockname, waited):
+    """Add an acquisition of `lockname` after `waited` seconds to LOCK_STATS."""
+    with _STATS_LOCK:
+        stats = LOCK_STATS.setdefault(lockname, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += waited
+        stats[2] = max(stats[2], waited)
+
+def lock_stats():
+    """Return { lockname : (acquisitions, seconds waiting, longest wait) } for locks
+    acquired by this process.
+    """
+    with _STATS_LOCK:
+        return { name : tuple(stats) for (name, stats) in LOCK_STATS.items() }
+
+def log_lock_stats(output=log.info):
+    """Output the wait times of locks acquired by this process,  longest total wait first."""
+    stats = lock_stats()
+    for name, (count, waited, longest) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        output("Lock", repr(name), "acquired", count, "times waiting",
+               "{:.3f}".format(waited), "seconds,  longest", "{:.3f}".format(longest))
+
+# =========================================================================
+
 LOCKS = {}   #  { lockpath : CrdsAbstractLockSubclass, ... }
 
-def get_lock(lockname):
-    """Create, remember, and return the lock object globally referred to by string `lockname`."""
+def get_lock(lockname, create=None):
+    """Create, remember, and return the lock object globally referred to by string `lockname`,
+    created by function `create`,  nominally create_lock().
+    """
     if lockname in LOCKS:
         lock = LOCKS[lockname]
     else:
         with LOCKS["crds.master"]:
-            lock = LOCKS[lockname] = create_lock(lockname)
+            if lockname not in LOCKS:
+                LOCKS[lockname] = (create or create_lock)(lockname)
+            lock = LOCKS[lockname]
     return lock
 
+def get_rw_lock(lockname):
+    """Create, remember, and return the reader/writer lock referred to by string `lockname`."""
+    return get_lock(lockname, create_rw_lock)
+
 def get_lock_class():
     """Based on CRDS configuration,  return the lock class."""
     classes = {
@@ -209,6 +484,23 @@ writes."""
                           log.warning)
     return lock
 
+def create_rw_lock(lockname):
+    """Return a reader/writer lock for `lockname`,  falling back to an exclusive lock of the
+    configured class if reader/writer locks cannot be created.   The fallback is distinct from
+    the CRDS cache lock since callers like crds cache gc hold both and the locks are not reentrant.
+    """
+    lock = CrdsFakeLock(lockname)
+    if not config.USE_LOCKING.get():
+        _explain_once("CRDS_USE_LOCKING = False. Cannot support downloading CRDS files while multiprocessing.", log.verbose)
+    elif not config.get_cache_readonly():
+        try:
+            lock = CrdsReadWriteLock(lockname)
+        except Exception as exc:
+            _explain_once("Failed creating CRDS reader/writer lock,  using exclusive lock: " + str(exc),
+                          log.verbose_warning)
+            lock = create_lock(lockname)
+    return lock
+
 @utils.cached
 def _explain_once(explain, logger):
     """Issue locking unsupported message `explain` to `logger` once."""
@@ -244,6 +536,29 @@ get_cache_lock = lambda: get_lock("crds.cache")
 create_cache_lock = lambda: create_lock("crds.cache")
 clear_cache_lock = lambda: clear_lock("crds.cache")
 clear_cache_locks = clear_locks
+
+get_cache_rw_lock = lambda: get_rw_lock("crds.cache.rw")
+
+# Number of lock files shared by all cached files,  and by all context pickles.
+LOCK_BUCKETS = 64
+
+def _bucket(name):
+    """Return the lock bucket of file `name`,  the same in every process."""
+    return "{:02d}".format(zlib.crc32(os.path.basename(name).encode("utf-8")) % LOCK_BUCKETS)
+
+def get_file_lock(filename):
+    """Return the reader/writer lock for cached mapping or reference `filename`,  one of
+    LOCK_BUCKETS locks shared by all files so lock files and LOCKS do not grow per file.
+    """
+    return get_rw_lock("crds.file." + _bucket(filename))
+
+def get_config_lock(observatory):
+    """Return the reader/writer lock for the cache config files of `observatory`."""
+    return get_rw_lock("crds.config." + observatory)
+
+def get_pickle_lock(mapping):
+    """Return the reader/writer lock for the context pickle of `mapping`,  one of LOCK_BUCKETS."""
+    return get_rw_lock("crds.pickle." + _bucket(mapping))
  
 # =========================================================================
 
@@ -159,6 +159,13 @@ class LazyFileDict(TransformedDict):
         """
         return sorted([key for key in self.keys() if not self.is_special_value(self._xx_selector[key])])
 
+    def normal_filenames(self):
+        """Return the unloaded values,  nominally filenames,  corresponding to normal_keys().
+
+        NOTE:  Does not require full load.
+        """
+        return [self._xx_selector[key] for key in self.normal_keys()]
+
     def special_keys(self):
         """Each of these keys has a corresponding values which IS special.
         
@@ -51,13 +51,12 @@ import os
 import pprint
 import ast
 import traceback
-import uuid
 import fnmatch 
 import pickle
 
 # ============================================================================
 
-from . import rmap, log, utils, config
+from . import rmap, log, utils, config, crds_cache_locking
 from .constants import ALL_OBSERVATORIES
 from .log import srepr
 from .exceptions import CrdsError, CrdsBadRulesError, CrdsBadReferenceError, CrdsConfigError, CrdsDownloadError
@@ -553,13 +552,14 @@ def cache_server_info(info, observatory):
     """Write down the server `info` dictionary to help configure off-line use."""
     path = config.get_crds_cfgpath(observatory)
 
-    server_config_path = os.path.join(path, "server_config")
-    cache_atomic_write(server_config_path, pprint.pformat(info), "SERVER INFO")
+    with crds_cache_locking.get_config_lock(observatory).exclusive():
+        server_config_path = os.path.join(path, "server_config")
+        cache_atomic_write(server_config_path, pprint.pformat(info), "SERVER INFO")
 
-    # This is just a reference copy for debuggers,  the master is still the info file.
-    bad_files_lines = "\n".join(info.bad_files_list)
-    bad_files_path = os.path.join(path, "bad_files.txt")
-    cache_atomic_write(bad_files_path, bad_files_lines, "BAD FILES LIST")
+        # This is just a reference copy for debuggers,  the master is still the info file.
+        bad_files_lines = "\n".join(info.bad_files_list)
+        bad_files_path = os.path.join(path, "bad_files.txt")
+        cache_atomic_write(bad_files_path, bad_files_lines, "BAD FILES LIST")
 
 def cache_atomic_write(replace_path, contents, fail_warning):
     """Write string `contents` to cache file `replace_path` as an atomic action,
@@ -568,19 +568,14 @@ def cache_atomic_write(replace_path, contents, fail_warning):
     cache in parallel,  as in parallel bestrefs in the pipeline.
     
     NOTE:  All writes to the cache configuration area should use this function
-    to avoid concurrency issues with parallel processing.   Potentially this should
-    be expanded to other non-config cache writes but is currently inappropriate
-    for large data volumes (G's) since they're required to be in memory.
+    to avoid concurrency issues with parallel processing.   Large cache files like
+    downloads are written with the underlying utils.atomic_open() or atomic_rename()
+    since they're inappropriate to hold in memory.
     """
     if utils.is_writable(replace_path, no_exist=True):
         try:
             log.verbose("CACHE updating:", repr(replace_path))
-            utils.ensure_dir_exists(replace_path)
-            temp_path = os.path.join(os.path.dirname(replace_path), str(uuid.uuid4()))
-            mode = "w+" if isinstance(contents, str) else "wb+"
-            with open(temp_path, mode) as file_:
-                file_.write(contents)
-            os.rename(temp_path, replace_path)
+            utils.atomic_write(replace_path, contents)
         except Exception as exc:
             log.verbose_warning("CACHE Failed writing", repr(replace_path), 
                                 ":", fail_warning, ":", repr(exc))
@@ -705,7 +700,8 @@ def load_pickled_mapping(mapping):
     exist because of storage waste.
     """
     pickle_file = config.locate_pickle(mapping)
-    pickled = open(pickle_file, "rb").read()
+    with crds_cache_locking.get_pickle_lock(mapping).shared():
+        pickled = open(pickle_file, "rb").read()
     loaded = pickle.loads(pickled)
     log.info("Loaded pickled context", repr(mapping))
     return loaded
@@ -719,7 +715,8 @@ def save_pickled_mapping(mapping, loaded):
     with log.verbose_warning_on_exception("Failed saving pickle for", repr(mapping), "to", repr(pickle_file)):
         loaded.force_load()
         pickled = pickle.dumps(loaded)
-        cache_atomic_write(pickle_file, pickled, "CONTEXT PICKLE")
+        with crds_cache_locking.get_pickle_lock(mapping).exclusive():
+            cache_atomic_write(pickle_file, pickled, "CONTEXT PICKLE")
         log.info("Saved pickled context", repr(pickle_file))
 
 def remove_pickled_mapping(mapping):
@@ -732,6 +729,7 @@ def remove_pickled_mapping(mapping):
         log.verbose("Pickl file", repr(pickle_file), "does not exist,  skipping pickle remove.")
         return
     with log.warn_on_exception("Failed removing pickle for", repr(mapping)):
-        os.remove(pickle_file)
+        with crds_cache_locking.get_pickle_lock(mapping).exclusive():
+            os.remove(pickle_file)
         log.info("Removed pickle for context", repr(pickle_file))
     
@@ -104,6 +104,18 @@ are carefully reraised so the original traceback is not destroyed.
 CRDS - WARNING -  Testing expected verbose warning : Force verbose warning.
 
 >>> _ = log.set_verbose(old_verbose)
+
+Captures nest,  e.g. a worker's capture around a cached certify result,  with inner messages
+replayed into the enclosing capture rather than the console:
+
+>>> with log.capture() as outer:
+...     with log.capture() as inner:
+...         log.warning("hello")
+...     log.replay(inner)
+>>> outer.events, outer.warnings
+([('log', 30, ' hello')], 1)
+>>> log.replay(outer)
+CRDS - WARNING -  hello
 """
 import sys
 import os
@@ -136,6 +148,8 @@ class CrdsLogger:
 
         self.eol_pending = False
 
+        self.captured = None   # CapturedMessages while capture() is active,  else None
+
         # verbose_level handles CRDS verbosity,  defaulting to 0 for no debug
         try:
             verbose_level = os.environ.get("CRDS_VERBOSITY", 0)
@@ -207,12 +221,19 @@ class CrdsLogger:
         """
         output = self.format(*args, **keys)
         self.eol_pending = not output.endswith("\n")
+        if self.captured is not None:
+            self.captured.events.append(("write", output))
+            return
         sys.stderr.flush()
         sys.stdout.write(output)
         sys.stdout.flush()
 
     def status(self):
         return self.errors, self.warnings, self.infos
+
+    def set_status(self, errors, warnings, infos):
+        """Restore message counters previously returned by status(),  e.g. when resuming."""
+        self.errors, self.warnings, self.infos = errors, warnings, infos
     
     def reset(self):
         self.errors = self.warnings = self.infos = self.debugs = 0
@@ -251,6 +272,42 @@ class CrdsLogger:
         self.handlers.remove(handler)
         self.logger.removeHandler(handler)
 
+    @contextlib.contextmanager
+    def capture(self):
+        """Within the context,  record log messages and write() output in a CapturedMessages
+        rather than emitting them,  e.g. so a worker process can return its output to be
+        replayed in order by the parent.   Message counts are also deferred until replay().
+        """
+        captured = CapturedMessages()
+        old_captured, old_status = self.captured, self.status()
+        handler = _CaptureHandler(captured)
+        old_handlers = self.logger.handlers[:]   # console handlers or an enclosing capture
+        for existing in old_handlers:
+            self.logger.removeHandler(existing)
+        self.logger.addHandler(handler)
+        self.captured = captured
+        try:
+            yield captured
+        finally:
+            self.captured = old_captured
+            self.logger.removeHandler(handler)
+            for existing in old_handlers:
+                self.logger.addHandler(existing)
+            captured.errors, captured.warnings, captured.infos = [
+                now - then for (now, then) in zip(self.status(), old_status)]
+            self.set_status(*old_status)
+
+    def replay(self, captured):
+        """Emit the messages of CapturedMessages `captured` and add its message counts to this logger."""
+        for event in captured.events:
+            if event[0] == "write":
+                self.write(event[1], end="")
+            else:
+                self.logger.log(event[1], event[2])
+        self.errors += captured.errors
+        self.warnings += captured.warnings
+        self.infos += captured.infos
+
     def fatal_error(self, *args, **keys):
         error("(FATAL)", *args, **keys)
         sys.exit(-1)  # FATAL == totally unambiguous
@@ -270,6 +327,21 @@ class CrdsLogger:
         if filter in self.filters:
             self.filters.remove(filter)
 
+class CapturedMessages:
+    """Picklable record of the log messages and counts issued within CrdsLogger.capture()."""
+    def __init__(self):
+        self.events = []   # ("log", level, message) or ("write", output)
+        self.errors = self.warnings = self.infos = 0
+
+class _CaptureHandler(logging.Handler):
+    """logging handler which appends messages to a CapturedMessages."""
+    def __init__(self, captured):
+        super(_CaptureHandler, self).__init__()
+        self.captured = captured
+
+    def emit(self, record):
+        self.captured.events.append(("log", record.levelno, record.getMessage()))
+
 THE_LOGGER = CrdsLogger("CRDS")
 
 info = THE_LOGGER.info
@@ -281,6 +353,7 @@ should_output = THE_LOGGER.should_output
 debug = THE_LOGGER.debug
 fatal_error = THE_LOGGER.fatal_error
 status = THE_LOGGER.status
+set_status = THE_LOGGER.set_status
 reset = THE_LOGGER.reset
 write = THE_LOGGER.write
 set_verbose = THE_LOGGER.set_verbose
@@ -292,6 +365,8 @@ remove_stream_handler = THE_LOGGER.remove_stream_handler
 append_crds_filter = THE_LOGGER.append_crds_filter
 prepend_crds_filter = THE_LOGGER.prepend_crds_filter
 format = THE_LOGGER.format
+capture = THE_LOGGER.capture
+replay = THE_LOGGER.replay
 
 def increment_errors(N=1):
     """Increment the error count by N without issuing a log message."""
@@ -0,0 +1,228 @@
+"""This module defines PurgePlan,  the bulk purge planner used by crds sync --purge-mappings
+and --purge-references to remove the cached files which are not used by a set of contexts.
+
+Rather than locating,  checking,  and removing unused files one at a time,  a plan is made by
+scanning each cache directory once and subtracting the names in the closures of the kept
+contexts,  so the number of files and bytes reclaimed is reported before anything is removed.
+Executing a plan checks once that the cache is writable and that each directory is in the
+CRDS cache,  then removes the files of each directory in batches of PURGE_BATCH files,  with
+batches removed in parallel threads.
+
+Plans can be saved as JSON with crds sync --purge-plan,  reviewed,  and executed later with
+crds sync --execute-purge-plan.   Planned files which have since been removed or have
+changed size are skipped.
+
+>>> import tempfile
+>>> old_path = os.environ.get("CRDS_PATH")
+>>> os.environ["CRDS_PATH"] = cache = tempfile.mkdtemp()
+>>> for name, contents in [("keep.fits", "k"), ("old.fits", "old"), ("older.fits", "older"), ("hst.pmap", "")]:
+...     with open(os.path.join(cache, name), "w+") as handle:
+...         _ = handle.write(contents)
+
+>>> plan = PurgePlan("hst")
+>>> plan.add_directory(cache, keep={"keep.fits"}, exclude="*.[pir]map")
+>>> plan.files, plan.bytes, plan.kept
+(2, 8, 1)
+
+>>> plan = PurgePlan.from_json(plan.to_json())
+>>> sorted(plan.directories[cache])
+['old.fits', 'older.fits']
+
+>>> with open(os.path.join(cache, "older.fits"), "a") as handle:
+...     _ = handle.write(" and changed")
+>>> plan.execute(jobs=2)
+(1, 3)
+>>> sorted(os.listdir(cache))
+['hst.pmap', 'keep.fits', 'older.fits']
+
+Planned names are only ever removed from their own directory:
+
+>>> outside = tempfile.mkdtemp()
+>>> with open(os.path.join(outside, "victim.fits"), "w+") as handle:
+...     _ = handle.write("v")
+>>> plan = PurgePlan("hst", {cache : {"../" + os.path.basename(outside) + "/victim.fits" : 1}})
+>>> plan.execute()
+(0, 0)
+>>> os.listdir(outside)
+['victim.fits']
+
+>>> if old_path is None:
+...     del os.environ["CRDS_PATH"]
+... else:
+...     os.environ["CRDS_PATH"] = old_path
+"""
+import os
+import json
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+# ===================================================================
+
+from . import log, utils, config, crds_cache_locking, blob_store
+
+# ===================================================================
+
+# Number of files of one directory removed by each task of PurgePlan.execute()
+PURGE_BATCH = 1000
+
+# ===================================================================
+
+class PurgePlan:
+    """The cached files to remove for `observatory` as `directories` { directory : { basename : size } },
+    with the number of files `kept` and the `contexts` kept.
+    """
+    def __init__(self, observatory, directories=None, kept=0, contexts=(), created=None):
+        self.observatory = observatory
+        self.directories = directories if directories is not None else {}
+        self.kept = kept
+        self.contexts = list(contexts)
+        self.created = created or time.strftime("%Y-%m-%d %H:%M:%S")
+
+    @property
+    def files(self):
+        """Number of files to remove."""
+        return sum(len(files) for files in self.directories.values())
+
+    @property
+    def bytes(self):
+        """Total size in bytes of the files to remove."""
+        return sum(sum(files.values()) for files in self.directories.values())
+
+    def add_directory(self, directory, keep, pattern="*", exclude=None):
+        """Scan `directory` once,  planning the removal of each file matching glob `pattern`
+        and not `exclude` whose name is not in set `keep`.
+        """
+        planned = self.directories.get(directory, {})
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            name = entry.name
+            if (name.startswith(".") or not fnmatch.fnmatch(name, pattern) or
+                (exclude is not None and fnmatch.fnmatch(name, exclude))):
+                continue
+            with log.verbose_warning_on_exception("Failed checking cached file", repr(entry.path)):
+                if entry.is_dir():
+                    continue
+                if name in keep:
+                    self.kept += 1
+                else:
+                    planned[name] = entry.stat().st_size
+        if planned:
+            self.directories[directory] = planned
+
+    def report(self):
+        """Log the files to be removed and the bytes they reclaim."""
+        for directory, files in sorted(self.directories.items()):
+            for name in sorted(files):
+                log.verbose("Purge plan removes", repr(os.path.join(directory, name)), verbosity=60)
+        log.info("Purge plan of", self.created, "removes", self.files, "files totalling",
+                 utils.human_format_number(self.bytes).strip(), "bytes from", len(self.directories),
+                 "directories,  keeping", self.kept, "files used by", len(self.contexts), "contexts.")
+
+    # ---------------------------------------------------------------------------------
+
+    def to_json(self):
+        """Return this plan as a JSON string."""
+        return json.dumps(dict(observatory=self.observatory, created=self.created, contexts=self.contexts,
+                               kept=self.kept, files=self.files, bytes=self.bytes, directories=self.directories),
+                          indent=1, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        """Return the PurgePlan defined by JSON string `text`."""
+        plan = json.loads(text)
+        return cls(plan["observatory"], plan["directories"], plan["kept"], plan["contexts"], plan["created"])
+
+    def save(self, path):
+        """Write this plan to file `path` as JSON."""
+        utils.atomic_write(path, self.to_json())
+
+    @classmethod
+    def load(cls, path):
+        """Return the PurgePlan saved in file `path`."""
+        with open(path) as handle:
+            return cls.from_json(handle.read())
+
+    # ---------------------------------------------------------------------------------
+
+    def execute(self, jobs=1):
+        """Remove the planned files in batches of PURGE_BATCH files of one directory,  removing
+        batches in `jobs` threads.   Return (files removed, bytes removed).
+        """
+        if not config.writable_cache_or_verbose("Skipped purging", self.files, "files."):
+            return 0, 0
+        batches = []
+        for directory, files in sorted(self.directories.items()):
+            with log.error_on_exception("Skipped purging directory", repr(directory)):
+                utils.check_in_cache(directory, self.observatory)
+                names = sorted(name for name in files if self._valid_name(directory, name))
+                batches.extend((directory, names[i:i+PURGE_BATCH]) for i in range(0, len(names), PURGE_BATCH))
+        with crds_cache_locking.get_cache_lock(), crds_cache_locking.get_cache_rw_lock().exclusive():
+            with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+                results = list(executor.map(self._remove_batch, batches))
+            if results and os.path.exists(config.get_crds_blobpath()):
+                blob_store.remove_orphans()
+        removed = sum(count for (count, _nbytes) in results)
+        removed_bytes = sum(nbytes for (_count, nbytes) in results)
+        log.info("Purged", removed, "files totalling", utils.human_format_number(removed_bytes).strip(), "bytes.")
+        return removed, removed_bytes
+
+    def _valid_name(self, directory, name):
+        """Return True IFF planned file `name` is a plain file name,  issuing an error otherwise
+        so that plans cannot remove files outside `directory`.
+        """
+        if os.path.basename(name) != name or name in ["", ".", ".."]:
+            log.error("Skipped purging invalid file name", repr(name), "planned for", repr(directory))
+            return False
+        return True
+
+    def _remove_batch(self, batch):
+        """Remove the files of `batch` (directory, [basenames...]),  returning (files removed, bytes removed)."""
+        directory, names = batch
+        planned = self.directories[directory]
+        removed, removed_bytes = 0, 0
+        for name in names:
+            path = os.path.join(directory, name)
+            with log.error_on_exception("Failed purging", repr(path)):
+                utils.check_in_cache(path, self.observatory)
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    continue
+                if size != planned[name]:
+                    log.verbose_warning("Skipped purging", repr(path), "which changed size since it was planned.")
+                    continue
+                os.remove(path)
+                removed += 1
+                removed_bytes += size
+        log.verbose("Purged", removed, "files from", repr(directory), verbosity=55)
+        return removed, removed_bytes
+
+# ===================================================================
+
+def plan_purge(observatory, keep_mappings=None, keep_references=None, contexts=()):
+    """Return the PurgePlan removing the cached mappings of `observatory` not in `keep_mappings`
+    and the cached references not in `keep_references`.   None means don't purge that kind of file.
+    """
+    plan = PurgePlan(observatory, contexts=contexts)
+    if keep_mappings is not None:
+        plan.add_directory(os.path.dirname(config.locate_mapping("*.pmap", observatory)),
+                           set(keep_mappings), pattern="*.[pir]map")
+    if keep_references is not None:
+        for directory in utils.get_reference_paths(observatory):
+            plan.add_directory(directory, set(keep_references), exclude="*.[pir]map")
+    return plan
+
+# ===================================================================
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.core import purge_plan
+    return doctest.testmod(purge_plan)
+
+if __name__ == "__main__":
+    print(test())
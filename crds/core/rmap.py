@@ -52,6 +52,7 @@ Active instrument references are also broken down by filetype:
 True
 """
 import os.path
+import sys
 import glob
 import json
 
@@ -1603,6 +1604,62 @@ def asmapping(filename_or_mapping, cached=False, **keys):
 
 # =============================================================================
 
+class MappingClosure:
+    """Computes the union of the mapping and reference names in the closures of many
+    mappings,  e.g. every context synced by crds.sync --all,  where successive contexts
+    mostly share the same instrument and reference mappings.
+
+    Each distinct mapping is loaded once,  without adding it to the mappings cache,  and
+    only its basename,  nested mapping names,  and reference names are retained,  interned so
+    that the names shared by successive contexts are stored once.   Mappings already visited
+    for the union are skipped along with their closures.
+    """
+    def __init__(self, **keys):
+        self.keys = keys
+        self._nodes = {}   # mapping :  (basename, nested mapping names, reference names)
+
+    def node(self, mapping):
+        """Return (basename, nested mapping names, reference names) for `mapping`,  loading it
+        only the first time.
+        """
+        try:
+            return self._nodes[mapping]
+        except KeyError:
+            pass
+        loaded = fetch_mapping(mapping, **self.keys)
+        if isinstance(loaded, ContextMapping):
+            nested, references = loaded.selections.normal_filenames(), ()
+        else:
+            nested, references = (), loaded.reference_names()
+        node = (sys.intern(loaded.basename),
+                tuple(sys.intern(name) for name in nested),
+                tuple(sys.intern(name) for name in references))
+        self._nodes[mapping] = node
+        return node
+
+    def closure(self, mapping, visited=None):
+        """Return the sets (mapping names, reference names) in the closure of `mapping`,  omitting
+        the closures of mappings in `visited`.   If the closure is complete,  add its mappings to
+        `visited`.
+        """
+        mapping_names, reference_names = set(), set()
+        seen = set(visited or ())
+        pending = [mapping]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            basename, nested, references = self.node(name)
+            mapping_names.add(basename)
+            reference_names.update(references)
+            pending.extend(nested)
+        if visited is not None:
+            visited |= seen
+        return mapping_names, reference_names
+
+# =============================================================================
+
 class MappingSelectionsDict(LazyFileDict):
     """MappingSelectionsDict is a LazyFileDict with customized special values specific to CRDS.
     Mappings.
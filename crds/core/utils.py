@@ -16,6 +16,8 @@ import datetime
 import ast
 import gc
 import json
+import threading
+import contextlib
 
 # ===================================================================
 
@@ -153,6 +155,8 @@ def cached(func):
     .uncached(*args, **keys)    -- original unwrapped function
     .readonly(*args, **keys)    -- function variant which uses but doesn't update cache
     .cache_key(*args, **keys)   -- returns tuple used to locate a function call result
+    .seed(result, *args, **keys) -- adds a result computed elsewhere to the cache
+    .cached_keys(obj=None)      -- returns the keys of cached calls,  optionally of method calls on `obj`
 
     >>> @cached
     ... def sum(x,y):
@@ -289,8 +293,41 @@ class CachedFunction:
         self.cache[key] = result
         return result
     
+    def seed(self, result, *args, **keys):
+        """Add `result` to the cache as the value of func(*args, **keys) without calling func,
+        e.g. for results computed elsewhere by func.uncached.
+
+        >>> @cached
+        ... def f(x):
+        ...    return x * 2
+        >>> f.seed(5, 1)
+        >>> f(1), f(2)
+        (5, 4)
+        """
+        self.cache[self.cache_key(*args, **keys)] = result
+
+    def cached_keys(self, obj=None):
+        """Return the cache keys of the cached calls.   For a cached method,  return only the
+        keys of calls on instance `obj`,  omitting `obj` itself.
+
+        >>> class C:
+        ...    @cached
+        ...    def m(self, x):
+        ...        return x
+        >>> c, d = C(), C()
+        >>> c.m(1), d.m(2)
+        (1, 2)
+        >>> C.m.cached_keys(c)
+        [(1,)]
+        """
+        if obj is None:
+            return list(self.cache)
+        return [key[1:] for key in self.cache if key and key[0] is obj]
+
     def __get__(self, obj, objtype):
         '''Support instance methods.'''
+        if obj is None:
+            return self
         return functools.partial(self.__call__, obj)
 
 def clear_function_caches():
@@ -608,20 +645,90 @@ def is_writable(filepath, no_exist=True):
 
 # ===================================================================
 
+ATOMIC_TEMP_RE = re.compile(r"^\..+\.tmp\.\d+\.\d+$")   # names made by atomic_temp_path()
+
+def atomic_temp_path(path):
+    """Return the hidden temporary path used by this process and thread to write `path`,
+    in the same directory so it can be renamed to `path`.
+    """
+    return os.path.join(os.path.dirname(path),
+        ".{}.tmp.{}.{}".format(os.path.basename(path), os.getpid(), threading.get_ident()))
+
+def fsync_path(path):
+    """Flush the file or directory at `path` to stable storage."""
+    handle = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(handle)
+    finally:
+        os.close(handle)
+
+def atomic_rename(temp_path, path):
+    """Flush the complete file at `temp_path` to disk and rename it to `path`,  so readers
+    of `path` see either its old contents or the new contents,  never a partial file,  even
+    if this process or the host crashes.   With CRDS_FSYNC_DIRS the directory is flushed
+    too,  making the rename itself durable.
+    """
+    fsync_path(temp_path)
+    os.replace(temp_path, path)
+    if config.FSYNC_DIRS.get():
+        fsync_path(os.path.dirname(os.path.abspath(path)))
+
+@contextlib.contextmanager
+def atomic_open(path, mode="wb", **keys):
+    """Context manager returning a file opened with `mode` and open() `keys` which writes a
+    temporary file renamed to `path` by atomic_rename() if the with block succeeds and is
+    removed otherwise.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "some_file.txt")
+    >>> with atomic_open(path, "w") as handle:
+    ...     _ = handle.write("complete contents")
+    >>> try:
+    ...     with atomic_open(path, "w") as handle:
+    ...         _ = handle.write("partial")
+    ...         raise RuntimeError("writer failed")
+    ... except RuntimeError:
+    ...     pass
+    >>> open(path).read()
+    'complete contents'
+    >>> os.listdir(os.path.dirname(path))
+    ['some_file.txt']
+    """
+    ensure_dir_exists(path)
+    temp_path = atomic_temp_path(path)
+    try:
+        with open(temp_path, mode, **keys) as handle:
+            yield handle
+        atomic_rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def atomic_write(path, contents):
+    """Atomically replace the file at `path` with str or bytes `contents`."""
+    with atomic_open(path, "w" if isinstance(contents, str) else "wb") as handle:
+        handle.write(contents)
+
+# ===================================================================
+
+def check_in_cache(rmpath, observatory):
+    """Raise an AssertionError unless `rmpath` is somewhere in the cache for `observatory`."""
+    abs_path = os.path.abspath(rmpath)
+    abs_cache = os.path.abspath(config.get_crds_path())
+    abs_config = os.path.abspath(config.get_crds_cfgpath(observatory))
+    abs_root_config = os.path.abspath(config.get_crds_root_cfgpath())
+    abs_references = os.path.abspath(config.get_crds_refpath(observatory))
+    abs_mappings = os.path.abspath(config.get_crds_mappath(observatory))
+    abs_pickles = os.path.abspath(config.get_crds_picklepath(observatory))
+    assert abs_path.startswith((abs_cache, abs_config, abs_root_config,
+                                abs_references, abs_mappings, abs_pickles)), \
+        "remove() only works on files in CRDS cache. not: " + repr(rmpath)
+
 def remove(rmpath, observatory):
     """Wipe out directory at 'rmpath' somewhere in cache for `observatory`."""
     if config.writable_cache_or_verbose("Skipped removing", repr(rmpath)):
         with log.error_on_exception("Failed removing", repr(rmpath)):
-            abs_path = os.path.abspath(rmpath)
-            abs_cache = os.path.abspath(config.get_crds_path())
-            abs_config = os.path.abspath(config.get_crds_cfgpath(observatory))
-            abs_root_config = os.path.abspath(config.get_crds_root_cfgpath())
-            abs_references = os.path.abspath(config.get_crds_refpath(observatory))
-            abs_mappings = os.path.abspath(config.get_crds_mappath(observatory))
-            abs_pickles = os.path.abspath(config.get_crds_picklepath(observatory))
-            assert abs_path.startswith((abs_cache, abs_config, abs_root_config,
-                                        abs_references, abs_mappings, abs_pickles)), \
-                "remove() only works on files in CRDS cache. not: " + repr(rmpath)
+            check_in_cache(rmpath, observatory)
             log.verbose("CACHE removing:", repr(rmpath))
             if os.path.isfile(rmpath):
                 os.remove(rmpath)
@@ -9,6 +9,7 @@ from crds.io.abstract import hijack_warnings, convert_to_eval_header, ensure_key
 from crds.io.factory import file_factory, get_observatory, get_filetype, is_dataset
 from crds.io.geis import is_geis, is_geis_data, is_geis_header, get_conjugate
 from crds.io.fits import fits_open, fits_open_trapped, get_fits_header_union
+from crds.io import header_cache
 
 # import asdf
 # import yaml
@@ -61,12 +62,23 @@ def get_free_header(filepath, needed_keys=(), original_name=None, observatory=No
 
     Since get_free_header() is cached,  loading file updates requires first
     clearing the function cache.
+
+    When CRDS_HEADER_CACHE is enabled,  headers are also kept in a persistent
+    cache shared by processes,  see crds.io.header_cache.
     """
-    file_obj = file_factory(filepath, original_name, observatory)
-    header = file_obj.get_header(needed_keys, checksum=False)
+    header = read_free_header(filepath, needed_keys, original_name, observatory)
     log.verbose("Header of", repr(filepath), "=", log.PP(header), verbosity=90)
     return header
 
+def read_free_header(filepath, needed_keys=(), original_name=None, observatory=None):
+    """Like get_free_header() but neither logging nor adding to its function cache,  so it
+    can be called from threads which leave both to the main thread.
+    """
+    def read_header():
+        file_obj = file_factory(filepath, original_name, observatory)
+        return file_obj.get_header(needed_keys, checksum=False)
+    return header_cache.cached_header(filepath, needed_keys, original_name, observatory, read_header)
+
 def clear_header_cache():
     """Flush the header cache,  nominally to recover storage taken by array attributes
     brought in for certify.
@@ -3,29 +3,115 @@ Created on Feb 16, 2017
 
 @author: jmiller
 '''
+import contextlib
+
 # import asdf
 
 # ============================================================================
 
-from crds.core import timestamp, utils, log
+from crds.core import timestamp, utils, log, config
 
 from .abstract import AbstractFile
 
 # ============================================================================
 
+class LazyHeaderError(Exception):
+    """The needed keywords of an ASDF file cannot be read from its unconverted tree."""
+
+def _is_tagged(value):
+    """Return True IFF `value` is or contains a raw ASDF tagged node,  which asdf would
+    otherwise convert to a custom type.
+    """
+    from asdf.tagged import Tagged
+    if isinstance(value, Tagged):
+        return True
+    if isinstance(value, (list, tuple)):
+        return any(_is_tagged(val) for val in value)
+    return False
+
+# ============================================================================
+
 class AsdfFile(AbstractFile):
     
     format = "ASDF"
 
     @utils.gc_collected
     def get_raw_header(self, needed_keys=(), **keys):
-        """Return the flattened header associated with an ASDF file."""
+        """Return the flattened header associated with an ASDF file.
+
+        When only `needed_keys` are required,  only the tree nodes on their dotted paths
+        are visited and history is read only if requested.   Those nodes are first read
+        from the unconverted tree,  so arrays are never loaded and tagged objects like
+        transforms are never instantiated,  falling back to the converted tree when a
+        needed node is itself tagged.
+        """
         import asdf
-        with asdf.open(self.filepath) as handle:
-            header = self.to_simple_types(handle.tree)
+        if not needed_keys:
+            with asdf.open(self.filepath) as handle:
+                header = self.to_simple_types(handle.tree)
+                header["HISTORY"] = self.get_history(handle)
+            return header
+        needed_keys = tuple(key.upper() for key in needed_keys)
+        if config.ASDF_LAZY_HEADERS:
+            try:
+                with self._open_raw() as handle:
+                    return self._get_needed_header(handle, needed_keys, raw=True)
+            except LazyHeaderError as exc:
+                log.verbose("Reading header of", repr(self.filepath), "from converted ASDF tree:",
+                            str(exc), verbosity=70)
+        with asdf.open(self.filepath, lazy_load=True) as handle:
+            return self._get_needed_header(handle, needed_keys)
+
+    @contextlib.contextmanager
+    def _open_raw(self):
+        """Open the unconverted tree of this ASDF file,  lazily loading blocks and skipping
+        schema validation of the whole tree on asdf versions which support it.   Certify
+        reads the full header and so still validates.   Raise LazyHeaderError if this asdf
+        version does not support opening unconverted trees.
+        """
+        import asdf
+        with contextlib.ExitStack() as stack:
+            if hasattr(asdf, "config_context"):
+                stack.enter_context(asdf.config_context()).validate_on_read = False
+            try:
+                handle = asdf.open(self.filepath, lazy_load=True, _force_raw_types=True)
+            except TypeError as exc:   # private parameter dropped or renamed by this asdf version
+                raise LazyHeaderError("Cannot open unconverted ASDF tree: " + str(exc)) from exc
+            yield stack.enter_context(handle)
+
+    def _get_needed_header(self, handle, needed_keys, raw=False):
+        """Return the flattened header of ASDF file object `handle` limited to `needed_keys`."""
+        prefixes = set()
+        for key in needed_keys:
+            parts = key.split(".")
+            prefixes.update(".".join(parts[:i]) for i in range(1, len(parts)))
+        tree_keys = set(needed_keys) - {"HISTORY"}
+        header = self._needed_simple_types(handle.tree, tree_keys, prefixes, raw=raw)
+        if "HISTORY" in needed_keys:
             header["HISTORY"] = self.get_history(handle)
         return header
 
+    def _needed_simple_types(self, tree, needed_keys, prefixes, path="", raw=False):
+        """Like to_simple_types() but only visiting the nodes of `tree` on the dotted paths
+        of `needed_keys`,  the dotted path `prefixes` of which are branches.   For a `raw`
+        tree,  raise LazyHeaderError on reaching a tagged node.
+        """
+        result = dict()
+        for key in tree:
+            if not isinstance(key, str):  # skip non-string keys
+                continue
+            dotted = path + key.upper()
+            if dotted not in prefixes and dotted not in needed_keys:
+                continue
+            value = tree[key]
+            if raw and _is_tagged(value):
+                raise LazyHeaderError("Keyword " + repr(dotted) + " is a tagged node.")
+            if isinstance(value, (type(tree), dict)):
+                result.update(self._needed_simple_types(value, needed_keys, prefixes, dotted + ".", raw))
+            else:
+                result[dotted] = self._simple_type(value)
+        return result
+
     def get_history(self, handle):
         """Given and ASDF file object `handle`, return the history collected into a
         single string.
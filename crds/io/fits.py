@@ -11,7 +11,9 @@ import contextlib
 import uuid
 import os
 import io
+import mmap
 
+import numpy as np
 from astropy.io import fits
 
 # ============================================================================
@@ -53,6 +55,162 @@ def fits_open(filename, **keys):
         if handle is not None:
             handle.close()
 
+# ============================================================================
+
+# FITS BITPIX value --> numpy type code of raw big endian image data
+_BITPIX_TYPES = { 8 : "u1", 16 : "i2", 32 : "i4", 64 : "i8", -32 : "f4", -64 : "f8" }
+
+def hdu_shape_dtype(hdu):
+    """Return the (shape, dtype) of `hdu.data` as astropy would load it,  computed from
+    the header of `hdu` for image and binary table HDUs so no data is read.
+
+    Image dtypes follow astropy's BSCALE/BZERO/BLANK scaling and unsigned integer conventions.
+
+    >>> buffer = io.BytesIO()
+    >>> fits.HDUList([fits.PrimaryHDU(np.zeros((2, 3), dtype="uint16")),
+    ...     fits.BinTableHDU.from_columns([fits.Column(name="X", format="J", array=np.arange(4))])]).writeto(buffer)
+    >>> _ = buffer.seek(0)
+    >>> with fits.open(buffer) as hdus:
+    ...     [hdu_shape_dtype(hdu) for hdu in hdus]
+    [((2, 3), dtype('uint16')), ((4,), dtype([('X', '>i4')]))]
+    """
+    header = hdu.header
+    if isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU)) and hdu.shape:
+        bitpix, bscale, bzero = header["BITPIX"], header.get("BSCALE", 1), header.get("BZERO", 0)
+        if bitpix < 0 or (bscale == 1 and bzero == 0 and "BLANK" not in header):
+            dtype = np.dtype(">" + _BITPIX_TYPES[bitpix])
+        elif bscale == 1 and bitpix == 8 and bzero == -128:
+            dtype = np.dtype("int8")
+        elif bscale == 1 and bitpix > 8 and bzero == 1 << (bitpix - 1):
+            dtype = np.dtype("uint" + str(bitpix))
+        else:
+            dtype = np.dtype("float64" if bitpix > 16 else "float32")
+        return hdu.shape, dtype
+    elif isinstance(hdu, fits.BinTableHDU):
+        return (header["NAXIS2"],), hdu.columns.dtype.newbyteorder(">")
+    else:
+        return hdu.data.shape, hdu.data.dtype
+
+# ============================================================================
+
+class FitsScanError(Exception):
+    """A FITS file is too unusual to read its header with scan_raw_header()."""
+
+FITS_BLOCK_SIZE = 2880
+FITS_CARD_SIZE = 80
+
+def scan_raw_header(filepath, needed_keys=()):
+    """Return the (keyword, value) list of cards for `needed_keys`,  or all cards if there
+    are no `needed_keys`,  from every header of FITS file `filepath`,  in file order,  as
+    FitsFile.get_raw_header() would,  but by scanning the memory mapped header blocks directly
+    and skipping over data segments.
+
+    Only the needed cards are parsed,  using astropy.   Raise FitsScanError for anything
+    unusual,  e.g. compressed or zipped files,  long string values,  or truncated files.
+
+    >>> from crds.tests import test_config
+    >>> path = os.path.join(test_config.TEST_DATA, "j8btxxx_raw_bad.fits")
+    >>> scan_raw_header(path, ["FILETYPE", "DETECTOR", "NAXIS"])
+    [('NAXIS', '0'), ('FILETYPE', 'SCI'), ('DETECTOR', 'SBC'), ('NAXIS', '0'), ('NAXIS', '0'), ('NAXIS', '0')]
+    >>> scan_raw_header(path)[:3]
+    [('SIMPLE', 'True'), ('BITPIX', '16'), ('NAXIS', '0')]
+    """
+    needed_keys = { key.upper() for key in needed_keys }
+    if "CONTINUE" in needed_keys:
+        raise FitsScanError("CONTINUE cards are not scanned.")
+    union = []
+    with open(filepath, "rb") as handle:
+        try:
+            contents = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:   # empty file
+            raise FitsScanError(str(exc)) from exc
+        with contents:
+            offset = 0
+            while offset < len(contents):
+                cards, keywords, offset = _scan_hdu(contents, offset)
+                union.extend(_parse_needed_cards(cards, keywords, needed_keys))
+    return union
+
+def _scan_hdu(contents, offset):
+    """Return the array of (keyword, rest) cards of the HDU header at `offset` of `contents`,
+    their stripped upper case keywords,  and the offset of the next HDU following its data.
+    """
+    start = offset
+    expected = b"SIMPLE  =" if offset == 0 else b"XTENSION="
+    if contents[offset:offset+len(expected)] != expected:
+        raise FitsScanError("Expected " + repr(expected) + " at offset " + str(offset))
+    end_card = None
+    while end_card is None:
+        block = contents[offset:offset+FITS_BLOCK_SIZE]
+        if len(block) < FITS_BLOCK_SIZE:
+            raise FitsScanError("Truncated or missing END in header at offset " + str(start))
+        for i in range(0, FITS_BLOCK_SIZE, FITS_CARD_SIZE):
+            if block[i:i+3] == b"END" and block[i+3:i+FITS_CARD_SIZE].strip() == b"":
+                end_card = offset - start + i
+                break
+        offset += FITS_BLOCK_SIZE
+    header = contents[start:start+end_card]
+    if not header.isascii():
+        raise FitsScanError("Non-ASCII header at offset " + str(start))
+    cards = np.frombuffer(header, dtype=_CARD_DTYPE)
+    keywords = np.char.upper(np.char.rstrip(cards["keyword"]))
+    offset += _data_size(cards, keywords)
+    if offset > len(contents):
+        raise FitsScanError("Truncated data for header at offset " + str(start))
+    return cards, keywords, offset
+
+_CARD_DTYPE = np.dtype([("keyword", "S8"), ("rest", "S" + str(FITS_CARD_SIZE - 8))])
+
+def _card_value(cards, keywords, keyword, default=None):
+    """Return the value string of the first `keyword` card or `default` if there is none."""
+    where = np.flatnonzero(keywords == keyword)
+    if not len(where):
+        return default
+    return cards["rest"][where[0]][2:].split(b"/")[0].strip().decode("ascii")
+
+def _data_size(cards, keywords):
+    """Return the size of the data segment described by header `cards` including padding."""
+    if _card_value(cards, keywords, b"ZIMAGE") == "T":
+        raise FitsScanError("Compressed image headers are not scanned.")
+    try:
+        naxis = int(_card_value(cards, keywords, b"NAXIS"))
+        if naxis == 0:
+            return 0
+        axes = [int(_card_value(cards, keywords, b"NAXIS" + str(i).encode())) for i in range(1, naxis+1)]
+        if _card_value(cards, keywords, b"GROUPS") == "T" and axes[0] == 0:   # random groups
+            axes = axes[1:]
+        elements = 1
+        for axis in axes:
+            elements *= axis
+        size = abs(int(_card_value(cards, keywords, b"BITPIX"))) // 8 * \
+            int(_card_value(cards, keywords, b"GCOUNT", 1)) * \
+            (int(_card_value(cards, keywords, b"PCOUNT", 0)) + elements)
+    except (TypeError, ValueError) as exc:
+        raise FitsScanError("Bad or missing data size keyword: " + str(exc)) from exc
+    return -(-size // FITS_BLOCK_SIZE) * FITS_BLOCK_SIZE
+
+def _parse_needed_cards(cards, keywords, needed_keys):
+    """Parse the `cards` of `needed_keys`,  or all cards with keywords for no `needed_keys`,
+    with astropy,  as header reads do.
+    Return [(keyword, value), ...]
+    """
+    if not needed_keys:
+        if np.any(keywords == b"CONTINUE"):
+            raise FitsScanError("Long string values are not scanned.")
+        needed = keywords != b""
+    else:
+        needed = np.isin(keywords, [key.encode("ascii", "replace") for key in needed_keys])
+        for i in np.flatnonzero(keywords == b"HIERARCH"):
+            needed[i] = cards["rest"][i].split(b"=")[0].strip().upper().decode("ascii") in needed_keys
+    parsed = []
+    for i in np.flatnonzero(needed):
+        if i + 1 < len(cards) and keywords[i+1] == b"CONTINUE":
+            raise FitsScanError("Long string value for " + repr(keywords[i]) + " is not scanned.")
+        card = fits.Card.fromstring((cards["keyword"][i].ljust(8) + cards["rest"][i]).decode("ascii"))
+        card.verify('fix')
+        parsed.append((card.keyword, str(card.value)))
+    return parsed
+
 def get_fits_header_union(filepath, needed_keys=(), original_name=None, observatory=None, **keys):
     """Get the union of keywords from all header extensions of FITS
     file `fname`.  In the case of collisions, keep the first value
@@ -87,8 +245,8 @@ class FitsFile(AbstractFile):
         pseudonym like this:
 
         # does next to nothing.
-        >>> import os.path
-        >>> path = os.path.abspath("tests/data/y951738kl_hv.fits")
+        >>> from crds.tests import test_config
+        >>> path = os.path.join(test_config.TEST_DATA, "y951738kl_hv.fits")
         >>> fits_file = FitsFile(path)
 
          # doesn't require a real file or validate that it exists
@@ -155,7 +313,17 @@ class FitsFile(AbstractFile):
         """Get the union of keywords from all header extensions of FITS
         file `fname`.  In the case of collisions, keep the first value
         found as extensions are loaded in numerical order.
+
+        When no checksums are verified,  the header blocks are scanned directly,  falling
+        back to astropy for unusual files.   Whole headers,  e.g. for bestrefs --files and
+        certify,  are scanned as well as `needed_keys`.
         """
+        if (config.FITS_SCAN_HEADERS and set(keys) <= {"checksum"} and
+                not keys.get("checksum", bool(config.FITS_VERIFY_CHECKSUM))):
+            try:
+                return scan_raw_header(self.filepath, needed_keys)
+            except FitsScanError as exc:
+                log.verbose("Reading header of", repr(self.filepath), "with astropy:", str(exc), verbosity=70)
         union = []
         with fits_open(self.filepath, **keys) as hdulist:
             for hdu in hdulist:
@@ -169,7 +337,7 @@ class FitsFile(AbstractFile):
 
     def get_array_properties(self, array_name, keytype="A"):
         """Return a Struct defining the properties of the FITS array in extension named `array_name`."""
-        with fits_open(self.filepath) as hdulist:
+        with fits_open(self.filepath, checksum=False) as hdulist:
             try:
                 array_name = self._array_name_to_hdu_index(array_name)
                 hdu = hdulist[array_name[1]]
@@ -179,15 +347,15 @@ class FitsFile(AbstractFile):
                 "IMAGEHDU" : "IMAGE",
                 "BINTABLEHDU" : "TABLE", 
             }.get(hdu.__class__.__name__.upper(), "UNKNOWN")
+            shape, dtype = hdu_shape_dtype(hdu)
             if generic_class in ["IMAGE","UNKNOWN"]:
-                typespec = hdu.data.dtype.name
+                typespec = dtype.name
                 column_names = None
             else: # TABLE
-                dtype = hdu.data.dtype
                 typespec = {name.upper():str(dtype.fields[name][0]) for name in dtype.names}
-                column_names = [name.upper() for name in hdu.data.dtype.names]
+                column_names = [name.upper() for name in dtype.names]
             return utils.Struct( 
-                        SHAPE = hdu.data.shape,
+                        SHAPE = shape,
                         KIND = generic_class,
                         DATA_TYPE = typespec,
                         COLUMN_NAMES = column_names,
@@ -0,0 +1,227 @@
+"""This module defines an optional persistent cache of the headers read by
+crds.data_file.get_free_header(),  so that repeated bestrefs,  certify,  and matches runs
+over the same files do not re-read identical headers in every new process.
+
+Headers are stored in a SQLite database under the CRDS cache,  <CRDS_PATH>/headers by
+default,  keyed by the real path,  size,  and modification time of each file along with
+the requested keywords,  so a file which is rewritten is simply read again.   SQLite's file
+locking lets concurrent processes share the cache,  and any cache failure falls back to
+reading the file.   When the cache grows past CRDS_HEADER_CACHE_MAX_MB,  the least
+recently used headers are evicted.
+
+The cache is enabled by setting CRDS_HEADER_CACHE=1 and can be purged like this:
+
+% crds header_cache --purge
+
+>>> import tempfile
+>>> cache = HeaderCache(os.path.join(tempfile.mkdtemp(), "headers.sqlite3"), max_bytes=2**20)
+>>> filename = os.path.join(tempfile.mkdtemp(), "some_dataset.fits")
+>>> with open(filename, "w+") as handle:
+...     _ = handle.write("some contents")
+>>> def read_header():
+...     print("reading header")
+...     return {"INSTRUME" : "ACS"}
+>>> cache.header(filename, ("INSTRUME",), None, "hst", read_header)
+reading header
+{'INSTRUME': 'ACS'}
+>>> cache.header(filename, ("INSTRUME",), None, "hst", read_header)
+{'INSTRUME': 'ACS'}
+>>> cache.stats()["headers"]
+1
+>>> cache.purge()
+>>> cache.stats()["headers"]
+0
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+
+# ===================================================================
+
+from crds.core import log, utils, config, cmdline
+
+# ===================================================================
+
+HEADER_CACHE_NAME = "headers.sqlite3"
+
+SCHEMA = """
+create table if not exists headers (key text primary key, header blob not null,
+                                    size integer not null, accessed real not null) without rowid;
+create index if not exists headers_accessed on headers (accessed);
+"""
+
+# Seconds to wait for other processes to release the database.
+_TIMEOUT = 60.0
+
+# Headers are saved this many times by a process between checks of the cache size.
+_EVICT_INTERVAL = 100
+
+# Access times are only updated when older than this many seconds,  limiting writes on reads.
+_ACCESS_RESOLUTION = 60.0
+
+# ===================================================================
+
+class HeaderCache:
+    """Persistent cache of file headers in the SQLite database file `path`,  limited
+    to roughly `max_bytes` of pickled headers.
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._puts = 0
+
+    @property
+    def connection(self):
+        """Return this thread's connection to the cache database,  reconnecting after fork()."""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            if config.get_cache_readonly():
+                local.connection = sqlite3.connect("file:" + self.path + "?mode=ro", uri=True, timeout=_TIMEOUT)
+            else:
+                utils.ensure_dir_exists(self.path)
+                local.connection = sqlite3.connect(self.path, timeout=_TIMEOUT)
+                local.connection.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.connection
+
+    def key(self, filepath, needed_keys, original_name, observatory):
+        """Return the cache key for the header of `filepath`,  identifying the current file
+        contents by its real path,  size,  and modification time.
+        """
+        stat = os.stat(filepath)
+        return utils.str_checksum(repr((os.path.realpath(filepath), stat.st_size, stat.st_mtime_ns,
+                                        tuple(needed_keys), original_name, observatory)))
+
+    def get(self, key):
+        """Return the cached header for `key` or None."""
+        row = self.connection.execute("select header, accessed from headers where key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        header = pickle.loads(row[0])
+        now = time.time()
+        if row[1] < now - _ACCESS_RESOLUTION and not config.get_cache_readonly():
+            with log.verbose_warning_on_exception("Failed updating header cache access time"):
+                with self.connection as connection:
+                    connection.execute("update headers set accessed = ? where key = ?", (now, key))
+        return header
+
+    def put(self, key, header):
+        """Save `header` under `key`,  periodically evicting old headers to limit cache size."""
+        if not config.writable_cache_or_verbose("Skipped saving header to header cache."):
+            return
+        blob = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.connection as connection:
+            connection.execute("insert or replace into headers (key, header, size, accessed) values (?, ?, ?, ?)",
+                               (key, blob, len(blob), time.time()))
+        self._puts += 1
+        if self._puts % _EVICT_INTERVAL == 1:
+            self.evict()
+
+    def header(self, filepath, needed_keys, original_name, observatory, read_header):
+        """Return the cached header of `filepath` or the result of `read_header()`,  saving it."""
+        key = header = None
+        with log.verbose_warning_on_exception("Failed reading header cache for", repr(filepath)):
+            key = self.key(filepath, needed_keys, original_name, observatory)
+            header = self.get(key)
+        if header is None:
+            header = read_header()
+            if key is not None:
+                with log.verbose_warning_on_exception("Failed saving header cache for", repr(filepath)):
+                    self.put(key, header)
+        else:
+            log.verbose("Using cached header for", repr(filepath), verbosity=60)
+        return header
+
+    def evict(self, max_bytes=None):
+        """Delete the least recently used headers until the cache holds at most `max_bytes`,
+        defaulting to the cache's limit.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self.connection as connection:
+            total = connection.execute("select coalesce(sum(size), 0) from headers").fetchone()[0]
+            if total <= max_bytes:
+                return
+            evicted = connection.execute("""
+                delete from headers where key in (
+                    select key from (select key, sum(size) over (order by accessed desc, key) as kept
+                                     from headers) where kept > ?)""", (max_bytes,)).rowcount
+        log.verbose("Evicted", evicted, "headers from header cache", repr(self.path))
+
+    def purge(self):
+        """Delete every header in the cache."""
+        with self.connection as connection:
+            connection.execute("delete from headers")
+        self.connection.execute("vacuum")
+
+    def stats(self):
+        """Return a dictionary describing the number and size of cached headers."""
+        count, size = self.connection.execute(
+            "select count(*), coalesce(sum(size), 0) from headers").fetchone()
+        return dict(path=self.path, headers=count, bytes=size, max_bytes=self.max_bytes)
+
+# ===================================================================
+
+def get_header_cache():
+    """Return the HeaderCache defined by the CRDS configuration."""
+    return _get_header_cache(os.path.join(config.get_crds_header_cachepath(), HEADER_CACHE_NAME),
+                             config.HEADER_CACHE_MAX_MB.get() * 2**20)
+
+@utils.cached
+def _get_header_cache(path, max_bytes):
+    """Return the HeaderCache at `path` limited to `max_bytes`,  shared within the process."""
+    return HeaderCache(path, max_bytes)
+
+def cached_header(filepath, needed_keys, original_name, observatory, read_header):
+    """Return the header of `filepath` from the persistent header cache if enabled by
+    CRDS_HEADER_CACHE,  otherwise or on a cache miss return `read_header()`.
+    """
+    if not config.HEADER_CACHE.get():
+        return read_header()
+    return get_header_cache().header(filepath, needed_keys, original_name, observatory, read_header)
+
+# ===================================================================
+
+class HeaderCacheScript(cmdline.Script):
+    """Command line script for managing the persistent CRDS header cache."""
+
+    description = """
+Reports on,  trims,  or purges the persistent cache of file headers enabled by
+CRDS_HEADER_CACHE=1 and located at <CRDS_PATH>/headers or CRDS_HEADER_CACHEPATH.
+"""
+
+    epilog = """
+% crds header_cache --report
+% crds header_cache --evict
+% crds header_cache --purge
+"""
+
+    def add_args(self):
+        self.add_argument("--report", action="store_true", help="Print the number and size of cached headers.")
+        self.add_argument("--evict", action="store_true",
+                          help="Evict least recently used headers down to CRDS_HEADER_CACHE_MAX_MB.")
+        self.add_argument("--purge", action="store_true", help="Delete all cached headers.")
+
+    def main(self):
+        cache = get_header_cache()
+        if self.args.purge:
+            cache.purge()
+            log.info("Purged header cache", repr(cache.path))
+        if self.args.evict:
+            cache.evict()
+        if self.args.report or not (self.args.purge or self.args.evict):
+            for key, value in cache.stats().items():
+                print(key, "=", value)
+        return log.errors()
+
+def test():
+    """Run module doctests."""
+    import doctest
+    from crds.io import header_cache
+    return doctest.testmod(header_cache)
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(HeaderCacheScript()())
@@ -1,10 +1,11 @@
 """This module defines an abstract API for tables used in CRDS file certification row checks
 and bestrefs table effects determinations.  In both cases it basically provides a list of 
 SimpleTable objects,  one per segment/hdu for a table file and a simple object which gives 
-readonly row acess to each segment.
+readonly row and column access to each segment.
 """
 
 import os.path
+from collections.abc import Sequence
 
 from astropy import table
 
@@ -51,38 +52,93 @@ def clear_cache():
 
 
 class SimpleTable:
-    """A simple class to encapsulate astropy tables for basic CRDS readonly table row and colname access."""
+    """A simple class to encapsulate astropy tables for basic CRDS readonly table row and colname access.
+
+    Column data is kept as numpy arrays,  one per column.   For FITS tables only the column names
+    and row count are read when the table is created;  each column is copied out of the file the
+    first time it is used,  so callers pay only for the columns they touch.   Use load_columns()
+    to read several columns in one pass over the file.
+
+    Rows are materialized as tuples on demand by the `rows` view.
+    """
     def __init__(self, filename, segment=1):
         self.filename = filename
         self.segment = segment
         self.basename = os.path.basename(filename)
-        self._columns = None  # dynamic,  independent of astropy
+        self._columns = {}   # { colname : array }, loaded on demand for FITS
         if filename.endswith(".fits"):
             with data_file.fits_open(filename) as hdus:
-                tab = hdus[segment].data
-                self.colnames = tuple(name.upper() for name in tab.columns.names)
-                self.rows = tuple(tuple(row) for row in tab)   # readonly
+                hdu = hdus[segment]
+                self._names = tuple(hdu.columns.names)
+                self.nrows = hdu.header.get("NAXIS2", 0)
         else:
             tab = table.Table.read(filename)
-            self.colnames = tuple(name.upper() for name in tab.columns)
-            self.rows = tuple(tuple(row) for row in tab)   # readonly
+            self._names = tuple(tab.columns)
+            self.nrows = len(tab)
+            for name in self._names:
+                self._columns[name.upper()] = tab.columns[name]
+        self.colnames = tuple(name.upper() for name in self._names)
+        self.rows = TableRows(self)   # readonly
         log.verbose("Creating", repr(self), verbosity=60)
-        
+
+    def load_columns(self, colnames=None):
+        """Load the columns named in `colnames`,  or all columns,  with one read of the table file.
+        Columns already loaded are not re-read.
+
+        Returns [ column_array, ... ] corresponding to `colnames`.
+        """
+        colnames = self.colnames if colnames is None else tuple(name.upper() for name in colnames)
+        missing = [name for name in colnames if name not in self._columns]
+        if missing:
+            log.verbose("Loading columns", missing, "from", repr(self.basename), "segment", self.segment,
+                        verbosity=60)
+            # checksums,  if enabled,  were already verified when the table was listed
+            with data_file.fits_open(self.filename, checksum=False) as hdus:
+                data = hdus[self.segment].data
+                for name in missing:
+                    self._columns[name] = data.field(self._names[self.colnames.index(name)]).copy()
+        return [self._columns[name] for name in colnames]
+
+    def column(self, colname):
+        """Return the array of values for column `colname`,  loading it if needed."""
+        return self.load_columns([colname])[0]
+
     @property
     def columns(self):
-        """Based on the row tuples,  create columns dict dynamically.  This permits closing astropy Table during __init__.
-        
-        Retuns { colname : column, ... }
-        """
-        if self._columns is None:
-            self._columns = dict(list(zip(self.colnames, list(zip(*self.rows)))))
-        return self._columns
-        
+        """Load all columns and return { colname : column_array, ... }"""
+        self.load_columns()
+        return { name : self._columns[name] for name in self.colnames }
+
     def __repr__(self):
         return (self.__class__.__name__ + "(" + repr(self.basename) + ", " + repr(self.segment) + ", colnames=" +
-                repr(self.colnames) + ", nrows=" + str(len(self.rows)) + ")")
-    
-    
+                repr(self.colnames) + ", nrows=" + str(self.nrows) + ")")
+
+
+class TableRows(Sequence):
+    """Readonly sequence view of the rows of a SimpleTable,  creating each row tuple as it is
+    accessed.   Accessing rows loads all columns of the table.
+    """
+    def __init__(self, simple_table):
+        self._table = simple_table
+
+    def __len__(self):
+        return self._table.nrows
+
+    def __getitem__(self, index):
+        columns = self._table.load_columns()
+        if isinstance(index, slice):
+            return tuple(zip(*[column[index] for column in columns]))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("table row index out of range")
+        return tuple(column[index] for column in columns)
+
+    def __iter__(self):
+        return zip(*self._table.load_columns())
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + repr(self._table) + ")"
 
 def test():
     import doctest, crds.io.tables
@@ -217,7 +217,7 @@ Example get_synophot runs:
         table = tables.tables(tab_path)[0]
         
         fileinfo = {}
-        for syn_name in table.columns["FILENAME"]:
+        for syn_name in table.column("FILENAME"):
 
             iraf_path, basename = syn_name.split("$")
             name = basename.split("[")[0]  # remove parameterization
@@ -79,7 +79,7 @@ def insert_mapping(context, mapping):
     that <type> of <instrument> should be set to "N/A".
     """
     # 'ACS' : 'hst_acs.imap',
-    where = rmap.locate_mapping(context)
+    where = config.relocate_mapping(context)
     # readonly caching is ok because this call is always made on a newly named
     # copy of the original rmap;  the only thing mutated is the uncached new mapping.
     loaded = rmap.asmapping(context, cache="readonly")
@@ -96,7 +96,7 @@ def insert_mapping(context, mapping):
 def copy_mapping(old_map, new_map):
     """Make a copy of mapping `old_map` named `new_map`."""
     old_path = rmap.locate_mapping(old_map)
-    new_path = rmap.locate_mapping(new_map)
+    new_path = config.relocate_mapping(new_map)
     assert not os.path.exists(new_path), "New mapping file " + repr(new_map) + " already exists."
     shutil.copyfile(old_path, new_path)
 
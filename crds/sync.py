@@ -9,6 +9,11 @@ removed by specifying --purge-mappings or --purge-references::
 will remove references or mappings not required by hst_0001.pmap or 
 hst_0002.pmap in addition to downloading the required files.
 
+Large purges can be planned,  reviewed,  and executed later::
+
+  % crds sync --contexts hst_0002.pmap --purge-references --purge-plan purge.json
+  % crds sync --execute-purge-plan purge.json --purge-jobs 16
+
 Or explicitly list the files you want cached:
 
   % crds sync --files <references or mappings to cache>
@@ -21,18 +26,26 @@ To sync best references and rules for specific dataset ids:
 
   % crds sync --contexts hst_0001.pmap hst_0002.pmap --dataset-ids J6M915030 --fetch-references
 
+To keep a cache warm for the contexts the server announces next:
+
+  % crds sync --watch --fetch-references --save-pickles
+
 """
 import sys
 import os
 import os.path
 import re
-import shutil
+import time
 import glob
+import contextlib
+import itertools
+import multiprocessing
 
 # ============================================================================
 
 import crds
-from crds.core import log, config, utils, rmap, heavy_client, cmdline, crds_cache_locking
+from crds.core import log, config, utils, rmap, heavy_client, cmdline, crds_cache_locking, cache_manifest, blob_store
+from crds.core import purge_plan
 from crds import data_file
 from crds.core.log import srepr
 from crds.client import api
@@ -44,6 +57,8 @@ from crds.client import api
 class SyncScript(cmdline.ContextsScript):
     """Command line script for synchronizing local CRDS file cache with CRDS server."""
 
+    manifest = None   # CacheManifest of verified sha1sums,  set by verify_files()
+
     description = """
     Synchronize local mapping and reference caches for the given contexts by
     downloading missing files from the CRDS server and/or archive.
@@ -122,7 +137,13 @@ class SyncScript(cmdline.ContextsScript):
             % crds sync  --contexts hst_0004.pmap hst_0005.pmap --purge-references
             
         Again, both of these commands remove cached files which are not specified or implied.
-    
+
+        The files and bytes to be removed are reported first.   For large caches the removal
+        can be saved as a JSON plan,  reviewed,  and executed later using parallel threads::
+
+            % crds sync  --contexts hst_0005.pmap --purge-references --purge-plan purge.json
+            % crds sync  --execute-purge-plan purge.json --purge-jobs 16
+
     * References for Dataset Files
     
         References required by particular dataset files can be cached like this::
@@ -157,7 +178,16 @@ class SyncScript(cmdline.ContextsScript):
         File checksum verification is optional because it is time consuming.  Verifying the contents of the current
         HST shared cache requires 8-10 hours.   In contrast, doing simple length, existence, and status checks 
         takes 5-10 minutes,  sufficient for a quick check but not foolproof.
-        
+
+        Storage which serves many concurrent readers well,  e.g. parallel file systems,  can compute
+        sha1sums in several worker processes while still reporting and repairing in file order::
+
+            % crds sync --contexts hst_0001.pmap --fetch-references --check-sha1sum --verify-jobs 16
+
+        Verified sha1sums are recorded in a manifest in the CRDS cache,  so later checks only re-hash files
+        whose size,  modification time,  or inode changed.   Unchanged files can also be re-hashed after an age
+        limit with --rehash-older-than DAYS,  or always with --rehash-all.
+
     * Checking Smaller Caches,  Identifying Foreign Files
     
         The simplest approach for "repairing" a small cache is to delete it and resync::
@@ -187,6 +217,27 @@ class SyncScript(cmdline.ContextsScript):
         would first sync the cache downloading all the files in hst_0001.pmap.  Both mappings and references would then
         be checked for correct length.   Files reported as rejected or blacklisted by the server would be removed.
       
+    * Warming the Cache for New Contexts
+
+        Rather than having every pipeline process fetch the files of a newly announced operational
+        context on demand,  crds sync can run continuously and prepare the cache ahead of them::
+
+          % crds sync --watch --fetch-references --save-pickles
+
+        polls the CRDS server every --watch-interval seconds,  or CRDS_SYNC_WATCH_INTERVAL (300).  When
+        the operational or edit context changes,  the mappings and references of the new contexts are
+        fetched,  checked with any of --check-files, --check-sha1sum, or --repair-files,  loaded to verify
+        they parse,  and pickled with --save-pickles.   Only when all of that succeeds is the cache
+        config,  including the default context used by pipelines,  updated and the warmed contexts
+        recorded in the cache config file sync_watch_contexts.   Otherwise the next poll
+        tries again.   --watch-polls N stops after N polls.
+
+        The watcher only controls its own updates of the cache config.   Any other CRDS client
+        connected to the server,  e.g. a pipeline process,  also records the server's contexts in
+        the cache config,  possibly before the watcher has warmed them.   The watcher still warms
+        those contexts,  but the cache only stays ahead of pipelines which run offline from it.
+        --watch cannot be combined with --purge-mappings or --purge-references.
+
     * Reorganizing cache structure
     
         CRDS now supports two cache structures for organizing references: flat and instrument.  *flat* places all references
@@ -225,6 +276,13 @@ class SyncScript(cmdline.ContextsScript):
                           help='Remove reference files not referred to by contexts from the cache.')
         self.add_argument('--purge-mappings', action='store_true', dest="purge_mappings",
                           help='Remove mapping files not referred to by contexts from the cache.')
+        self.add_argument('--purge-plan', metavar='FILE', type=str, default=None,
+                          help='For --purge-mappings and --purge-references,  save the files to remove as a JSON plan '
+                          'in FILE rather than removing them.')
+        self.add_argument('--execute-purge-plan', metavar='FILE', type=str, default=None,
+                          help='Remove the files listed by a purge plan saved with --purge-plan.')
+        self.add_argument('--purge-jobs', type=int, default=4, metavar='N',
+                          help='Remove purged files in N parallel threads,  each removing batches of files from one directory.')
         self.add_argument('--dry-run', action="store_true",
                           help= "Don't remove purged files, or repair files,  just print out their names.")
         
@@ -232,6 +290,13 @@ class SyncScript(cmdline.ContextsScript):
                           help='Check cached files against the CRDS database and report anomalies.')
         self.add_argument('-s', '--check-sha1sum', action='store_true', dest='check_sha1sum',
                           help='For --check-files,  also verify file sha1sums.')
+        self.add_argument('--rehash-older-than', type=float, default=None, metavar='DAYS',
+                          help='For --check-sha1sum,  re-hash files last verified more than DAYS ago even if unchanged.')
+        self.add_argument('--rehash-all', action='store_true',
+                          help='For --check-sha1sum,  re-hash every file,  ignoring sha1sums recorded in the cache manifest.')
+        self.add_argument('--verify-jobs', type=int, default=1, metavar='N',
+                          help='For --check-sha1sum,  compute sha1sums in N parallel processes.  Size N to the concurrent readers '
+                          'your storage serves well,  not the CPU count.  Output is still reported in file order.')
         self.add_argument('-r', '--repair-files', action='store_true', dest='repair_files',
                           help='Repair or re-download files noted as bad by --check-files')
         self.add_argument('--purge-rejected', action='store_true', dest='purge_rejected',
@@ -259,7 +324,19 @@ class SyncScript(cmdline.ContextsScript):
                           help="Remove CRDS cache file lock(s).")
         self.add_argument("--force-config-update", action="store_true",
                           help="Even if sync errors occur, attempt to update the CRDS configuration, including the default context.")
-        
+        self.add_argument("--watch", action="store_true",
+                          help="Run continuously,  syncing new operational and edit contexts before updating the cache config.  "
+                          "Other connected clients may still update the cache config first.")
+        self.add_argument("--watch-interval", type=int, default=None, metavar="SECONDS",
+                          help="For --watch,  seconds between server polls,  defaulting to CRDS_SYNC_WATCH_INTERVAL.")
+        self.add_argument("--watch-polls", type=int, default=0, metavar="N",
+                          help="For --watch,  stop after N polls of the server.  0 means never stop.")
+        
+    def __init__(self, *args, **keys):
+        super(SyncScript, self).__init__(*args, **keys)
+        if self.args.watch and (self.args.purge_mappings or self.args.purge_references):
+            self.parser.error("--watch cannot be used with --purge-mappings or --purge-references.")
+
     # ------------------------------------------------------------------------------------------
     
     def main(self):
@@ -282,9 +359,20 @@ class SyncScript(cmdline.ContextsScript):
         if self.args.organize:   
             self.organize_references(self.args.organize)
 
+        # remove the files of a purge plan saved by an earlier --purge-plan,  no server required.
+        if self.args.execute_purge_plan:
+            self.execute_purge_plan(self.args.execute_purge_plan)
+            return log.errors()
+
         # fetching and verifying files both require a server connection.
         self.require_server_connection()
 
+        # long running cache warmer,  syncing each new context announced by the server.
+        if self.args.watch:
+            self.watch()
+            self.report_stats()
+            return log.errors()
+
         # primary sync'ing occurs here,  both mappings and references as well as odd-ball
         # server sqlite3 database download.
         verify_file_list = self.file_transfers()
@@ -361,16 +449,16 @@ class SyncScript(cmdline.ContextsScript):
         purge references with respect to the specified contexts.
         """
         active_mappings = self.get_context_mappings()
-        verify_file_list = active_mappings
+        verify_file_list = list(active_mappings)
+        active_references = None
         if self.args.fetch_references or self.args.purge_references:
             active_references = self.get_synced_references()
             if self.args.fetch_references:
                 self.fetch_files(self.contexts[0], active_references)
                 verify_file_list += active_references
-            if self.args.purge_references:
-                self.purge_references(active_references)    
-        if self.args.purge_mappings:
-            self.purge_mappings()
+        if self.args.purge_mappings or self.args.purge_references:
+            self.purge(active_mappings if self.args.purge_mappings else None,
+                       active_references if self.args.purge_references else None)
         return verify_file_list
 
     def get_synced_references(self):
@@ -447,14 +535,114 @@ class SyncScript(cmdline.ContextsScript):
 
     # ------------------------------------------------------------------------------------------
 
+    def watch(self):
+        """Poll the CRDS server every --watch-interval seconds and warm the cache for each
+        new operational or edit context before updating the cache config.
+        """
+        interval = self.args.watch_interval
+        if interval is None:
+            interval = config.SYNC_WATCH_INTERVAL.get()
+        warmed = self.cached_watch_contexts()
+        log.info("Watching CRDS server", repr(api.get_crds_server()), "every", interval,
+                 "seconds for contexts other than", warmed)
+        polls = 0
+        while True:
+            contexts = self.poll_watch_contexts()
+            if contexts and contexts != warmed and self.warm_contexts(contexts):
+                warmed = contexts
+            polls += 1
+            if self.args.watch_polls and polls >= self.args.watch_polls:
+                break
+            time.sleep(interval)
+
+    def watched_contexts(self, info):
+        """Return the sorted operational and edit contexts of server or cache config `info`."""
+        return sorted({info.get(kind) for kind in ["operational_context", "edit_context"] if info.get(kind)})
+
+    def watch_contexts_path(self):
+        """Return the path of the cache config file recording the contexts last warmed by --watch."""
+        return os.path.join(config.get_crds_cfgpath(self.observatory), "sync_watch_contexts")
+
+    def cached_watch_contexts(self):
+        """Return the contexts last warmed by --watch,  or [] if there are none.   The server_config
+        is not used since any connected client updates it without warming the cache.
+        """
+        path = self.watch_contexts_path()
+        if os.path.exists(path):
+            with log.verbose_warning_on_exception("Failed loading warmed contexts", repr(path)):
+                with open(path) as handle:
+                    return sorted(handle.read().split())
+        return []
+
+    def poll_watch_contexts(self):
+        """Return the watched contexts currently announced by the server,  or None if the
+        server cannot be reached.
+        """
+        utils.clear_function_caches()   # re-fetch server info,  file info,  and mapping closures
+        with log.warn_on_exception("Failed polling CRDS server", repr(api.get_crds_server())):
+            info = heavy_client.get_config_info(self.observatory)
+            if info.connected and info.status == "server":
+                return self.watched_contexts(info)
+            log.verbose("CRDS server unavailable or cache readonly,  skipping poll.")
+        return None
+
+    def warm_contexts(self, contexts):
+        """Sync,  verify,  and optionally pickle `contexts`,  then update the cache config.
+        Return True IFF everything succeeded and the cache config was updated.
+        """
+        log.info("Warming CRDS cache for contexts", contexts)
+        errors = log.errors()
+        with log.error_on_exception("Failed warming CRDS cache for", contexts):
+            self.contexts = list(contexts)
+            verify_file_list = self.interpret_contexts()
+            if sorted(self.contexts) != contexts:
+                log.error("Failed syncing contexts", sorted(set(contexts) - set(self.contexts)))
+            if self.args.check_files or self.args.check_sha1sum or self.args.repair_files:
+                self.verify_files(verify_file_list)
+            for context in self.contexts:
+                with log.error_on_exception("Failed loading context", repr(context)):
+                    rmap.get_cached_mapping(context).force_load()
+            if self.args.save_pickles:
+                self.pickle_contexts(self.contexts)
+        if log.errors() > errors:
+            log.warning("Errors warming contexts", contexts, ",  not updating CRDS cache config.")
+            return False
+        heavy_client.update_config_info(self.observatory)
+        heavy_client.cache_atomic_write(self.watch_contexts_path(), "\n".join(contexts), "WARMED CONTEXTS")
+        log.info("Updated CRDS cache config for contexts", contexts)
+        return True
+
+    # ------------------------------------------------------------------------------------------
+
     def purge_mappings(self):
         """Remove all mappings not under pmaps `self.contexts`."""
-        # rmap.list_mappings lists all mappings in the *local* cache.
-        # in contrast,  client.list_mappings globs available mappings in the server cache.
-        purge_maps = set(rmap.list_mappings('*.[pir]map', self.observatory))
-        keep = set(self.get_context_mappings())
-        self.remove_files(sorted(purge_maps-keep), "mapping")
+        self.purge(keep_mappings=self.get_context_mappings())
+
+    def purge(self, keep_mappings=None, keep_references=None):
+        """Plan removing the cached mappings not in `keep_mappings` and references not in
+        `keep_references`,  None meaning that kind of file is not purged,  from one scan of
+        the cache.   Report the plan,  then save it to --purge-plan or execute it.
+        """
+        plan = purge_plan.plan_purge(self.observatory, keep_mappings, keep_references, self.contexts)
+        plan.report()
+        if self.args.purge_plan:
+            plan.save(self.args.purge_plan)
+            log.info("Saved purge plan to", repr(self.args.purge_plan))
+        else:
+            plan.execute(self.args.purge_jobs)
+
+    def execute_purge_plan(self, path):
+        """Remove the files of the purge plan saved in file `path`."""
+        with log.error_on_exception("Failed executing purge plan", repr(path)):
+            plan = purge_plan.PurgePlan.load(path)
+            if plan.observatory != self.observatory:
+                log.error("Purge plan", repr(path), "is for observatory", repr(plan.observatory),
+                          "not", repr(self.observatory))
+                return
+            plan.report()
+            plan.execute(self.args.purge_jobs)
         
+
     # ------------------------------------------------------------------------------------------
     
     def fetch_files(self, context, files):
@@ -491,12 +679,9 @@ class SyncScript(cmdline.ContextsScript):
 
     def purge_references(self, keep=None):
         """Remove all references not references under pmaps `self.contexts`."""
-        purge_refs = set(rmap.list_references("*", self.observatory))
         if keep is None:
-            keep = set(self.get_context_references())
-        else:
-            keep = set(keep)
-        self.remove_files(sorted(purge_refs - keep), "reference")
+            keep = self.get_context_references()
+        self.purge(keep_references=keep)
     
     def remove_files(self, files, kind):
         """Remove the list of `files` basenames which are converted to fully
@@ -510,7 +695,7 @@ class SyncScript(cmdline.ContextsScript):
                 files2.add(filename[:-1] + "d")
         for filename in files:
             with log.error_on_exception("Failed purging", kind, repr(filename)):
-                where = rmap.locate_file(filename, self.observatory)
+                where = config.relocate_file(filename, self.observatory)
                 utils.remove(where, observatory=self.observatory)
 
     # ------------------------------------------------------------------------------------------
@@ -568,17 +753,65 @@ class SyncScript(cmdline.ContextsScript):
             return
         bytes_so_far = 0
         total_bytes = api.get_total_bytes(infos)
-        for nth_file, file in enumerate(files):
-            bfile = os.path.basename(file)
-            if infos[bfile] == "NOT FOUND":
-                log.error("CRDS has no record of file", repr(bfile))
-            else:
-                self.verify_file(file, infos[bfile], bytes_so_far, total_bytes, nth_file, len(files))
-                bytes_so_far += int(infos[bfile]["size"])
-        
-    def verify_file(self, file, info, bytes_so_far, total_bytes, nth_file, total_files):
-        """Check one `file` against the provided CRDS database `info` dictionary."""
-        path = rmap.locate_file(file, observatory=self.observatory)
+        found = [file for file in files if infos[os.path.basename(file)] != "NOT FOUND"]
+        self.manifest = cache_manifest.get_manifest(self.observatory)
+        verified = self.manifest_checksums(found)
+        try:
+            with self.precomputed_checksums([file for file in found if file not in verified], infos) as checksums:
+                for nth_file, file in enumerate(files):
+                    bfile = os.path.basename(file)
+                    if infos[bfile] == "NOT FOUND":
+                        log.error("CRDS has no record of file", repr(bfile))
+                    else:
+                        checksum = verified[file] if file in verified else next(checksums)
+                        self.verify_file(file, infos[bfile], bytes_so_far, total_bytes, nth_file, len(files),
+                                         checksum=checksum)
+                        bytes_so_far += int(infos[bfile]["size"])
+        finally:
+            if self.manifest is not None:
+                self.manifest.flush()
+
+    def manifest_checksums(self, files):
+        """Return { file : (None, sha1sum) } for those of `files` which would be hashed but
+        are unchanged since the cache manifest recorded their verified sha1sums,  subject to
+        --rehash-older-than and --rehash-all.
+        """
+        if self.manifest is None or self.args.rehash_all:
+            return {}
+        max_age = self.args.rehash_older_than * 86400 if self.args.rehash_older_than is not None else None
+        verified = {}
+        for file in files:
+            if self.args.check_sha1sum or config.is_mapping(file):
+                sha1sum = self.manifest.verified_sha1sum(
+                    config.relocate_file(file, observatory=self.observatory), max_age)
+                if sha1sum is not None:
+                    verified[file] = (None, sha1sum)
+        log.verbose("Skipping sha1sums of", len(verified), "files unchanged since verified.", verbosity=10)
+        return verified
+
+    @contextlib.contextmanager
+    def precomputed_checksums(self, files, infos):
+        """Yield an iterator of the (signature, sha1sum) checksums of each of `files`,  in order,
+        computed by --verify-jobs worker processes.   A checksum is None where the file is
+        missing or the wrong size,  or when checksums are computed serially by verify_file().
+        Exceptions are returned,  to be raised where verify_file() would.
+        """
+        paths = [(config.relocate_file(file, observatory=self.observatory), int(infos[os.path.basename(file)]["size"]))
+                 for file in files]
+        jobs = min(self.args.verify_jobs, len(paths))
+        if not self.args.check_sha1sum or jobs <= 1:
+            yield itertools.repeat(None)
+            return
+        log.verbose("Computing sha1sums for", len(paths), "files using", jobs, "worker processes.")
+        with multiprocessing.Pool(jobs) as pool:
+            yield pool.imap(_checksum_worker, paths)
+
+    def verify_file(self, file, info, bytes_so_far, total_bytes, nth_file, total_files, checksum=None):
+        """Check one `file` against the provided CRDS database `info` dictionary.   Unless
+        `checksum`,  (stat signature, sha1sum),  is already computed,  compute it as needed.
+        The signature is None for sha1sums already recorded in the cache manifest.
+        """
+        path = config.relocate_file(file, observatory=self.observatory)
         base = os.path.basename(file)
         n_bytes = int(info["size"])
         
@@ -598,13 +831,19 @@ class SyncScript(cmdline.ContextsScript):
             self.error_and_repair(path, "File", repr(base), "length mismatch LOCAL size=" + srepr(size), 
                                   "CRDS size=" + srepr(info["size"]))
         elif self.args.check_sha1sum or config.is_mapping(base):
-            log.verbose("Computing checksum for", repr(base), "of size", repr(size), verbosity=60)
-            sha1sum = utils.checksum(path)
+            if checksum is None:
+                log.verbose("Computing checksum for", repr(base), "of size", repr(size), verbosity=60)
+                checksum = (cache_manifest.signature(path), utils.checksum(path))
+            elif isinstance(checksum, Exception):
+                raise checksum
+            signature, sha1sum = checksum
             if info["sha1sum"] == "none":
                 log.warning("CRDS doesn't know the checksum for", repr(base))
             elif info["sha1sum"] != sha1sum:
                 self.error_and_repair(path, "File", repr(base), "checksum mismatch CRDS=" + repr(info["sha1sum"]), 
                                       "LOCAL=" + repr(sha1sum))
+            elif signature is not None and self.manifest is not None:
+                self.manifest.record(path, sha1sum, signature)
 
         if info["state"] not in ["archived", "operational"]:
             log.warning("File", repr(base), "has an unusual CRDS file state", repr(info["state"]))
@@ -648,7 +887,7 @@ class SyncScript(cmdline.ContextsScript):
         new_mode = config.get_crds_ref_subdir_mode(self.observatory)  # did it really change.
         for refpath in old_refpaths:
             with log.error_on_exception("Failed relocating:", repr(refpath)):
-                desired_loc = rmap.locate_file(os.path.basename(refpath), observatory=self.observatory)
+                desired_loc = config.relocate_file(os.path.basename(refpath), observatory=self.observatory)
                 if desired_loc != refpath:
                     if os.path.exists(desired_loc):
                         if not self.args.organize_delete_junk:
@@ -657,7 +896,7 @@ class SyncScript(cmdline.ContextsScript):
                         utils.remove(desired_loc, observatory=self.observatory)
                     if config.writable_cache_or_info("Skipping file relocation from", repr(refpath), "to", repr(desired_loc)):
                         log.info("Relocating", repr(refpath), "to", repr(desired_loc))
-                        shutil.move(refpath, desired_loc)
+                        blob_store.relink(refpath, desired_loc)
                 else:
                     if old_mode != new_mode:
                         log.verbose_warning("Keeping existing cached file", repr(desired_loc), "already in target mode", repr(new_mode))
@@ -684,5 +923,20 @@ class SyncScript(cmdline.ContextsScript):
 
 # ==============================================================================================================
 
+def _checksum_worker(job):
+    """Return the (stat signature, sha1sum) of the file described by (path, size) `job` in a
+    --verify-jobs worker process,  None if the file is missing or not `size` bytes,  or the
+    exception raised.
+    """
+    path, size = job
+    try:
+        if not os.path.exists(path) or os.stat(path).st_size != size:
+            return None
+        return (cache_manifest.signature(path), utils.checksum(path))
+    except Exception as exc:
+        return exc
+
+# ==============================================================================================================
+
 if __name__ == "__main__":
     sys.exit(SyncScript()())
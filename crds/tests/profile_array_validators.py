@@ -0,0 +1,79 @@
+"""This module benchmarks the certify array validators on a synthetic IPC kernel cube,
+contrasting the prior transpose,  reshape,  and per-kernel sums of the entire array with the
+chunked vectorized sums of KernelunityValidator,  and loading array data to get shapes and
+dtypes with reading them from headers as hdu_shape_dtype() does for IsomorphicfitsverValidator.
+
+% python -m crds.tests.profile_array_validators [n_pixels]
+"""
+import sys
+import os
+import time
+import tempfile
+import tracemalloc
+
+import numpy as np
+from astropy.io import fits
+
+from crds.core import log, utils
+from crds import data_file
+from crds.io.fits import hdu_shape_dtype
+from crds.certify import validators
+
+# ==============================================================================
+
+def write_kernels(path, n_pixels):
+    """Write a FITS file with a 3x3 IPC kernel for each of `n_pixels` x `n_pixels` pixels."""
+    kernels = np.full((3, 3, n_pixels, n_pixels), -0.01, dtype="float32")
+    kernels[1, 1] = 1.08
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(kernels, name="SCI")]).writeto(path)
+
+def transposed_loop(data):
+    """The prior check:  transpose and reshape the whole array,  then sum kernels one by one."""
+    all_data = data.transpose()
+    images_data = np.reshape(all_data, (int(np.prod(all_data.shape[:-2])),) + all_data.shape[-2:])
+    return all(abs(image.sum() - 1.0) <= 1.0e-6 for image in images_data)
+
+def chunked(data):
+    """The chunked vectorized KernelunityValidator check."""
+    checker = validators.KernelunityValidator(validators.TpnInfo("SCI", "D", "X", "R", ("&KernelUnity",)))
+    checker.check_header("kernels.fits", {"SCI_ARRAY" : utils.Struct(DATA=data)})
+    return True
+
+def loaded_shapes(path):
+    """Load each HDU's data to get its shape and dtype."""
+    with data_file.fits_open(path, checksum=False) as hdus:
+        return [(hdu.data.shape, hdu.data.dtype.name) for hdu in hdus if hdu.name == "SCI"]
+
+def header_shapes(path):
+    """Compute each HDU's shape and dtype from its header."""
+    with data_file.fits_open(path, checksum=False) as hdus:
+        return [(shape, dtype.name) for (shape, dtype) in
+                (hdu_shape_dtype(hdu) for hdu in hdus if hdu.name == "SCI")]
+
+def measure(name, func, *args):
+    """Print the time and peak traced memory of func(*args)."""
+    start = time.time()
+    result = func(*args)
+    elapsed = time.time() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{:16s} result={} elapsed={:8.3f}s peak memory={:8.1f}M".format(name, result, elapsed, peak/2**20))
+    return result
+
+def main(n_pixels=1024):
+    """Check a synthetic `n_pixels` x `n_pixels` IPC kernel cube both ways."""
+    log.set_verbose(0)
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "kernels.fits")
+        write_kernels(path, int(n_pixels))
+        with data_file.fits_open(path, checksum=False) as hdus:
+            data = hdus["SCI"].data
+            assert measure("transposed loop", transposed_loop, data)
+            assert measure("chunked", chunked, data)
+            del data
+        assert measure("loaded shapes", loaded_shapes, path) == measure("header shapes", header_shapes, path)
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
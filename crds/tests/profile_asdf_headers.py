@@ -0,0 +1,73 @@
+"""This module benchmarks reading selected keywords from ASDF headers,  contrasting
+flattening the entire converted tree with visiting only the needed paths of the unconverted
+tree as crds.io.asdf.AsdfFile.get_raw_header() does,  using a synthetic reference with
+large arrays and many small ones.
+
+% python -m crds.tests.profile_asdf_headers [n_pixels] [n_reads]
+"""
+import sys
+import os
+import time
+import tempfile
+import tracemalloc
+
+import numpy as np
+import asdf
+
+from crds.core import log
+from crds.io import asdf as crds_asdf
+
+# ==============================================================================
+
+NEEDED_KEYS = ("META.INSTRUMENT.NAME", "META.INSTRUMENT.DETECTOR", "META.EXPOSURE.TYPE",
+               "META.REFTYPE", "META.USEAFTER", "HISTORY")
+
+def write_reference(path, n_pixels):
+    """Write an ASDF reference with several `n_pixels` x `n_pixels` arrays and many small ones."""
+    tree = {
+        "meta" : {
+            "instrument" : {"name" : "MIRI", "detector" : "MIRIMAGE"},
+            "exposure" : {"type" : "MIR_IMAGE"},
+            "reftype" : "DISTORTION",
+            "useafter" : "2020-01-01T00:00:00",
+        },
+        "data" : np.zeros((n_pixels, n_pixels), dtype="float32"),
+        "dq" : np.zeros((n_pixels, n_pixels), dtype="uint32"),
+        "err" : np.zeros((n_pixels, n_pixels), dtype="float32"),
+        "coefficients" : [{"order" : i, "values" : np.arange(9.0).reshape(3, 3) * i} for i in range(500)],
+    }
+    handle = asdf.AsdfFile(tree)
+    handle.add_history_entry("A synthetic reference.")
+    handle.write_to(path)
+
+def read_headers(path, n_reads, needed_keys):
+    """Return the reduced header and time to read it from `path` `n_reads` times."""
+    start = time.time()
+    for _ in range(n_reads):
+        afile = crds_asdf.AsdfFile(path)
+        header = afile._reduce_header(afile.get_raw_header(needed_keys), NEEDED_KEYS)
+    return header, time.time() - start
+
+def measure(name, path, n_reads, needed_keys):
+    """Print the time and peak traced memory of reading `needed_keys` from `path`."""
+    header, elapsed = read_headers(path, n_reads, needed_keys)
+    tracemalloc.start()
+    read_headers(path, 1, needed_keys)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{:8s} reads={} elapsed={:8.3f}s per read={:8.3f}ms peak memory={:8.1f}M".format(
+        name, n_reads, elapsed, elapsed / n_reads * 1000, peak/2**20))
+    return header
+
+def main(n_pixels=2048, n_reads=20):
+    """Read keywords from a synthetic `n_pixels` x `n_pixels` reference both ways."""
+    log.set_verbose(0)
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "reference.asdf")
+        write_reference(path, int(n_pixels))
+        full = measure("full", path, int(n_reads), ())
+        lazy = measure("lazy", path, int(n_reads), NEEDED_KEYS)
+        assert full == lazy, "Lazy header differs from full header."
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,66 @@
+"""This module benchmarks the per-file Validator setup of certify,  contrasting constructing
+the Validators for each file with the cached per-type Validators used by
+crds.certify.get_validators(),  and times certifying a batch of same-type references.
+
+% python -m crds.tests.profile_certify_validators [n_files]
+"""
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+from crds.core import log, utils
+from crds.certify import certify, validators
+
+# ==============================================================================
+
+HERE = os.path.dirname(__file__) or "."
+
+REFERENCES = [
+    ("hst", "s7g1700gl_dead.fits"),
+    ("jwst", "jwst_miri_ipc_0004.fits"),
+    ("jwst", "jwst_miri_flat_slitlessprism.fits"),
+    ("jwst", "niriss_ref_photom.fits"),
+]
+
+def validator_setup(observatory, reference, n_files, cached):
+    """Return the mean time to get the validators of `reference` and required copies of them."""
+    validators.get_validators(observatory, reference)
+    start = time.time()
+    for _ in range(n_files):
+        if not cached:
+            validators.clear_cache()
+        checkers = validators.get_validators(observatory, reference)
+        for checker in checkers:
+            checker.get_required_copy()
+    return (time.time() - start) / n_files
+
+def certify_batch(n_files, reference):
+    """Return the time to certify `n_files` copies of `reference` without comparisons."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        files = []
+        for i in range(n_files):
+            files.append(os.path.join(tempdir, "{:03d}_".format(i) + os.path.basename(reference)))
+            shutil.copy(reference, files[-1])
+        certify.certify_files(files[:1], observatory="hst", check_rmap=False)   # warm up
+        start = time.time()
+        certify.certify_files(files, observatory="hst", check_rmap=False)
+        return time.time() - start
+
+def main(n_files=50):
+    """Time validator setup for `n_files` files of several types,  then certify a batch."""
+    n_files = int(n_files)
+    log.set_verbose(0)
+    utils.clear_function_caches()
+    for observatory, name in REFERENCES:
+        reference = os.path.join(HERE, "data", name)
+        uncached = validator_setup(observatory, reference, n_files, cached=False)
+        cached = validator_setup(observatory, reference, n_files, cached=True)
+        print("{:40s} validators={:3d} uncached={:8.3f}ms cached={:8.3f}ms per file".format(
+            name, len(validators.get_validators(observatory, reference)), uncached*1000, cached*1000))
+    elapsed = certify_batch(n_files, os.path.join(HERE, "data", REFERENCES[0][1]))
+    print("certify files={} of {} elapsed={:8.3f}s".format(n_files, REFERENCES[0][1], elapsed))
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,44 @@
+"""This module benchmarks certify table column validation,  contrasting the row-by-row
+Validator.check_column_rows() with the distinct value Validator.check_column_values(),
+using synthetic columns resembling COS/STIS mode and range constrained table columns.
+
+% python -m crds.tests.profile_check_column [n_rows]
+"""
+import sys
+import time
+
+import numpy as np
+
+from crds.certify import validators
+from crds.certify.generic_tpn import TpnInfo
+
+# ==============================================================================
+
+def synthetic_cases(n_rows, seed=42):
+    """Return [(validator, column), ...] for `n_rows` row synthetic columns."""
+    rand = np.random.RandomState(seed)
+    opt_elems = np.array(["G130M", "G160M", "G140L", "G185M", "G225M", "G285M"])
+    return [
+        (validators.validator(TpnInfo("OPT_ELEM", "C", "C", "R", tuple(opt_elems))),
+         tuple(opt_elems[rand.randint(0, len(opt_elems), n_rows)])),
+        (validators.validator(TpnInfo("CENWAVE", "C", "I", "R", ("1000:4000",))),
+         tuple(rand.randint(1000, 4000, n_rows).astype("i4"))),
+        (validators.validator(TpnInfo("SEGMENT", "C", "I", "R", ("0", "1", "2"))),
+         tuple(rand.randint(0, 3, n_rows).astype("i2"))),
+        (validators.validator(TpnInfo("WAVELENGTH", "C", "R", "R", ("0.0:10000.0",))),
+         tuple(rand.uniform(0, 10000, n_rows).astype("f4"))),
+        (validators.validator(TpnInfo("FLAG", "C", "L", "R", ())),
+         tuple(np.array(["T", "F"])[rand.randint(0, 2, n_rows)])),
+    ]
+
+def main(n_rows=100000):
+    """Time checking each synthetic column both ways."""
+    for validator, column in synthetic_cases(n_rows):
+        for name in ["check_column_rows", "check_column_values"]:
+            start = time.time()
+            getattr(validator, name)("synthetic.fits", column)
+            print("{:20s} {:20s} rows={} elapsed={:8.3f}s".format(
+                validator.__class__.__name__, name, n_rows, time.time()-start))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
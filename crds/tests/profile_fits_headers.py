@@ -0,0 +1,60 @@
+"""This module benchmarks reading selected keywords from FITS headers,  contrasting
+astropy's full header parsing with the header block scanning of crds.io.fits.scan_raw_header(),
+using a synthetic dataset with many extensions and header cards.
+
+% python -m crds.tests.profile_fits_headers [n_extensions] [n_reads]
+"""
+import sys
+import os
+import time
+import tempfile
+
+import numpy as np
+from astropy.io import fits
+
+from crds.core import log, config
+from crds.io import fits as crds_fits
+
+# ==============================================================================
+
+NEEDED_KEYS = ("INSTRUME", "DETECTOR", "FILTER", "READPATT", "SUBARRAY", "EXP_TYPE",
+               "DATE-OBS", "TIME-OBS", "NAXIS1", "NAXIS2", "CHANNEL", "BAND")
+
+def write_dataset(path, n_extensions):
+    """Write a FITS dataset with `n_extensions` image extensions of 200 header cards each."""
+    primary = fits.PrimaryHDU()
+    for key, value in [("INSTRUME", "ACS"), ("DETECTOR", "WFC"), ("FILTER", "F435W"),
+                       ("READPATT", "RAPID"), ("SUBARRAY", "FULL"), ("EXP_TYPE", "IMAGE"),
+                       ("DATE-OBS", "2020-01-01"), ("TIME-OBS", "00:00:00")]:
+        primary.header[key] = value
+    hdus = [primary]
+    for i in range(n_extensions):
+        hdu = fits.ImageHDU(np.zeros((64, 64), dtype="float32"), name="SCI", ver=i+1)
+        for j in range(200):
+            hdu.header["KEY{:04d}".format(j)] = (j * 1.5, "a synthetic keyword")
+        hdus.append(hdu)
+    fits.HDUList(hdus).writeto(path)
+
+def read_headers(path, n_reads, scan):
+    """Return the header and time to read NEEDED_KEYS from `path` `n_reads` times."""
+    config.FITS_SCAN_HEADERS.set(scan)
+    start = time.time()
+    for _ in range(n_reads):
+        header = crds_fits.FitsFile(path).get_header(NEEDED_KEYS, checksum=False)
+    return header, time.time() - start
+
+def main(n_extensions=50, n_reads=20):
+    """Read keywords from a synthetic `n_extensions` dataset both ways."""
+    log.set_verbose(0)
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "dataset.fits")
+        write_dataset(path, int(n_extensions))
+        headers = {}
+        for name, scan in [("astropy", False), ("scanned", True)]:
+            headers[name], elapsed = read_headers(path, int(n_reads), scan)
+            print("{:8s} extensions={} reads={} elapsed={:8.3f}s per read={:8.3f}ms".format(
+                name, n_extensions, n_reads, elapsed, elapsed / int(n_reads) * 1000))
+        assert headers["astropy"] == headers["scanned"], "Scanned header differs from astropy header."
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
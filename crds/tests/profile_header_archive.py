@@ -0,0 +1,71 @@
+"""This module benchmarks load time and peak RSS of bestrefs header dumps stored as .pkl,
+.json, and columnar .sqlite3 header archives using a large synthetic dump.
+
+% python -m crds.tests.profile_header_archive [n_datasets]
+"""
+import sys
+import os
+import time
+import random
+import resource
+import tempfile
+import multiprocessing
+
+from crds.bestrefs import headers, header_archive
+
+# ==============================================================================
+
+def synthetic_headers(n_datasets, n_keywords=120, n_values=40, seed=42):
+    """Return { dataset_id : header } for `n_datasets` synthetic datasets sharing
+    `n_keywords` keyword names drawn from `n_values` distinct values per keyword.
+    """
+    rand = random.Random(seed)
+    keywords = ["KEYWORD{:03d}".format(i) for i in range(n_keywords)]
+    choices = {key: ["{}_VALUE_{}".format(key, j) for j in range(n_values)] for key in keywords}
+    dumped = {}
+    for i in range(n_datasets):
+        dataset_id = "L{:08d}Q:L{:08d}Q".format(i, i)
+        header = {key: rand.choice(choices[key]) for key in keywords}
+        header["INSTRUME"] = "COS"
+        header["DATE-OBS"] = "20{:02d}-01-01".format(i % 20)
+        header["TIME-OBS"] = "00:00:00"
+        dumped[dataset_id] = header
+    return dumped
+
+def _measure(queue, path, only_ids):
+    """Child process: load `path` and report (seconds, peak RSS KB, n_headers)."""
+    start = time.time()
+    loaded = headers.load_bestrefs_headers(path, only_ids=only_ids)
+    if only_ids is not None:
+        loaded = {key: loaded[key] for key in only_ids if key in loaded}
+    elapsed = time.time() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, len(loaded)))
+
+def measure(path, only_ids=None):
+    """Load `path` in a freshly spawned process so each format's peak RSS is isolated."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    proc = context.Process(target=_measure, args=(queue, path, only_ids))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def main(n_datasets=50000):
+    """Write a synthetic dump in each format and report load performance."""
+    dumped = synthetic_headers(n_datasets)
+    only_ids = sorted(dumped)[:: max(1, n_datasets // 100)]
+    generator = headers.HeaderGenerator(None, None, None)
+    generator.headers = dumped
+    with tempfile.TemporaryDirectory() as tempdir:
+        for ext in [".pkl", ".json", header_archive.ARCHIVE_EXTENSION]:
+            path = os.path.join(tempdir, "headers" + ext)
+            generator.save_pickle(path)
+            size = os.stat(path).st_size
+            for subset, ids in [("all", None), ("100 ids", only_ids)]:
+                elapsed, rss, count = measure(path, ids)
+                print("{:10s} {:8s} size={:8.1f}M load={:7.3f}s peak_rss={:8.1f}M headers={}".format(
+                    ext, subset, size/2**20, elapsed, rss/2**10, count))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,61 @@
+"""This module benchmarks purging unused references from a CRDS cache as crds sync
+--purge-references does,  contrasting the prior removal of each file with
+rmap.locate_file() and utils.remove() with planning and executing the purge with
+crds.core.purge_plan,  using a synthetic flat cache where half of the references are kept.
+
+% python -m crds.tests.profile_purge [n_references] [purge_jobs]
+"""
+import sys
+import os
+import time
+import tempfile
+
+# ==============================================================================
+
+def write_cache(n_references):
+    """Write `n_references` small references to the flat reference cache of hst,  returning
+    the set of names of the even numbered half which are kept.
+    """
+    from crds.core import config
+    refpath = config.get_crds_refpath("hst")
+    os.makedirs(refpath, exist_ok=True)
+    keep = set()
+    for i in range(n_references):
+        name = "ref{:07d}_dead.fits".format(i)
+        with open(os.path.join(refpath, name), "w+") as handle:
+            handle.write(name)
+        if i % 2 == 0:
+            keep.add(name)
+    return keep
+
+def remove_files(keep, _jobs):
+    """The prior purge:  list the cache,  then locate and remove each file one at a time."""
+    from crds.core import rmap, utils
+    purge = set(rmap.list_references("*", "hst")) - keep
+    for name in sorted(purge):
+        utils.remove(rmap.locate_file(name, "hst"), observatory="hst")
+    return len(purge)
+
+def purge_plan(keep, jobs):
+    """Plan the purge from one scan of the cache,  then remove files in batches in `jobs` threads."""
+    from crds.core import purge_plan
+    plan = purge_plan.plan_purge("hst", keep_references=keep)
+    return plan.execute(jobs)[0]
+
+def main(n_references=100000, jobs=8):
+    """Write synthetic caches and report purge performance for each method."""
+    from crds.core import log
+    log.set_verbose(0)
+    os.environ["CRDS_REF_SUBDIR_MODE"] = "flat"
+    for method in [remove_files, purge_plan]:
+        with tempfile.TemporaryDirectory() as cache:
+            os.environ["CRDS_PATH"] = cache
+            keep = write_cache(int(n_references))
+            start = time.time()
+            removed = method(keep, int(jobs))
+            elapsed = time.time() - start
+            print("{:16s} references={} removed={} elapsed={:7.3f}s files/s={:9.1f}".format(
+                method.__name__, n_references, removed, elapsed, removed/elapsed))
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
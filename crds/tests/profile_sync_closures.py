@@ -0,0 +1,170 @@
+"""This module benchmarks computing the mappings and references in the closures of many
+contexts as crds.sync --all and --range do,  contrasting loading each context with
+rmap.get_cached_mapping() and unioning its names with the shared,  memoized closures of
+rmap.MappingClosure,  using a synthetic mapping cache where each new context changes
+one rmap of the previous context.
+
+% python -m crds.tests.profile_sync_closures [n_contexts] [n_references]
+"""
+import sys
+import os
+import time
+import datetime
+import resource
+import tempfile
+import multiprocessing
+
+# ==============================================================================
+
+INSTRUMENTS = ["ACS", "COS", "STIS", "WFC3", "NICMOS", "WFPC2"]
+
+FILEKINDS = ["FILEKIND{:02d}".format(i) for i in range(20)]
+
+START = datetime.datetime(1990, 1, 1)
+
+PMAP_HEADER = """header = {{
+    'derived_from' : 'synthetic',
+    'mapping' : 'PIPELINE',
+    'name' : '{name}',
+    'observatory' : 'HST',
+    'parkey' : ('INSTRUME',),
+}}
+
+selector = {{
+{selections}
+}}
+"""
+
+IMAP_HEADER = """header = {{
+    'derived_from' : 'synthetic',
+    'instrument' : '{instrument}',
+    'mapping' : 'INSTRUMENT',
+    'name' : '{name}',
+    'observatory' : 'HST',
+    'parkey' : ('REFTYPE',),
+}}
+
+selector = {{
+{selections}
+}}
+"""
+
+RMAP_HEADER = """header = {{
+    'derived_from' : 'synthetic',
+    'filekind' : '{filekind}',
+    'instrument' : '{instrument}',
+    'mapping' : 'REFERENCE',
+    'name' : '{name}',
+    'observatory' : 'HST',
+    'parkey' : (('DETECTOR',), ('DATE-OBS', 'TIME-OBS')),
+}}
+
+selector = Match({{
+    ('WFC',) : UseAfter({{
+{selections}
+    }}),
+}})
+"""
+
+def write_mapping(mapdir, name, template, selections, **keys):
+    """Write mapping `name` to `mapdir` formatting `template` with `selections` lines."""
+    with open(os.path.join(mapdir, name), "w+") as handle:
+        handle.write(template.format(name=name, selections="\n".join(selections), **keys))
+
+def write_rmap(mapdir, instrument, filekind, serial, n_references):
+    """Write serial version `serial` of the rmap for `instrument` and `filekind` with
+    `n_references` references,  adding one reference per version.
+    """
+    name = "hst_{}_{}_{:04d}.rmap".format(instrument.lower(), filekind.lower(), serial)
+    selections = ["        '{}' : '{}_{}_{:05d}.fits',".format(
+        START + datetime.timedelta(hours=i), instrument.lower(), filekind.lower(), i)
+                  for i in range(n_references + serial)]
+    write_mapping(mapdir, name, RMAP_HEADER, selections, instrument=instrument, filekind=filekind)
+    return name
+
+def write_cache(mapdir, n_contexts, n_references):
+    """Write `n_contexts` synthetic contexts to `mapdir`,  each changing one rmap of the
+    previous context,  and return the context names.
+    """
+    rmaps = {instrument: {filekind: write_rmap(mapdir, instrument, filekind, 0, n_references)
+                          for filekind in FILEKINDS} for instrument in INSTRUMENTS}
+    imaps = {}
+    contexts = []
+    for serial in range(n_contexts):
+        instrument = INSTRUMENTS[serial % len(INSTRUMENTS)]
+        filekind = FILEKINDS[(serial // len(INSTRUMENTS)) % len(FILEKINDS)]
+        if serial:
+            rmaps[instrument][filekind] = write_rmap(mapdir, instrument, filekind, serial, n_references)
+        for changed in (INSTRUMENTS if not serial else [instrument]):
+            imaps[changed] = "hst_{}_{:04d}.imap".format(changed.lower(), serial)
+            write_mapping(mapdir, imaps[changed], IMAP_HEADER,
+                          ["    '{}' : '{}',".format(kind.lower(), rmaps[changed][kind]) for kind in FILEKINDS],
+                          instrument=changed)
+        contexts.append("hst_{:04d}.pmap".format(serial))
+        write_mapping(mapdir, contexts[-1], PMAP_HEADER,
+                      ["    '{}' : '{}',".format(inst, imaps[inst]) for inst in INSTRUMENTS])
+    return contexts
+
+# ==============================================================================
+
+def cached_mappings(contexts):
+    """The prior closure computation:  load and cache every context in full."""
+    from crds.core import rmap
+    mappings, references = set(), set()
+    for context in contexts:
+        pmap = rmap.get_cached_mapping(context)
+        mappings |= set(pmap.mapping_names())
+        references |= set(pmap.reference_names())
+    return mappings, references
+
+def mapping_closure(contexts):
+    """Union the closures of `contexts` with one MappingClosure,  loading each mapping once."""
+    from crds.core import rmap
+    closure = rmap.MappingClosure()
+    mappings, references = set(), set()
+    visited, visited2 = set(), set()
+    for context in contexts:
+        mappings |= closure.closure(context, visited)[0]
+    for context in contexts:
+        references |= closure.closure(context, visited2)[1]
+    return mappings, references
+
+def _measure(queue, mapdir, contexts, method):
+    """Child process: compute closures of `contexts` with `method` and report
+    (seconds, peak RSS KB, n_mappings, n_references, names digest).
+    """
+    os.environ["CRDS_MAPPATH_SINGLE"] = mapdir
+    os.environ["CRDS_IGNORE_MAPPING_CHECKSUM"] = "1"
+    from crds.core import log, utils
+    log.set_verbose(0)
+    start = time.time()
+    mappings, references = globals()[method](contexts)
+    elapsed = time.time() - start
+    digest = utils.str_checksum(repr((sorted(mappings), sorted(references))))
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               len(mappings), len(references), digest))
+
+def measure(mapdir, contexts, method):
+    """Run `method` in a freshly spawned process so each method's peak RSS is isolated."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    proc = context.Process(target=_measure, args=(queue, mapdir, contexts, method))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def main(n_contexts=300, n_references=200):
+    """Write a synthetic mapping cache and report closure computation performance."""
+    with tempfile.TemporaryDirectory() as mapdir:
+        contexts = write_cache(mapdir, int(n_contexts), int(n_references))
+        digests = set()
+        for method in ["cached_mappings", "mapping_closure"]:
+            elapsed, rss, n_mappings, n_references, digest = measure(mapdir, contexts, method)
+            digests.add(digest)
+            print("{:16s} contexts={} elapsed={:7.3f}s peak_rss={:8.1f}M mappings={} references={}".format(
+                method, len(contexts), elapsed, rss/2**10, n_mappings, n_references))
+        assert len(digests) == 1, "Closures differ between methods."
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,71 @@
+"""This module benchmarks bestrefs table effects comparisons,  contrasting the row-by-row
+mode_select() scan with the indexed and memoized DeepLook comparison,  using synthetic
+COS WCPTAB-like tables with many rows and few distinct modes.
+
+% python -m crds.tests.profile_table_effects [n_rows] [n_datasets]
+"""
+import sys
+import os
+import time
+import random
+import tempfile
+
+import numpy as np
+from astropy.io import fits
+
+from crds.core import utils
+from crds.io import tables
+from crds.bestrefs import table_effects
+
+# ==============================================================================
+
+OPT_ELEMS = ["G130M", "G160M", "G140L", "G185M", "G225M", "G285M", "G230L", "MIRRORA", "MIRRORB"]
+
+def write_table(path, n_rows, seed):
+    """Write a FITS table of `n_rows` rows with OPT_ELEM and CENWAVE mode columns."""
+    rand = random.Random(seed)
+    opt_elem = np.array([rand.choice(OPT_ELEMS) for _ in range(n_rows)])
+    cenwave = np.array([rand.choice([1055, 1096, 1291, 1600, 1986]) for _ in range(n_rows)], dtype="i4")
+    value = np.arange(n_rows, dtype="f8")
+    hdu = fits.BinTableHDU.from_columns([
+        fits.Column(name="OPT_ELEM", format="8A", array=opt_elem),
+        fits.Column(name="CENWAVE", format="J", array=cenwave),
+        fits.Column(name="VALUE", format="D", array=value),
+    ])
+    hdu.writeto(path)
+
+def row_loop(deep_look, header, old_reference, new_reference):
+    """The prior per-dataset comparison:  scan and repr every row of both tables."""
+    constraints = {field: (table_effects.str_to_number(header[field.upper()]),) + deep_look.mode_fields[field]
+                   for field in deep_look.mode_fields}
+    data_old = tables.tables(old_reference)[0]
+    data_new = tables.tables(new_reference)[0]
+    rows_old = sorted(repr(row) for row in table_effects.mode_select(data_old, constraints))
+    rows_new = sorted(repr(row) for row in table_effects.mode_select(data_new, constraints))
+    return not table_effects.mode_equality(rows_old, rows_new)
+
+def indexed(deep_look, header, old_reference, new_reference):
+    """The indexed and memoized comparison used by DeepLook.are_different()."""
+    deep_look.are_different(header, old_reference, new_reference)
+    return deep_look.is_different
+
+def main(n_rows=20000, n_datasets=200):
+    """Compare `n_datasets` synthetic headers against a pair of `n_rows` row tables."""
+    rand = random.Random(42)
+    headers = [{"OPT_ELEM": rand.choice(OPT_ELEMS)} for _ in range(n_datasets)]
+    deep_look = table_effects.DeepLook_COSOpt_elem()
+    with tempfile.TemporaryDirectory() as tempdir:
+        old_reference = os.path.join(tempdir, "old_wcp.fits")
+        new_reference = os.path.join(tempdir, "new_wcp.fits")
+        write_table(old_reference, n_rows, 1)
+        write_table(new_reference, n_rows, 1)
+        results = {}
+        for name, method in [("row loop", row_loop), ("indexed", indexed)]:
+            utils.clear_function_caches()
+            start = time.time()
+            results[name] = [method(deep_look, header, old_reference, new_reference) for header in headers]
+            print("{:10s} rows={} datasets={} elapsed={:8.3f}s".format(name, n_rows, n_datasets, time.time()-start))
+        assert results["row loop"] == results["indexed"], "Indexed comparison results differ."
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
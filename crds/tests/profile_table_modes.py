@@ -0,0 +1,81 @@
+"""This module benchmarks certify table mode checks,  contrasting the prior row by row mode
+dictionaries and field by field row comparisons with the numpy indexed TableModes and
+vectorized changed_rows() used by ReferenceCertifier.check_table_modes(),  using synthetic
+tables with many distinct modes.
+
+% python -m crds.tests.profile_table_modes [n_rows]
+"""
+import sys
+import os
+import time
+import tempfile
+
+import numpy as np
+from astropy.io import fits
+
+from crds.core import log
+from crds.io import tables
+from crds.certify import certify
+
+# ==============================================================================
+
+MODE_COLUMNS = ["OPT_ELEM", "CENWAVE", "FPOFFSET"]
+
+def write_table(path, n_rows, changed):
+    """Write a FITS table of `n_rows` distinct modes,  altering the VALUE of `changed` rows."""
+    rand = np.random.RandomState(42)
+    cenwave = np.arange(n_rows, dtype="i4")
+    value = rand.uniform(size=(n_rows, 4))
+    value[:changed] += 1.0
+    fits.BinTableHDU.from_columns([
+        fits.Column(name="OPT_ELEM", format="8A", array=np.array(["G130M", "G160M"])[cenwave % 2]),
+        fits.Column(name="CENWAVE", format="J", array=cenwave),
+        fits.Column(name="FPOFFSET", format="J", array=cenwave % 4),
+        fits.Column(name="VALUE", format="4D", array=value),
+        fits.Column(name="SCALE", format="E", array=np.ones(n_rows, dtype="f4")),
+    ]).writeto(path)
+
+def row_by_row(old_table, new_table):
+    """The prior check:  a mode dictionary of entire rows per table,  compared field by field."""
+    modes = []
+    for tab in [old_table, new_table]:
+        table_modes = {}
+        for i, row in enumerate(tab.rows):
+            new_row = tuple(zip(tab.colnames, (certify.handle_nan(v) for v in row)))
+            rowdict = dict(new_row)
+            mode = tuple((key, rowdict[key]) for key in MODE_COLUMNS if key in rowdict)
+            table_modes.setdefault(mode, (i, new_row))
+        modes.append(table_modes)
+    old_modes, new_modes = modes
+    return sum(1 for mode in old_modes if mode in new_modes and
+               any(np.any(old_value != new_value)
+                   for (_, old_value), (_, new_value) in zip(old_modes[mode][1], new_modes[mode][1])))
+
+def indexed(old_table, new_table):
+    """The TableModes index and vectorized comparison used by check_table_modes()."""
+    old_modes = certify.TableModes("old reference", old_table, MODE_COLUMNS).modes
+    new_modes = certify.TableModes("new reference", new_table, MODE_COLUMNS).modes
+    common = [mode for mode in old_modes if mode in new_modes]
+    return int(certify.changed_rows(old_table, [old_modes[mode] for mode in common],
+                                    new_table, [new_modes[mode] for mode in common]).sum())
+
+def main(n_rows=50000):
+    """Compare the modes of two `n_rows` row synthetic tables both ways."""
+    log.set_verbose(0)
+    with tempfile.TemporaryDirectory() as tempdir:
+        old_reference = os.path.join(tempdir, "old_tab.fits")
+        new_reference = os.path.join(tempdir, "new_tab.fits")
+        write_table(old_reference, n_rows, 0)
+        write_table(new_reference, n_rows, n_rows // 100)
+        results = {}
+        for name, method in [("row by row", row_by_row), ("indexed", indexed)]:
+            tables.clear_cache()
+            old_table, new_table = tables.tables(old_reference)[0], tables.tables(new_reference)[0]
+            start = time.time()
+            results[name] = method(old_table, new_table)
+            print("{:10s} rows={} changed={} elapsed={:8.3f}s".format(
+                name, n_rows, results[name], time.time()-start))
+        assert results["row by row"] == results["indexed"], "Indexed mode comparison results differ."
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+"""This module benchmarks crds.io.tables,  contrasting the prior SimpleTable which converted
+every FITS row to a tuple of Python values with the columnar SimpleTable which copies out
+numpy columns only as they are used,  using a synthetic wide table with many rows.
+
+% python -m crds.tests.profile_tables [n_rows] [n_columns]
+"""
+import sys
+import os
+import time
+import tempfile
+import tracemalloc
+
+import numpy as np
+from astropy.io import fits
+
+from crds import data_file
+from crds.io import tables
+
+# ==============================================================================
+
+def write_table(path, n_rows, n_columns):
+    """Write a FITS table with one mode column and `n_columns` float columns."""
+    rand = np.random.RandomState(42)
+    columns = [fits.Column(name="OPT_ELEM", format="8A",
+                           array=np.array(["G130M", "G160M", "G140L"])[rand.randint(0, 3, n_rows)])]
+    columns += [fits.Column(name="VALUE{}".format(i), format="D", array=rand.uniform(size=n_rows))
+                for i in range(n_columns)]
+    fits.BinTableHDU.from_columns(columns).writeto(path)
+
+def tuple_rows(path):
+    """The prior SimpleTable load:  all rows as tuples,  columns transposed from the rows."""
+    with data_file.fits_open(path) as hdus:
+        rows = tuple(tuple(row) for row in hdus[1].data)
+    return dict(zip([col.upper() for col in hdus[1].columns.names], zip(*rows)))["OPT_ELEM"]
+
+def column_subset(path):
+    """The columnar SimpleTable load of only the column used."""
+    tables.clear_cache()
+    return tables.tables(path)[0].column("OPT_ELEM")
+
+def all_columns(path):
+    """The columnar SimpleTable load of every column."""
+    tables.clear_cache()
+    return tables.tables(path)[0].columns["OPT_ELEM"]
+
+def main(n_rows=20000, n_columns=20):
+    """Time and measure peak memory of loading the mode column of a synthetic table."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "synthetic_tab.fits")
+        write_table(path, n_rows, n_columns)
+        results = {}
+        for name, method in [("tuple rows", tuple_rows), ("column subset", column_subset),
+                             ("all columns", all_columns)]:
+            start = time.time()
+            results[name] = list(method(path))
+            elapsed = time.time() - start
+            tracemalloc.start()     # measured separately,  tracing slows the row by row load greatly
+            method(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("{:14s} rows={} columns={} elapsed={:8.3f}s peak={:8.1f}M".format(
+                name, n_rows, n_columns + 1, elapsed, peak/2**20))
+        assert results["tuple rows"] == results["column subset"] == results["all columns"], \
+            "Columnar table results differ."
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,141 @@
+"""
+Fault injection tests for the atomic writes of the CRDS cache,  which kill writers part
+way through downloads and cache file updates and check that readers only ever see the old
+or the complete new contents of each file.
+"""
+import os
+import signal
+import hashlib
+import multiprocessing
+
+# ===================================================================
+
+from crds.core import utils
+from crds.client import api
+
+# ===================================================================
+
+class FaultyCacher(api.FileCacher):
+    """FileCacher which downloads `contents` from memory in 1000 byte chunks rather than
+    from the CRDS server,  killing its own process after `kill_after` chunks if not None.
+    """
+    def __init__(self, name, contents, kill_after=None, sha1sum=None):
+        super(FaultyCacher, self).__init__("hst.pmap")
+        self.contents = contents
+        self.kill_after = kill_after
+        sha1sum = hashlib.sha1(contents).hexdigest() if sha1sum is None else sha1sum
+        self.info_map = { name : { "size" : str(len(contents)), "sha1sum" : sha1sum } }
+
+    def get_data_http(self, filename):
+        for nth, offset in enumerate(range(0, len(self.contents), 1000)):
+            if nth == self.kill_after:
+                os.kill(os.getpid(), signal.SIGKILL)
+            yield self.contents[offset:offset+1000]
+
+def killed_write(path, contents, kill_after):
+    """Write `contents` to `path` with utils.atomic_open() in 1000 byte chunks,  killing
+    this process after `kill_after` chunks.
+    """
+    with utils.atomic_open(path, "wb") as handle:
+        for nth, offset in enumerate(range(0, len(contents), 1000)):
+            if nth == kill_after:
+                os.kill(os.getpid(), signal.SIGKILL)
+            handle.write(contents[offset:offset+1000])
+            handle.flush()
+
+def in_child(function, *args):
+    """Run `function(*args)` in a child process,  returning its exit code."""
+    process = multiprocessing.Process(target=function, args=args)
+    process.start()
+    process.join()
+    return process.exitcode
+
+def partial_writes(path):
+    """Return the number of temporary files left beside `path` by interrupted writers."""
+    return len([name for name in os.listdir(os.path.dirname(path)) if utils.ATOMIC_TEMP_RE.match(name)])
+
+# ===================================================================
+
+def dt_killed_download():
+    """
+    A downloader killed mid-stream leaves the prior contents of the cached file,  and
+    only a hidden temporary file which crds cache gc eventually removes.
+
+    >>> import tempfile
+    >>> from crds.tests import test_config
+    >>> old_state = test_config.setup(cache=tempfile.mkdtemp(), observatory="hst")
+    >>> path = os.path.join(tempfile.mkdtemp(), "o1a0000al_dead.fits")
+    >>> utils.atomic_write(path, b"old contents")
+
+    >>> in_child(FaultyCacher("o1a0000al_dead.fits", b"new" * 10000, kill_after=5).download_core, "o1a0000al_dead.fits", path)
+    -9
+    >>> open(path, "rb").read()
+    b'old contents'
+    >>> partial_writes(path)
+    1
+
+    >>> in_child(FaultyCacher("o1a0000al_dead.fits", b"new" * 10000).download_core, "o1a0000al_dead.fits", path)
+    0
+    >>> open(path, "rb").read() == b"new" * 10000
+    True
+
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_unverified_download():
+    """
+    A download which fails verification is never renamed into place.
+
+    >>> import tempfile
+    >>> from crds.tests import test_config
+    >>> old_state = test_config.setup(cache=tempfile.mkdtemp(), observatory="hst")
+    >>> path = os.path.join(tempfile.mkdtemp(), "o1a0000al_dead.fits")
+    >>> utils.atomic_write(path, b"old contents")
+
+    >>> FaultyCacher("o1a0000al_dead.fits", b"new" * 10000, sha1sum="0" * 40).download_core("o1a0000al_dead.fits", path)
+    Traceback (most recent call last):
+    ...
+    crds.core.exceptions.CrdsDownloadError: downloaded file 'o1a0000al_dead.fits' sha1sum ... does not match server sha1sum '0000000000000000000000000000000000000000'
+    >>> open(path, "rb").read()
+    b'old contents'
+    >>> partial_writes(path)
+    0
+
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_killed_cache_write():
+    """
+    Cache config and pickle writes killed part way through leave the prior contents,
+    and with CRDS_FSYNC_DIRS the directory is flushed after each rename.
+
+    >>> import tempfile
+    >>> from crds.tests import test_config
+    >>> old_state = test_config.setup(cache=tempfile.mkdtemp(), observatory="hst")
+    >>> from crds.core import config
+    >>> _ = config.FSYNC_DIRS.set(True)
+    >>> path = os.path.join(tempfile.mkdtemp(), "server_config")
+    >>> utils.atomic_write(path, "old config")
+
+    >>> in_child(killed_write, path, b"new config" * 1000, 3)
+    -9
+    >>> open(path).read()
+    'old config'
+
+    >>> in_child(killed_write, path, b"new config" * 1000, None)
+    0
+    >>> open(path).read() == "new config" * 1000
+    True
+
+    >>> test_config.cleanup(old_state)
+    """
+
+# ==================================================================================
+
+def main():
+    """Run module tests,  for now just doctests only."""
+    from crds.tests import test_atomic_writes, tstmod
+    return tstmod(test_atomic_writes)
+
+if __name__ == "__main__":
+    print(main())
@@ -2,8 +2,9 @@ import os
 import json
 import shutil
 
-from crds import bestrefs
+from crds import bestrefs, data_file
 from crds.bestrefs import BestrefsScript
+from crds.bestrefs import headers, header_archive, checkpoint
 from crds.tests import test_config
 
 """
@@ -447,6 +448,64 @@ class TestBestrefs(test_config.CRDSTestCase):
                         expected_errs=None)
         os.remove("test_cos.json")
 
+    def test_bestrefs_from_header_archive(self):
+        header_archive.convert_headers(["data/test_cos.json"], "test_cos.sqlite3")
+        self.run_script("crds.bestrefs --new-context hst_0315.pmap --load-pickle test_cos.sqlite3 --stats",
+                        expected_errs=1)
+        os.remove("test_cos.sqlite3")
+
+    def test_header_archive_round_trip(self):
+        original = headers.load_bestrefs_headers("data/test_cos.json")
+        header_archive.save_header_archive("test_cos.sqlite3", original)
+        self.assertEqual(headers.load_bestrefs_headers("test_cos.sqlite3"), original)
+        with header_archive.HeaderArchive("test_cos.sqlite3") as archive:
+            self.assertEqual(archive.read_snapshot(), original)
+            self.assertEqual(archive.read(), original)
+        only_ids = sorted(original)[:1]
+        subset = headers.load_bestrefs_headers("test_cos.sqlite3", only_ids=only_ids)
+        self.assertEqual(subset, {dataset: original[dataset] for dataset in only_ids})
+        self.assertEqual(headers.load_bestrefs_headers("test_cos.sqlite3", datasets_since="2100-01-01"), {})
+        os.remove("test_cos.sqlite3")
+
+    def test_bestrefs_checkpoint_resume(self):
+        path = os.path.join(self.temp_dir, "test_bestrefs.checkpoint")
+        journal = checkpoint.CheckpointJournal(path)
+        journal.append(dict(processed=["data/j8bt05njq_raw.fits"], updates={}, kill_list={}))
+        script = BestrefsScript("crds.bestrefs --new-context hst_0315.pmap "
+                                "--files data/j8bt05njq_raw.fits data/j8bt06o6q_raw.fits "
+                                "--checkpoint " + path + " --checkpoint-every 1 --resume")
+        self.assertEqual(script(), 0)
+        self.assertEqual(script.get_stat("datasets"), 1)
+        self.assertFalse(journal.exists())
+
+    def test_bestrefs_checkpoint_context_changed(self):
+        path = os.path.join(self.temp_dir, "test_bestrefs.checkpoint")
+        journal = checkpoint.CheckpointJournal(path)
+        journal.append(dict(processed=["data/j8bt05njq_raw.fits"], updates={}, kill_list={},
+                            signature="--new-context hst-operational --files data/j8bt05njq_raw.fits "
+                            "data/j8bt06o6q_raw.fits new_context=hst_0314.pmap old_context=None"))
+        script = BestrefsScript("crds.bestrefs --new-context hst_0315.pmap "
+                                "--files data/j8bt05njq_raw.fits data/j8bt06o6q_raw.fits "
+                                "--checkpoint " + path + " --checkpoint-every 1 --resume")
+        self.assertEqual(script(), 1)
+        self.assertEqual(script.get_stat("datasets"), 2)
+        self.assertTrue(journal.exists())
+
+    def test_bestrefs_profile_report(self):
+        self.run_script("crds.bestrefs --new-context hst_0315.pmap --old-context hst_0003.pmap "
+                        "--files data/j8bt05njq_raw.fits data/j8bt06o6q_raw.fits --profile-report test_profile.json",
+                        expected_errs=0)
+        with open("test_profile.json") as handle:
+            profile = json.load(handle)
+        stages = {row["stage"]: row for row in profile["stages"]}
+        self.assertEqual(stages["bestrefs new"]["calls"], 2)
+        self.assertEqual(stages["header fetch old"]["calls"], 2)
+        self.assertIn("header fetch", stages)
+        self.assertEqual(stages["comparison"]["calls"], 2)
+        self.assertIn("conditioning", stages)
+        self.assertTrue(any(stage.startswith("lookup acs ") for stage in stages))
+        os.remove("test_profile.json")
+
     def test_bestrefs_at_file(self):
         self.run_script("crds.bestrefs --files @data/bestrefs_file_list  --new-context hst_0315.pmap --stats",
                         expected_errs=0)
@@ -469,6 +528,15 @@ class TestBestrefs(test_config.CRDSTestCase):
                        expected_errs=0)
         os.remove("j8bt06o6q_raw.fits")
 
+    def test_bestrefs_update_file_headers_jobs(self):
+        shutil.copy("data/j8bt05njq_raw.fits", "j8bt05njq_raw.fits")
+        shutil.copy("data/j8bt06o6q_raw.fits", "j8bt06o6q_raw.fits")
+        self.run_script("crds.bestrefs --files ./j8bt05njq_raw.fits ./j8bt06o6q_raw.fits --new-context hst_0315.pmap "
+                        "--update-bestrefs --jobs 2", expected_errs=0)
+        for filename in ["j8bt05njq_raw.fits", "j8bt06o6q_raw.fits"]:
+            self.assertEqual(data_file.getval(filename, "CRDS_CTX"), "HST_0315.PMAP")
+            os.remove(filename)
+
     def test_bestrefs_update_bestrefs(self):
         # """update_bestrefs modifies dataset file headers"""
         shutil.copy("data/j8bt06o6q_raw.fits", "j8bt06o6q_raw.fits")
@@ -0,0 +1,67 @@
+"""This module contains tests that exercise the crds.cache module used to limit the size
+of a CRDS cache by evicting least recently used references and by storing identical
+references once.
+"""
+import os
+import time
+
+from crds.core import config, utils, access_log, blob_store
+from crds.cache import CacheScript
+from crds.sync import SyncScript
+from crds.tests import test_config
+
+# ==================================================================================
+
+class TestCache(test_config.CRDSTestCase):
+
+    script_class = CacheScript
+
+    def setUp(self):
+        super(TestCache, self).setUp()
+        os.environ["CRDS_PATH"] = self.temp_dir
+        os.environ["CRDS_REF_SUBDIR_MODE"] = "flat"
+
+    def write_reference(self, name, age):
+        """Write a 512K reference `name` to the cache last modified `age` seconds ago."""
+        path = config.locate_file(name, "hst")
+        with open(path, "wb") as handle:
+            handle.write(b"x" * 2**19)
+        when = time.time() - age
+        os.utime(path, (when, when))
+
+    def test_cache_gc(self):
+        SyncScript("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references")()
+        self.write_reference("s7g1700gl_dead.fits", 5000)
+        self.write_reference("s7g1700ql_dead.fits", 5000)
+        self.write_reference("o1a0000al_dead.fits", 4000)
+        self.write_reference("o1a0000bl_dead.fits", 3000)
+        self.write_reference("o1a0000cl_dead.fits", 2000)
+        access_log.get_access_log("hst").record(["o1a0000al_dead.fits"])
+        partial = utils.atomic_temp_path(config.locate_file("o1a0000dl_dead.fits", "hst"))
+        with open(partial, "wb") as handle:
+            handle.write(b"x" * 2**10)
+        os.utime(partial, (time.time() - 100000, time.time() - 100000))
+        self.run_script("crds.cache gc --contexts hst_cos_deadtab.rmap --quota-mb 2 --dry-run")
+        self.assertTrue(os.path.exists(partial))
+        self.assert_crds_exists("o1a0000bl_dead.fits")
+        self.run_script("crds.cache gc --contexts hst_cos_deadtab.rmap --quota-mb 2")
+        self.assert_crds_exists("s7g1700gl_dead.fits")
+        self.assert_crds_exists("s7g1700ql_dead.fits")
+        self.assert_crds_exists("o1a0000al_dead.fits")
+        self.assert_crds_not_exists("o1a0000bl_dead.fits")
+        self.assert_crds_exists("o1a0000cl_dead.fits")
+        self.assertFalse(os.path.exists(partial))
+        self.assertEqual(sorted(access_log.get_access_log("hst").last_accessed()),
+                         ["o1a0000al_dead.fits", "o1a0000cl_dead.fits", "s7g1700gl_dead.fits", "s7g1700ql_dead.fits"])
+        self.run_script("crds.cache gc --contexts hst_cos_deadtab.rmap --quota-mb 0", 1)
+
+    def test_cache_migrate_blobs(self):
+        SyncScript("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references")()
+        self.write_reference("o1a0000al_dead.fits", 0)
+        self.write_reference("o1a0000bl_dead.fits", 0)
+        self.run_script("crds.cache migrate-blobs --contexts hst_cos_deadtab.rmap")
+        first = config.locate_file("o1a0000al_dead.fits", "hst")
+        second = config.locate_file("o1a0000bl_dead.fits", "hst")
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertEqual(blob_store.linked_blob(first), blob_store.blob_location(utils.checksum(first)))
+        self.assert_crds_exists("s7g1700gl_dead.fits")
@@ -0,0 +1,140 @@
+"""This module tests tiered CRDS caches,  where CRDS_PATH lists a local cache followed by
+shared caches:  read-through lookups,  promotion of shared files to the local cache,  eviction
+of promoted copies,  and that downloads and removals always target the local cache.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from crds.core import config, utils, cache_tiers
+from crds.client import api
+from crds.tests import test_config
+
+# ==================================================================================
+
+MAPPING = "hst_cos.imap"
+REFERENCE = "s7g1700gl_dead.fits"
+
+class TestCacheTiers(test_config.CRDSTestCase):
+
+    def setUp(self):
+        self.tiers_dir = tempfile.mkdtemp(prefix="crds-tiers-")
+        self.local = os.path.join(self.tiers_dir, "local")
+        self.shared = os.path.join(self.tiers_dir, "shared")
+        self.cache = self.local + os.pathsep + self.shared
+        super(TestCacheTiers, self).setUp()
+        self.old_environ = {var: os.environ.get(var) for var in
+                            ["CRDS_CACHE_TIER_COPY", "CRDS_CACHE_TIER_MB", "CRDS_READONLY_CACHE"]}
+        for name in [MAPPING, REFERENCE]:
+            self.write(self.shared_path(name), name + " shared contents")
+
+    def tearDown(self):
+        cache_tiers.wait_for_copies()
+        for var, value in self.old_environ.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+        shutil.rmtree(self.tiers_dir)
+        super(TestCacheTiers, self).tearDown()
+
+    def write(self, path, contents):
+        utils.ensure_dir_exists(path)
+        with open(path, "w+") as handle:
+            handle.write(contents)
+
+    def local_path(self, name):
+        return config.relocate_file(name, "hst")
+
+    def shared_path(self, name):
+        return self.shared + self.local_path(name)[len(self.local):]
+
+    # ------------------------------------------------------------------------------
+
+    def test_tiers_from_crds_path(self):
+        self.assertEqual(config.get_crds_path(), self.local)
+        self.assertEqual(config.get_crds_path_tiers(), [self.local, self.shared])
+
+    def test_read_through_then_promoted(self):
+        self.assertEqual(config.locate_mapping(MAPPING), self.shared_path(MAPPING))
+        self.assertEqual(config.locate_reference(REFERENCE, "hst"), self.shared_path(REFERENCE))
+        cache_tiers.wait_for_copies()
+        self.assertEqual(config.locate_mapping(MAPPING), self.local_path(MAPPING))
+        self.assertEqual(config.locate_file(REFERENCE, "hst"), self.local_path(REFERENCE))
+        with open(self.local_path(REFERENCE)) as handle:
+            self.assertEqual(handle.read(), REFERENCE + " shared contents")
+        self.assertEqual(sorted(cache_tiers.get_ledger().copies()),
+                         sorted([self.local_path(MAPPING), self.local_path(REFERENCE)]))
+
+    def test_local_tier_first(self):
+        self.write(self.local_path(MAPPING), "local contents")
+        self.assertEqual(config.locate_mapping(MAPPING), self.local_path(MAPPING))
+        cache_tiers.wait_for_copies()
+        self.assertEqual(cache_tiers.get_ledger().copies(), {})
+
+    def test_missing_everywhere_is_local(self):
+        self.assertEqual(config.locate_mapping("hst_acs.imap"), self.local_path("hst_acs.imap"))
+
+    def test_no_copy_when_disabled(self):
+        os.environ["CRDS_CACHE_TIER_COPY"] = "0"
+        self.assertEqual(config.locate_mapping(MAPPING), self.shared_path(MAPPING))
+        cache_tiers.wait_for_copies()
+        self.assertFalse(os.path.exists(self.local_path(MAPPING)))
+
+    def test_no_copy_when_readonly(self):
+        os.environ["CRDS_READONLY_CACHE"] = "1"
+        self.assertEqual(config.locate_mapping(MAPPING), self.shared_path(MAPPING))
+        cache_tiers.wait_for_copies()
+        self.assertFalse(os.path.exists(self.local_path(MAPPING)))
+
+    def test_evict_promoted_copies(self):
+        config.locate_mapping(MAPPING)
+        config.locate_reference(REFERENCE, "hst")
+        cache_tiers.wait_for_copies()
+        ledger = cache_tiers.get_ledger()
+        self.assertEqual(ledger.evict(ledger.total_bytes() - 1), 1)
+        self.assertEqual(len(ledger.copies()), 1)
+        self.assertEqual(ledger.evict(0), 1)
+        self.assertEqual(ledger.total_bytes(), 0)
+        for name in [MAPPING, REFERENCE]:
+            self.assertFalse(os.path.exists(self.local_path(name)))
+            self.assertTrue(os.path.exists(self.shared_path(name)))
+
+    def test_quota_evicts_after_copy(self):
+        os.environ["CRDS_CACHE_TIER_MB"] = "1"
+        big = "hst_acs.imap"
+        self.write(self.shared_path(big), "x" * 2**20)
+        config.locate_mapping(MAPPING)
+        cache_tiers.wait_for_copies()
+        config.locate_mapping(big)
+        cache_tiers.wait_for_copies()
+        self.assertLessEqual(cache_tiers.get_ledger().total_bytes(), 2**20)
+        self.assertFalse(os.path.exists(self.local_path(MAPPING)))
+
+    def test_copier_does_not_block_exit(self):
+        config.locate_mapping(MAPPING)
+        copiers = [thread for thread in threading.enumerate() if thread.name == "crds-cache-tier-copier"]
+        self.assertTrue(copiers)
+        self.assertTrue(all(thread.daemon for thread in copiers))
+
+    # ------------------------------------------------------------------------------
+
+    def test_write_targets_are_local(self):
+        self.assertEqual(config.relocate_mapping(MAPPING), self.local_path(MAPPING))
+        self.assertEqual(config.relocate_reference(REFERENCE, "hst"), self.local_path(REFERENCE))
+        cacher = api.FileCacher("hst.pmap")
+        self.assertEqual(cacher.locate(MAPPING), self.local_path(MAPPING))
+        self.assertEqual(cacher.locate(REFERENCE), self.local_path(REFERENCE))
+
+    def test_remove_local_copy_only(self):
+        config.locate_mapping(MAPPING)
+        cache_tiers.wait_for_copies()
+        utils.remove(config.relocate_mapping(MAPPING), "hst")
+        self.assertFalse(os.path.exists(self.local_path(MAPPING)))
+        self.assertTrue(os.path.exists(self.shared_path(MAPPING)))
+
+    def test_cache_references_reads_shared_tier(self):
+        cacher = api.FileCacher("hst.pmap")
+        self.assertEqual(api._locate_shared_tier_files(cacher, [REFERENCE, "s7g1700hl_dead.fits"]),
+                         {REFERENCE: self.shared_path(REFERENCE)})
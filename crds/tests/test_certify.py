@@ -12,6 +12,7 @@ from nose.tools import assert_raises, assert_true
 from crds.core import utils, log, exceptions
 from crds import client
 from crds import data_file
+from crds.io import tables
 from crds import certify
 from crds.certify import CertifyScript
 from crds.certify import generic_tpn
@@ -1857,6 +1858,29 @@ class TestCertify(test_config.CRDSTestCase):
         
 # ------------------------------------------------------------------------------
         
+    def test_check_column_values_matches_rows(self):
+        checker = certify.validator(certify.TpnInfo('CENWAVE','C','I','R',('1000:2000',)))
+        column = tuple(np.array([1000, 1500, 2500, 900, 1500], dtype="i4"))
+        with self.assertRaisesRegex(ValueError, "Value for 'CENWAVE' of 2500 is outside acceptable range 1000:2000"):
+            checker.check_column_rows("test.fits", column)
+        with self.assertRaisesRegex(ValueError, "Value for 'CENWAVE' of 2500 is outside acceptable range 1000:2000"):
+            checker.check_column_values("test.fits", column)
+        checker = certify.validator(certify.TpnInfo('OPT_ELEM','C','C','R',('G130M','G160M')))
+        self.assertTrue(checker.check_column_values("test.fits", ("G130M", "g160m ", "G130M")))
+        with self.assertRaisesRegex(ValueError, "Value 'G140L' is not one of"):
+            checker.check_column_values("test.fits", ("G130M", "G140L", "G999M"))
+
+    def test_get_validators_cached_per_type(self):
+        validators.clear_cache()
+        checkers1 = validators.get_validators("hst", self.data("s7g1700gl_dead.fits"))
+        checkers2 = validators.get_validators("hst", self.data("s7g1700gl_dead_dup1.fits"))
+        self.assertEqual(len(checkers1), len(checkers2))
+        self.assertTrue(all(check1 is check2 for (check1, check2) in zip(checkers1, checkers2)))
+        required = checkers1[0].get_required_copy()
+        self.assertEqual(required.info.presence, "R")
+        self.assertIs(required, checkers2[0].get_required_copy())
+        self.assertIsNot(required, checkers1[0])
+
     def test_sybdate_validator(self):
         tinfo = certify.TpnInfo('USEAFTER','H','C','R',('&SYBDATE',))
         cval = certify.validator(tinfo)
@@ -1915,7 +1939,51 @@ class TestCertify(test_config.CRDSTestCase):
     def test_table_mode_checks_missing_modes(self):
         self.certify_files([self.data("v8q1445xx_idc.fits")], observatory="hst", 
                               context="hst.pmap", compare_old_reference=True)
-        
+
+    def test_table_modes_index(self):
+        keys = ["MODEUP", "MODEDOWN"]
+        old_table = tables.tables(self.data("test-source.fits"))[0]
+        new_table = tables.tables(self.data("test-duplicate-mode.fits"))[0]
+        old_modes = certify.TableModes("old reference", old_table, keys)
+        new_modes = certify.TableModes("new reference", new_table, keys)
+        self.assertEqual(old_modes.to_dict(), certify.table_mode_dictionary("old reference", old_table, keys)[0])
+        self.assertEqual(len(new_modes.modes), 9)    # one duplicate mode
+        common = [mode for mode in old_modes.modes if mode in new_modes.modes]
+        changed = certify.changed_rows(old_table, [old_modes.modes[mode] for mode in common],
+                                       new_table, [new_modes.modes[mode] for mode in common])
+        self.assertEqual([mode for mode, is_changed in zip(common, changed) if is_changed],
+                         [(("MODEUP", "no"), ("MODEDOWN", "yes"))])
+
+    def test_certify_files_jobs(self):
+        files = [self.data(name) for name in ["s7g1700gl_dead.fits", "missing_keyword.fits",
+                                              "s7g1700gl_dead_dup1.fits", "j8btxxx_raw_bad.fits",
+                                              "non-existent-file.fits"]]
+        old_trap = log.set_exception_trap(True)   # trap failures like the command line
+        try:
+            log.reset()
+            certify.certify_files(files, observatory="hst", check_rmap=False)
+            serial_status = log.status()
+            log.reset()
+            certify.certify_files(files, observatory="hst", check_rmap=False, jobs=2)
+            self.assertEqual(log.status(), serial_status)
+        finally:
+            log.set_exception_trap(old_trap)
+
+    def test_certify_files_cache(self):
+        files = [self.data(name) for name in ["s7g1700gl_dead.fits", "missing_keyword.fits"]]
+        log.reset()
+        certify.certify_files(files, observatory="hst", check_rmap=False)
+        uncached_status = log.status()
+        for _ in range(2):   # first run saves results,  second replays them
+            log.reset()
+            certify.certify_files(files, observatory="hst", check_rmap=False, certify_cache=True)
+            self.assertEqual(log.status(), uncached_status)
+        cache = certify.get_certify_cache(files, dict(
+            context=None, dump_provenance=False, check_references=False, compare_old_reference=False,
+            dont_parse=False, script=None, observatory="hst", comparison_reference=None, run_fitsverify=False))
+        result = cache.get(cache.key(files[1], files[1]))
+        self.assertFalse(result["passed"])
+
     def test_UnknownCertifier_missing(self):
         # log.set_exception_trap("test")
         assert_raises(FileNotFoundError, certify.certify_file, 
@@ -1968,7 +2036,24 @@ class TestCertify(test_config.CRDSTestCase):
                 }
         info = certify.TpnInfo('SCI','D','X','R',('&KernelUnity',))
         checker = certify.KernelunityValidator(info)
-        assert_raises(exceptions.BadKernelSumError, checker.check, "test.fits", header)        
+        assert_raises(exceptions.BadKernelSumError, checker.check, "test.fits", header)
+
+    def test_certify_kernel_unity_validator_chunked(self):
+        kernels = np.full((3, 3, 4, 5), -0.01, dtype="float32")
+        kernels[1, 1] = 1.08
+        kernels[0, 0, 3, 1] += 1e-5    # kernel #7 in transposed order
+        kernels[0, 0, 2, 4] += 1e-5    # kernel #18
+        header = {'SCI_ARRAY': utils.Struct({'DATA': kernels})}
+        info = certify.TpnInfo('SCI','D','X','R',('&KernelUnity',))
+        checker = certify.KernelunityValidator(info)
+        checker.chunk_bytes = 3 * 3 * 4 * 3    # 3 kernels per chunk
+        with self.assertRaisesRegex(exceptions.BadKernelSumError, "for kernel #7 "):
+            checker.check("test.fits", header)
+        kernels[0, 0, 3, 1] -= 1e-5
+        with self.assertRaisesRegex(exceptions.BadKernelSumError, "for kernel #18 "):
+            checker.check("test.fits", header)
+        kernels[0, 0, 2, 4] -= 1e-5
+        checker.check("test.fits", header)
 
 
 # ==================================================================================
@@ -122,8 +122,11 @@ def dt_fits_table():
     >>> tab.colnames[0]
     'DETCHIP'
     
-    >>> tab.columns['DETCHIP'][:1]
-    (1,)
+    >>> list(tab.columns['DETCHIP'][:1]) == [1]
+    True
+
+    >>> tab.column('DETCHIP') is tab.columns['DETCHIP']
+    True
     >>> test_config.cleanup(old_state)
     """
 
@@ -153,7 +156,92 @@ def dt_csv_table():
     >>> tab.columns['OBSID'][0]
     3102
     >>> test_config.cleanup(old_state)
-    """    
+    """
+
+def dt_fits_table_lazy_columns():
+    """
+    ----------------------------------------------------------------------------------
+    FITS table columns are loaded only as they are used,  rows are built on demand:
+
+    >>> old_state = test_config.setup(url="https://jwst-serverless-mode.stsci.edu")
+    >>> tables.clear_cache()
+    >>> tab = tables.tables("data/v8q14451j_idc.fits")[0]
+    >>> sorted(tab._columns)
+    []
+
+    >>> list(tab.load_columns(["FILTER1", "detchip"])[0][:2])
+    ['F475W', 'F475W']
+    >>> sorted(tab._columns)
+    ['DETCHIP', 'FILTER1']
+
+    >>> len(tab.rows), tab.nrows
+    (694, 694)
+    >>> tab.rows[-1] == tab.rows[693] == tuple(tab.rows)[-1]
+    True
+    >>> len(tab._columns) == len(tab.colnames)
+    True
+    >>> tables.clear_cache()
+    >>> test_config.cleanup(old_state)
+    """
+
+# ==================================================================================
+
+def dt_header_cache():
+    """
+    ----------------------------------------------------------------------------------
+    With CRDS_HEADER_CACHE enabled,  headers are saved to and reused from a persistent cache:
+
+    >>> import tempfile
+    >>> from crds.core import config
+    >>> from crds.io import header_cache
+    >>> old_state = test_config.setup(url="https://hst-serverless-mode.stsci.edu")
+    >>> os.environ["CRDS_HEADER_CACHEPATH"] = tempfile.mkdtemp()
+    >>> config.HEADER_CACHE.set(True)
+    False
+    >>> header = data_file.get_free_header("data/j8btxxx_raw_bad.fits", ("INSTRUME", "DETECTOR"), observatory="hst")
+    >>> cache = header_cache.get_header_cache()
+    >>> cache.stats()["headers"]
+    1
+    >>> data_file.get_free_header("data/j8btxxx_raw_bad.fits", ("INSTRUME", "DETECTOR"), observatory="hst") == header
+    True
+    >>> cache.stats()["headers"]
+    1
+    >>> cache.evict(max_bytes=0)
+    >>> cache.stats()["headers"]
+    0
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_fits_scanned_headers():
+    """
+    ----------------------------------------------------------------------------------
+    Scanning FITS header blocks reads the same cards as astropy for every FITS file in the
+    test data,  both whole headers and needed keywords,  or refuses with FitsScanError:
+
+    >>> import glob
+    >>> import warnings
+    >>> from crds.core import config
+    >>> from crds.io import fits as crds_fits
+    >>> old_state = test_config.setup(url="https://hst-serverless-mode.stsci.edu")
+    >>> old_scan = config.FITS_SCAN_HEADERS.set(False)
+    >>> needed = ("INSTRUME", "DETECTOR", "NAXIS", "DATE-OBS", "HISTORY")
+    >>> refused = []
+    >>> with warnings.catch_warnings():
+    ...     warnings.simplefilter("ignore")
+    ...     for path in sorted(glob.glob(os.path.join(test_config.TEST_DATA, "**", "*.fits"), recursive=True)):
+    ...         union = crds_fits.FitsFile(path).get_raw_header(checksum=False)
+    ...         try:
+    ...             scanned = crds_fits.scan_raw_header(path)
+    ...         except crds_fits.FitsScanError:
+    ...             refused.append(os.path.basename(path))
+    ...             continue
+    ...         assert scanned == union, path
+    ...         assert crds_fits.scan_raw_header(path, needed) == [card for card in union if card[0] in needed], path
+    >>> refused
+    ['truncated.fits']
+    >>> _ = config.FITS_SCAN_HEADERS.set(old_scan)
+    >>> test_config.cleanup(old_state)
+    """
 
 # ==================================================================================
 
@@ -184,6 +272,43 @@ def dt_asdf_history_with_entries():
     >>> test_config.cleanup(old_state)
     """
 
+def dt_asdf_needed_keys_header():
+    """
+    Reading only needed keywords visits just their tree paths,  matching the full header:
+
+    >>> old_state = test_config.setup(url="https://jwst-serverless-mode.stsci.edu")
+    >>> from crds.io import asdf as crds_asdf
+    >>> needed = ("META.INSTRUMENT.NAME", "META.EXPOSURE.TYPE", "META.REFTYPE", "HISTORY", "APERTURES")
+    >>> for filename in ["data/valid.asdf", "data/jwst_miri_distortion_0022.asdf", "data/jwst_nirspec_ifupost_0004.asdf"]:
+    ...     afile = crds_asdf.AsdfFile(filename)
+    ...     full = afile._reduce_header(afile.get_raw_header(), needed)
+    ...     assert afile._reduce_header(afile.get_raw_header(needed), needed) == full, filename
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_asdf_needed_keys_without_raw_types():
+    """
+    asdf versions which do not accept the private _force_raw_types parameter read needed
+    keywords from the converted tree instead:
+
+    >>> old_state = test_config.setup(url="https://jwst-serverless-mode.stsci.edu")
+    >>> from crds.io import asdf as crds_asdf
+    >>> import asdf
+    >>> from unittest import mock
+    >>> def open_without_raw_types(*args, _force_raw_types=None, **keys):
+    ...     if _force_raw_types is not None:
+    ...         raise TypeError("open() got an unexpected keyword argument '_force_raw_types'")
+    ...     return asdf_open(*args, **keys)
+    >>> asdf_open = asdf.open
+    >>> afile = crds_asdf.AsdfFile("data/valid.asdf")
+    >>> needed = ("META.INSTRUMENT.NAME", "META.REFTYPE")
+    >>> with mock.patch("asdf.open", open_without_raw_types):
+    ...     header = afile.get_raw_header(needed)
+    >>> header == afile._reduce_header(afile.get_raw_header(), needed)
+    True
+    >>> test_config.cleanup(old_state)
+    """
+
 def dt_get_array_properties_hdu_name():
     """
     >>> old_state = test_config.setup(url="https://jwst-serverless-mode.stsci.edu")
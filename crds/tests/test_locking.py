@@ -166,6 +166,152 @@ def dt_default_readonly():
     >>> test_config.cleanup(old_state)
     """
 
+def rw_instance(args):
+    """Hold the test reader/writer lock shared or exclusively,  logging when it is held."""
+    event_log_name, shared = args
+    lock = crds_cache_locking.get_rw_lock("crds.test.stress")
+    kind = "S" if shared else "X"
+    with (lock.shared() if shared else lock.exclusive()):
+        log_event(event_log_name, kind + "+")
+        time.sleep(0.1)
+        log_event(event_log_name, kind + "-")
+
+def log_event(event_log_name, event):
+    """Append `event` to the log of lock holders in a single atomic write."""
+    handle = os.open(event_log_name, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(handle, "{} {}\n".format(event, os.getpid()).encode("utf-8"))
+    finally:
+        os.close(handle)
+
+def try_rw_stress():
+    """Run readers and writers of a reader/writer lock from many processes, then replay
+    the log of lock holders and print whether readers overlapped and how many times any
+    writer overlapped another holder.
+    """
+    crds_cache_locking.get_rw_lock("crds.test.stress")
+    pool = multiprocessing.Pool(8)
+    with tempfile.NamedTemporaryFile(mode="a") as event_log:
+        pool.map(rw_instance, [(event_log.name, n % 4 != 3) for n in range(32)])
+        pool.close()
+        pool.join()
+        readers = writers = max_readers = violations = 0
+        with open(event_log.name) as events:
+            for line in events:
+                event = line.split()[0]
+                if event == "S+":
+                    readers += 1
+                elif event == "X+":
+                    writers += 1
+                elif event == "S-":
+                    readers -= 1
+                else:
+                    writers -= 1
+                if writers > 1 or (writers and readers):
+                    violations += 1
+                max_readers = max(readers, max_readers)
+    print("readers overlapped:", max_readers > 1, "writer violations:", violations)
+
+def dt_rw_locking_stress():
+    """
+    Reader/writer locks based on flock() exclude writers from all other holders but
+    allow readers to hold the lock together.
+
+    >>> old_state = test_config.setup()
+    >>> _ = config.CACHE_LOCK_PATH.set(tempfile.mkdtemp())
+    >>> crds_cache_locking.init_locks()
+    >>> crds_cache_locking.get_rw_lock("crds.test.stress")
+    CrdsReadWriteLock('...crds.test.stress')
+    >>> try_rw_stress()
+    readers overlapped: True writer violations: 0
+    >>> crds_cache_locking.LOCKS.pop("crds.test.stress").break_lock()
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_rw_locking_disabled():
+    """
+    With locking disabled,  reader/writer locks do nothing.
+
+    >>> old_state = test_config.setup()
+    >>> _ = config.USE_LOCKING.set(False)
+    >>> crds_cache_locking.create_rw_lock("crds.test.disabled")
+    CrdsFakeLock('crds.test.disabled')
+    >>> with crds_cache_locking.create_rw_lock("crds.test.disabled").shared():
+    ...     pass
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_rw_locking_fallback():
+    """
+    When reader/writer locks cannot be created they fall back to a distinct exclusive lock,
+    so holding the CRDS cache lock and the cache reader/writer lock together does not hang.
+
+    >>> old_state = test_config.setup()
+    >>> _ = config.CACHE_LOCK_PATH.set(os.path.join(tempfile.mkstemp()[1], "missing"))
+    >>> crds_cache_locking.init_locks()
+    >>> crds_cache_locking.get_cache_rw_lock()
+    CrdsMultiprocessingLock('crds.cache.rw')
+    >>> crds_cache_locking.get_cache_rw_lock() is crds_cache_locking.get_cache_lock()
+    False
+    >>> with crds_cache_locking.get_cache_lock(), crds_cache_locking.get_cache_rw_lock().exclusive():
+    ...     print("held")
+    held
+    >>> _ = crds_cache_locking.LOCKS.pop("crds.cache.rw")
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_file_lock_buckets():
+    """
+    Cached files share a fixed set of lock buckets,  so downloading many files does not
+    leave a lock file behind for each of them.
+
+    >>> old_state = test_config.setup()
+    >>> lock_path = tempfile.mkdtemp()
+    >>> _ = config.CACHE_LOCK_PATH.set(lock_path)
+    >>> names = ["o1a0000{}l_dead.fits".format(i) for i in range(1000)]
+    >>> for name in names:
+    ...     with crds_cache_locking.get_file_lock(name):
+    ...         pass
+    >>> len(os.listdir(lock_path)) <= crds_cache_locking.LOCK_BUCKETS
+    True
+    >>> crds_cache_locking.get_file_lock("/some/path/" + names[0]) is crds_cache_locking.get_file_lock(names[0])
+    True
+    >>> for name in list(crds_cache_locking.LOCKS):
+    ...     if name.startswith("crds.file."):
+    ...         _ = crds_cache_locking.LOCKS.pop(name)
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_lock_stats_and_owners():
+    """
+    Lock waits are instrumented and exclusive holders are recorded so locks left by dead
+    processes can be found.
+
+    >>> import socket
+    >>> old_state = test_config.setup()
+    >>> lock_path = tempfile.mkdtemp()
+    >>> _ = config.CACHE_LOCK_PATH.set(lock_path)
+    >>> lock = crds_cache_locking.create_rw_lock("crds.test.owned")
+    >>> with lock.exclusive():
+    ...     crds_cache_locking.read_owner(lock.owner_path)[:2] == (os.getpid(), socket.gethostname())
+    True
+    >>> os.path.exists(lock.owner_path)
+    False
+    >>> with lock.shared():
+    ...     os.path.exists(lock.owner_path)
+    False
+    >>> crds_cache_locking.lock_stats()[lock.lockname][0]
+    2
+
+    >>> with open(os.path.join(lock_path, "crds.test.dead.owner"), "w+") as handle:
+    ...     _ = handle.write("999999999 " + socket.gethostname() + " 0")
+    >>> with open(os.path.join(lock_path, "crds.test.remote.owner"), "w+") as handle:
+    ...     _ = handle.write("999999999 some.other.host 0")
+    >>> [os.path.basename(path) for (path, owner) in crds_cache_locking.find_stale_locks()]
+    ['crds.test.dead']
+    >>> test_config.cleanup(old_state)
+    """
+
 # ==================================================================================
 
 def main():
@@ -461,6 +461,21 @@ def dt_imap_match_omit():
     >>> test_config.cleanup(old_state)
     """
 
+def dt_mapping_closure():
+    """
+    >>> old_state = test_config.setup()
+    >>> closure = rmap.MappingClosure()
+    >>> visited = set()
+    >>> mappings, references = closure.closure("hst_cos.imap", visited)
+    >>> "hst_cos_deadtab.rmap" in mappings,  "s7g1700gl_dead.fits" in references
+    (True, True)
+    >>> closure.closure("hst_cos_deadtab.rmap", visited)
+    (set(), set())
+    >>> pp(closure.closure("hst_cos_deadtab.rmap"))
+    ({'hst_cos_deadtab.rmap'}, {'s7g1700gl_dead.fits', 's7g1700ql_dead.fits'})
+    >>> test_config.cleanup(old_state)
+    """
+
 def dt_pickling():
     """
     >>> from crds import data_file
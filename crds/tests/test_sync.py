@@ -4,7 +4,7 @@ a CRDS cache of rules and references.
 import os
 
 import crds
-from crds.core import config, rmap
+from crds.core import config, rmap, purge_plan
 from crds.sync import SyncScript
 from crds.tests import test_config
 
@@ -32,6 +32,8 @@ class TestSync(test_config.CRDSTestCase):
         self.run_script("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references --check-files --repair-files", 2)
         self.run_script("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references --check-files --repair-files")
         self.run_script("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references --check-files --repair-files --check-sha1sum")
+        self.run_script("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references --check-files --check-sha1sum --verify-jobs 2")
+        self.run_script("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references --check-files --check-sha1sum --rehash-all")
 
     def test_sync_explicit_files(self):
         self.assert_crds_not_exists("hst_cos_deadtab.rmap")
@@ -79,7 +81,21 @@ class TestSync(test_config.CRDSTestCase):
         self.run_script("crds.sync --contexts hst_acs_imphttab.rmap --fetch-references --purge-mappings --purge-references")
         self.assertEqual(rmap.list_references("*", "hst"), ['w3m1716tj_imp.fits', 'w3m17170j_imp.fits', 'w3m17171j_imp.fits'])
         self.assertEqual(rmap.list_mappings("*", "hst"), ['hst_acs_imphttab.rmap'])
-        
+
+    def test_purge_plan(self):
+        plan = os.path.join(self.temp_dir, "purge.json")
+        self.run_script("crds.sync --contexts hst_cos_deadtab.rmap --fetch-references")
+        self.run_script("crds.sync --contexts hst_acs_imphttab.rmap --fetch-references --purge-mappings --purge-references "
+                        "--purge-plan " + plan)
+        self.assert_crds_exists("s7g1700gl_dead.fits")
+        self.assert_crds_exists("hst_cos_deadtab.rmap")
+        saved = purge_plan.PurgePlan.load(plan)
+        self.assertEqual(saved.files, 3)
+        self.assertEqual(saved.contexts, ["hst_acs_imphttab.rmap"])
+        self.run_script("crds.sync --execute-purge-plan " + plan + " --purge-jobs 2")
+        self.assertEqual(rmap.list_references("*", "hst"), ['w3m1716tj_imp.fits', 'w3m17170j_imp.fits', 'w3m17171j_imp.fits'])
+        self.assertEqual(rmap.list_mappings("*", "hst"), ['hst_acs_imphttab.rmap'])
+
 # ==================================================================================
 
 
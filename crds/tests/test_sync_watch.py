@@ -0,0 +1,228 @@
+"""This module tests crds sync --watch,  the cache warmer which syncs each new context
+announced by the CRDS server before updating the cache config,  against a local stand-in
+for the CRDS server.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import http.server
+
+import crds
+from crds.core import heavy_client, utils
+from crds.client import api
+from crds.sync import SyncScript
+from crds.tests import test_config
+
+# ==================================================================================
+
+PMAP = """header = {{
+    'derived_from' : 'generated for test_sync_watch',
+    'mapping' : 'PIPELINE',
+    'name' : '{name}',
+    'observatory' : 'HST',
+    'parkey' : ('INSTRUME',),
+}}
+
+selector = {{
+    'COS' : '{imap}',
+}}
+"""
+
+IMAP = """header = {{
+    'derived_from' : 'generated for test_sync_watch',
+    'instrument' : 'COS',
+    'mapping' : 'INSTRUMENT',
+    'name' : '{name}',
+    'observatory' : 'HST',
+    'parkey' : ('REFTYPE',),
+}}
+
+selector = {{
+    'deadtab' : '{rmap}',
+}}
+"""
+
+RMAP = """header = {{
+    'derived_from' : 'generated for test_sync_watch',
+    'filekind' : 'DEADTAB',
+    'instrument' : 'COS',
+    'mapping' : 'REFERENCE',
+    'name' : '{name}',
+    'observatory' : 'HST',
+    'parkey' : (('DETECTOR',), ('DATE-OBS', 'TIME-OBS')),
+}}
+
+selector = Match({{
+    ('FUV',) : UseAfter({{
+{useafters}
+    }}),
+}})
+"""
+
+# ==================================================================================
+
+class StandInServer:
+    """Local stand-in for the CRDS server which answers the JSON RPC services used by
+    crds sync from server info dict `info` and serves the files in directory `files`.
+    """
+    def __init__(self, files, info):
+        self.files = files
+        self.info = info
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                result = getattr(stand_in, request["method"])(*request["params"])
+                self.reply(json.dumps({"id" : request["id"], "result" : result, "error" : None}).encode("utf-8"))
+
+            def do_GET(self):
+                path = os.path.join(stand_in.files, os.path.basename(self.path))
+                if not os.path.exists(path):
+                    self.send_error(404)
+                    return
+                with open(path, "rb") as handle:
+                    self.reply(handle.read())
+
+            def reply(self, data):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("localhost", 0), Handler)
+        self.url = "http://localhost:{}".format(self.httpd.server_address[1])
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_server_info(self):
+        files_url = { "hst" : self.url + "/files/" }
+        return dict(self.info, observatory="hst", crds_version={"str" : crds.__version__},
+                    bad_files="", bad_files_list=[], force_remote_mode=False,
+                    mappings=sorted(name for name in os.listdir(self.files) if name.endswith("map")),
+                    reference_url={"unchecked" : files_url}, mapping_url={"unchecked" : files_url})
+
+    def get_default_context(self, observatory):
+        return self.info["operational_context"]
+
+    def get_mapping_names(self, context):
+        names, pending = set(), [context]
+        while pending:
+            name = pending.pop()
+            if name not in names and os.path.exists(os.path.join(self.files, name)):
+                names.add(name)
+                with open(os.path.join(self.files, name)) as handle:
+                    pending.extend(re.findall(r"'(\w+\.[pir]map)'", handle.read()))
+        return sorted(names)
+
+    def get_reference_names(self, context):
+        references = set()
+        for name in self.get_mapping_names(context):
+            with open(os.path.join(self.files, name)) as handle:
+                references.update(re.findall(r"'(\w+\.fits)'", handle.read()))
+        return sorted(references)
+
+    def get_file_info_map(self, observatory, files, fields):
+        infos = {}
+        for name in files:
+            path = os.path.join(self.files, name)
+            if os.path.exists(path):
+                with open(path, "rb") as handle:
+                    sha1sum = hashlib.sha1(handle.read()).hexdigest()
+                infos[name] = { "size" : str(os.stat(path).st_size), "sha1sum" : sha1sum, "rejected" : "false",
+                                "blacklisted" : "false", "state" : "operational", "instrument" : "cos" }
+            else:
+                infos[name] = "NOT FOUND"
+        return infos
+
+# ==================================================================================
+
+class TestSyncWatch(test_config.CRDSTestCase):
+
+    script_class = SyncScript
+
+    def setUp(self):
+        super(TestSyncWatch, self).setUp()
+        os.environ["CRDS_PATH"] = self.temp_dir
+        os.environ["CRDS_REF_SUBDIR_MODE"] = "flat"
+        os.environ["CRDS_IGNORE_MAPPING_CHECKSUM"] = "1"
+        os.environ["CRDS_OBSERVATORY"] = "hst"
+        self.files = tempfile.mkdtemp()
+        references = ["s7g1700gl_dead.fits", "o1a0000al_dead.fits", "o1a0000bl_dead.fits"]
+        for serial in range(1, 4):
+            self.write_context(serial, references[:serial])
+        for name in references[:2]:   # the third reference is missing from the server
+            with open(os.path.join(self.files, name), "w+") as handle:
+                handle.write("contents of " + name)
+        self.server = StandInServer(self.files, {"operational_context" : "hst_0001.pmap",
+                                                 "edit_context" : "hst_0001.pmap"})
+        os.environ["CRDS_SERVER_URL"] = self.server.url
+        api.set_crds_server(self.server.url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        shutil.rmtree(self.files)
+        super(TestSyncWatch, self).tearDown()
+
+    def write_context(self, serial, references):
+        """Write version `serial` of a context selecting `references` to the server files."""
+        names = { kind : "hst{}_{:04d}.{}".format(infix, serial, kind)
+                  for (infix, kind) in [("", "pmap"), ("_cos", "imap"), ("_cos_deadtab", "rmap")] }
+        useafters = ["        '199{}-01-01 00:00:00' : '{}',".format(i, name) for (i, name) in enumerate(references)]
+        for kind, template in [("pmap", PMAP), ("imap", IMAP), ("rmap", RMAP)]:
+            with open(os.path.join(self.files, names[kind]), "w+") as handle:
+                handle.write(template.format(name=names[kind], imap=names["imap"], rmap=names["rmap"],
+                                             useafters="\n".join(useafters)))
+
+    def watch(self, expected_errs=0):
+        self.run_script("crds.sync --watch --watch-polls 1 --watch-interval 0 --fetch-references --save-pickles",
+                        expected_errs)
+
+    def cached_contexts(self):
+        info = heavy_client.load_server_info("hst")
+        return info.operational_context, info.edit_context
+
+    def test_sync_watch(self):
+        self.watch()
+        self.assertEqual(self.cached_contexts(), ("hst_0001.pmap", "hst_0001.pmap"))
+        self.assert_crds_exists("hst_cos_deadtab_0001.rmap")
+        self.assert_crds_exists("s7g1700gl_dead.fits")
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "pickles", "hst", "hst_0001.pmap.pkl")))
+
+        self.server.info["operational_context"] = "hst_0002.pmap"
+        self.watch()
+        self.assertEqual(self.cached_contexts(), ("hst_0002.pmap", "hst_0001.pmap"))
+        self.assert_crds_exists("o1a0000al_dead.fits")
+
+    def test_sync_watch_config_updated_elsewhere(self):
+        self.watch()
+        self.server.info["operational_context"] = "hst_0002.pmap"
+        utils.clear_function_caches()
+        heavy_client.update_config_info("hst")   # e.g. a pipeline connected before the watcher polled
+        self.assertEqual(self.cached_contexts(), ("hst_0002.pmap", "hst_0001.pmap"))
+        self.assert_crds_not_exists("o1a0000al_dead.fits")
+        self.watch()
+        self.assert_crds_exists("o1a0000al_dead.fits")
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "pickles", "hst", "hst_0002.pmap.pkl")))
+
+    def test_sync_watch_purge_rejected(self):
+        with self.assertRaises(SystemExit):
+            SyncScript("crds.sync --watch --watch-polls 1 --purge-references")
+
+    def test_sync_watch_failed_warm(self):
+        self.watch()
+        self.server.info["edit_context"] = "hst_0003.pmap"
+        self.watch(None)
+        self.assertEqual(self.cached_contexts(), ("hst_0001.pmap", "hst_0001.pmap"))
+        self.assert_crds_exists("hst_0003.pmap")
+        self.assert_crds_not_exists("o1a0000bl_dead.fits")
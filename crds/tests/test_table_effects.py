@@ -96,6 +96,34 @@ def dt_table_effects_reprocess_no():
     >>> test_config.cleanup(old_state)
     """
 
+def dt_table_effects_mode_index():
+    """
+    Test: indexed mode selection matches the row-by-row mode_select() and comparisons are memoized.
+
+    >>> old_state = test_config.setup()
+    >>> from crds.bestrefs import table_effects
+    >>> from crds.io import tables
+    >>> table_effects.clear_cache()
+
+    >>> deep_look = table_effects.DeepLook_COSOpt_elem()
+    >>> table = tables.tables("data/x2i1559gl_wcp.fits")[0]
+    >>> index = table_effects.get_mode_index("data/x2i1559gl_wcp.fits")
+    >>> for opt_elem in ["G130M", "G160M", "G140L", "ANY", "NONE"]:
+    ...     constraints = {"opt_elem" : (opt_elem,) + deep_look.cmp_equal_parameters}
+    ...     expected = sorted(repr(row) for row in table_effects.mode_select(table, constraints))
+    ...     assert index.select(constraints) == expected, opt_elem
+
+    >>> for i in range(3):
+    ...     deep_look.are_different({"OPT_ELEM" : "G130M"}, "data/x2i1559gl_wcp.fits", "data/xaf1429el_wcp.fits")
+    >>> deep_look.is_different, deep_look.message
+    (False, 'Selection rules have executed and the selected rows are the same.')
+    >>> len(table_effects.compare_mode_rows.cache)
+    1
+
+    >>> table_effects.clear_cache()
+    >>> test_config.cleanup(old_state)
+    """
+
 def main():
     """Run module tests,  for now just doctests only."""
     from crds.tests import test_table_effects, tstmod